@@ -0,0 +1,310 @@
+"""
+Benchmarks for the scraper, run against the synthetic pages of the fixtures module.
+Scrapes any number of customers of each carrier, end to end and without the network, and times each stage.
+With --json, every result is printed as one JSON object, so that runs can be compared to catch regressions.
+"""
+
+import argparse
+import dataclasses
+import gc
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Callable, List, Mapping, Optional, Type
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows. The peak memory of the process is then not reported.
+    resource = None
+
+import fixtures
+from carrier import Carrier, Policy
+from customtypes import PolicyFields, Status
+from fetchdata import FetchData
+from indexes import Indexes
+from mock import Mock, MockPolicy
+from parsers import PARSERS, get_parser
+from placeholder import Placeholder, PlaceholderPolicy
+from serialize import COMPACT, COMPATIBLE
+from store import PolicyStore
+
+
+def best_time(function: Callable, repeat: int) -> float:
+    """
+    The fastest of several runs of a function, in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_parsers(policies: int = 50, repeat: int = 20) -> Mapping[str, Mapping[str, float]]:
+    """
+    Compare the parsers on a Mock Indemnity page and a Placeholder Insurance page.
+    :param policies: How many policies are on each page.
+    :param repeat: How many times each page is parsed. The best run is kept.
+    :return: The best parsing time in seconds, by page and by parser.
+    """
+    pages = {
+        'mock': fixtures.mock_page(policies=policies),
+        'placeholder': fixtures.placeholder_page(policies=policies),
+    }
+    return {page: {name: best_time(lambda: parser(source), repeat) for name, parser in PARSERS.items()}
+            for page, source in pages.items()}
+
+
+def policy_texts(policy_type: Type[Policy], index: int) -> Mapping[PolicyFields, str]:
+    """
+    The texts a scrape reads for one policy, like those of the fixtures pages.
+    """
+    texts = {
+        PolicyFields.Id: f'f02dkl4e-P{index:06d}',
+        PolicyFields.Premium: f'{100 + index % 900}.{index % 100:02d}',
+        PolicyFields.Status: fixtures.STATUSES[index % len(fixtures.STATUSES)],
+        PolicyFields.EffectiveDate: fixtures.us_date(index, 2020),
+        PolicyFields.TerminationDate: fixtures.us_date(index, 2023),
+        PolicyFields.LastPaymentDate: fixtures.us_date(index * 7, 2022),
+        PolicyFields.CommissionRate: f'{index % 20}%',
+        PolicyFields.NumberOfInsured: str(index % 9 + 1),
+    }
+    return {field: texts[field] for field in policy_type.used_fields}
+
+
+def unslotted(policy_type: Type[Policy]) -> type:
+    """
+    A copy of a policy type whose instances each keep their fields in a __dict__, as they did before the policy
+    types were slotted, to compare against.
+    """
+    return dataclasses.make_dataclass(f'Unslotted{policy_type.__name__}',
+                                      [(field.name, field.type) for field in dataclasses.fields(policy_type)])
+
+
+def bench_memory(policies: int = 1_000_000) -> Mapping[str, Mapping[str, float]]:
+    """
+    Measure the memory that scraped policies hold, converted from their texts the way a scrape converts them,
+    with slots and with a __dict__ per policy.
+    :param policies: How many policies of each type are kept at once.
+    :return: The bytes per policy, by policy type, with "slots" and with "dict".
+    """
+    results = {}
+    for policy_type in (MockPolicy, PlaceholderPolicy):
+        texts = [policy_texts(policy_type, index) for index in range(policies)]
+        results[policy_type.__name__] = {
+            'slots': policy_memory(policy_type, policy_type, texts),
+            'dict': policy_memory(policy_type, unslotted(policy_type), texts),
+        }
+        del texts
+    return results
+
+
+def policy_memory(policy_type: Type[Policy], cls: type, texts: List[Mapping[PolicyFields, str]]) -> float:
+    """
+    The bytes held by each of a list of policies built by a class, from their texts.
+    :param policy_type: The policy type whose converters read the texts.
+    :param cls: The class of the policies built.
+    :param texts: The texts of each policy.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [cls(*(policy_type.data_types[field](text) for field, text in policy.items())) for policy in texts]
+    # The list that holds them is not part of the policies.
+    used = tracemalloc.get_traced_memory()[0] - before - kept.__sizeof__()
+    tracemalloc.stop()
+    return used / len(texts)
+
+
+def bench_store(policies: int = 1_000_000, customers: int = 1000, repeat: int = 5) -> Mapping[str, Mapping[str, float]]:
+    """
+    Compare portfolio questions asked of the policy store, and asked of the policy objects in a loop.
+    :param policies: How many policies there are in all.
+    :param customers: How many customers they are spread over.
+    :param repeat: How many times each question is asked. The best run is kept.
+    :return: The best time in seconds of each question, by way of answering it.
+    """
+    kept = [PlaceholderPolicy(*(PlaceholderPolicy.data_types[field](text)
+                                for field, text in policy_texts(PlaceholderPolicy, index).items()))
+            for index in range(policies)]
+    store = PolicyStore()
+    per_customer = max(policies // customers, 1)
+    for start in range(0, policies, per_customer):
+        store.replace('PLACEHOLDER_CARRIER', f'customer-{start}', kept[start:start + per_customer])
+    start, end = date(2023, 1, 1), date(2023, 1, 1) + timedelta(days=30)
+
+    def premium_by_status():
+        totals = defaultdict(Decimal)
+        for policy in kept:
+            totals[policy.status] += policy.premium
+        return totals
+
+    def terminating():
+        return sum(1 for policy in kept if start <= policy.termination_date <= end)
+
+    def active_premium():
+        return sum(policy.premium for policy in kept if policy.status is Status.active)
+
+    questions = {
+        'premium by status': (premium_by_status, lambda: store.group_by('status')),
+        'terminating in 30 days': (terminating, lambda: store.count(termination_date=(start, end))),
+        'active premium': (active_premium, lambda: store.total('premium', status=Status.active)),
+    }
+    return {question: {'objects': best_time(objects, repeat), 'store': best_time(columns, repeat)}
+            for question, (objects, columns) in questions.items()}
+
+
+def peak_rss() -> Optional[int]:
+    """
+    The most memory the process has held so far, in bytes, or None where it cannot be told.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux counts kilobytes, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def latencies(seconds: List[float]) -> Mapping[str, float]:
+    """
+    The mean, median, 95th percentile and worst of a set of times, in seconds.
+    """
+    ordered = sorted(seconds)
+    return {
+        'mean': statistics.fmean(ordered),
+        'median': statistics.median(ordered),
+        'p95': ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))],
+        'max': ordered[-1],
+    }
+
+
+def bench_scrape(customers: int = 20, policies: int = 50, pages: int = 3,
+                 repeat: int = 5) -> Mapping[str, Mapping[str, object]]:
+    """
+    Scrape synthetic customers of each carrier from an offline transport, end to end, and time each stage.
+    Nothing is cached or remembered between scrapes, so each one downloads, parses, converts and stores every
+    page, and nothing is measured but what the benchmark times.
+    :param customers: How many customers of each carrier are scraped.
+    :param policies: How many policies are on each page.
+    :param pages: How many pages each Placeholder Insurance customer has. Mock Indemnity has one page.
+    :param repeat: How many times each single stage is timed. The best run is kept.
+    :return: The measures of each carrier, by system name.
+    """
+    saved = (FetchData.transport, FetchData.cache, FetchData.store, FetchData.indexes, FetchData.snapshots,
+             FetchData.pages, FetchData.metrics)
+    FetchData.transport = fixtures.transport(policies, pages)
+    FetchData.cache, FetchData.snapshots, FetchData.pages, FetchData.metrics = None, None, None, None
+    FetchData.store, FetchData.indexes = PolicyStore(), Indexes()
+    results = {}
+    try:
+        for carrier in (Mock, Placeholder):
+            results[carrier.system_name] = scrape_carrier(carrier, customers, repeat)
+    finally:
+        (FetchData.transport, FetchData.cache, FetchData.store, FetchData.indexes, FetchData.snapshots,
+         FetchData.pages, FetchData.metrics) = saved
+    return results
+
+
+def scrape_carrier(carrier: Type[Carrier], customers: int, repeat: int) -> Mapping[str, object]:
+    """
+    The measures of bench_scrape for one carrier.
+    """
+    fetcher = FetchData(carrier)
+    seconds = []
+    scraped = 0
+    for index in range(customers):
+        customer_id = f'bench{index:05d}'
+        start = time.perf_counter()
+        session = fetcher.fetch_my_carrier(customer_id)
+        seconds.append(time.perf_counter() - start)
+        scraped += len(session.policies)
+
+    # A single page of the carrier, for the stages that do not depend on the network. The policies are read
+    # from a fresh tree each time, since reading them can move their elements, and the parsing time is taken off.
+    source = FetchData.transport.fetch(carrier.URI).decode(FetchData.encoding())
+    parse = get_parser(carrier.parser)
+    parse_seconds = best_time(lambda: parse(source), repeat)
+    on_page = len(carrier.page_rows(parse(source)))
+    one_by_one = best_time(lambda: [carrier.fetch_policy(element)
+                                    for element in carrier.policy_elements(parse(source))], repeat)
+    by_page = best_time(lambda: carrier.fetch_page(parse(source)), repeat)
+    data = {carrier.system_name: fetcher.customers}
+    return {
+        'customers': customers,
+        'policies': scraped,
+        'latency': latencies(seconds),
+        'policies_per_second': scraped / sum(seconds),
+        'parse_seconds': parse_seconds,
+        'fetch_policy_per_second': on_page / max(one_by_one - parse_seconds, 1e-9),
+        'fetch_page_per_second': on_page / max(by_page - parse_seconds, 1e-9),
+        'serialize_seconds': {
+            'compact': best_time(lambda: COMPACT.encode(data), repeat),
+            'compatible': best_time(lambda: COMPATIBLE.encode(data), repeat),
+        },
+        'serialized_bytes': len(COMPACT.encode(data).encode('utf-8')),
+    }
+
+
+def run():
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument('--policies', type=int, default=50, help='Policies on each page.')
+    arguments.add_argument('--customers', type=int, default=20, help='Customers of each carrier to scrape.')
+    arguments.add_argument('--pages', type=int, default=3, help='Pages of each Placeholder Insurance customer.')
+    arguments.add_argument('--repeat', type=int, default=20, help='Runs of each measure. The best is kept.')
+    arguments.add_argument('--memory', type=int, default=0, metavar='POLICIES',
+                           help='Also measure the memory of this many policies of each type.')
+    arguments.add_argument('--store', type=int, default=0, metavar='POLICIES',
+                           help='Also compare portfolio questions over this many policies.')
+    arguments.add_argument('--json', action='store_true',
+                           help='Print every result as a single JSON object, to be compared across runs.')
+    options = arguments.parse_args()
+
+    results = {
+        'parameters': {name: getattr(options, name)
+                       for name in ('customers', 'policies', 'pages', 'repeat', 'memory', 'store')},
+        'scrape': bench_scrape(options.customers, options.policies, options.pages, options.repeat),
+        'parsers': bench_parsers(options.policies, options.repeat),
+    }
+    if options.memory:
+        results['memory'] = bench_memory(options.memory)
+    if options.store:
+        results['store'] = bench_store(options.store)
+    results['peak_rss_bytes'] = peak_rss()
+    if options.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for system_name, measures in results['scrape'].items():
+        latency = measures['latency']
+        print(f'{system_name:<20} {measures["customers"]} customers, {measures["policies"]} policies')
+        print(f'{"":<4}fetch_my_carrier  mean {latency["mean"] * 1000:.3f} ms  median {latency["median"] * 1000:.3f}'
+              f' ms  p95 {latency["p95"] * 1000:.3f} ms  max {latency["max"] * 1000:.3f} ms')
+        print(f'{"":<4}end to end        {measures["policies_per_second"]:12,.0f} policies/s')
+        print(f'{"":<4}fetch_policy      {measures["fetch_policy_per_second"]:12,.0f} policies/s')
+        print(f'{"":<4}fetch_page        {measures["fetch_page_per_second"]:12,.0f} policies/s')
+        print(f'{"":<4}parse             {measures["parse_seconds"] * 1000:12.3f} ms per page')
+        for name, seconds in measures['serialize_seconds'].items():
+            print(f'{"":<4}serialize {name:<10}{seconds * 1000:9.3f} ms')
+    for page, timings in results['parsers'].items():
+        soup = timings['soup']
+        for name, seconds in timings.items():
+            print(f'{page:<12} {name:<7} {seconds * 1000:9.3f} ms  {soup / seconds:6.1f}x')
+    for name, sizes in results.get('memory', {}).items():
+        print(f'{name:<20} {sizes["slots"]:9.1f} bytes per policy with slots, {sizes["dict"]:9.1f} with a dict')
+    for question, timings in results.get('store', {}).items():
+        objects = timings['objects']
+        for name, seconds in timings.items():
+            print(f'{question:<24} {name:<8} {seconds * 1000:9.3f} ms  {objects / seconds:7.1f}x')
+    if results['peak_rss_bytes'] is not None:
+        print(f'peak RSS {results["peak_rss_bytes"] / 2 ** 20:.1f} MB')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,208 @@
+"""
+A cache of downloaded carrier pages, in memory and on disk.
+Pages are served from it while they are fresh, and revalidated with the carrier once they are stale, so an
+unchanged page costs a 304 at most instead of a full download.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from typing import Optional, Mapping
+
+# A cached page. "stored" is when it was last downloaded or revalidated, as a Unix time.
+CacheEntry = namedtuple('CacheEntry', ['uri', 'body', 'etag', 'last_modified', 'stored', 'ttl'])
+
+
+class PageCache:
+    """
+    A least-recently-used cache of pages in memory, backed by an optional store on disk.
+    Both are bounded by the total size of the pages they hold.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_memory_bytes: int = 64 * 1024 * 1024,
+                 max_disk_bytes: int = 1024 * 1024 * 1024):
+        """
+        :param directory: Where the pages are stored on disk. None keeps them in memory only.
+        :param max_memory_bytes: The most page bytes kept in memory.
+        :param max_disk_bytes: The most page bytes kept on disk.
+        """
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self.memory_bytes = 0
+        # The size of each file on disk, least recently used first.
+        self.disk: 'OrderedDict[str, int]' = OrderedDict()
+        self.disk_bytes = 0
+        self.lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            files = [entry for entry in os.scandir(directory) if entry.name.endswith('.page')]
+            for entry in sorted(files, key=lambda file: file.stat().st_mtime):
+                self.disk[entry.name] = entry.stat().st_size
+                self.disk_bytes += entry.stat().st_size
+
+    @staticmethod
+    def fresh(entry: CacheEntry) -> bool:
+        """
+        Whether a page can still be used without asking the carrier.
+        """
+        return time.time() - entry.stored < entry.ttl
+
+    @staticmethod
+    def validators(entry: Optional[CacheEntry]) -> Mapping[str, str]:
+        """
+        The headers that ask the carrier to send a page only if it has changed since it was cached.
+        """
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    @staticmethod
+    def file_name(uri: str) -> str:
+        """
+        The name of the file a page is stored in.
+        """
+        return hashlib.sha256(uri.encode('utf-8')).hexdigest() + '.page'
+
+    def get(self, uri: str) -> Optional[CacheEntry]:
+        """
+        Find a page, fresh or not.
+        :param uri: The address of the page.
+        :return: The cached page, or None if it is not cached.
+        """
+        with self.lock:
+            entry = self.memory.get(uri)
+            if entry is not None:
+                self.memory.move_to_end(uri)
+                return entry
+        entry = self.read(uri)
+        if entry is not None:
+            with self.lock:
+                self.remember(entry)
+        return entry
+
+    def put(self, uri: str, body: bytes, headers: Mapping[str, str], ttl: float) -> CacheEntry:
+        """
+        Cache a page that has just been downloaded.
+        :param uri: The address of the page.
+        :param body: The content of the page.
+        :param headers: The response headers, with lowercase names.
+        :param ttl: How long the page stays fresh, in seconds.
+        :return: The cached page.
+        """
+        entry = CacheEntry(uri, body, headers.get('etag'), headers.get('last-modified'), time.time(), ttl)
+        self.store(entry)
+        return entry
+
+    def revalidated(self, entry: CacheEntry, headers: Mapping[str, str], ttl: float) -> CacheEntry:
+        """
+        Record that the carrier confirmed a page has not changed.
+        :param entry: The cached page.
+        :param headers: The headers of the 304 response, which may update the validators.
+        :param ttl: How long the page stays fresh from now, in seconds.
+        :return: The cached page, fresh again.
+        """
+        entry = entry._replace(etag=headers.get('etag', entry.etag),
+                               last_modified=headers.get('last-modified', entry.last_modified),
+                               stored=time.time(), ttl=ttl)
+        self.store(entry)
+        return entry
+
+    def store(self, entry: CacheEntry):
+        """
+        Keep a page in memory and on disk.
+        """
+        with self.lock:
+            self.remember(entry)
+        self.write(entry)
+
+    def remember(self, entry: CacheEntry):
+        """
+        Keep a page in memory, and evict the least recently used ones beyond the size limit.
+        Must be called with the lock held.
+        """
+        previous = self.memory.pop(entry.uri, None)
+        if previous is not None:
+            self.memory_bytes -= len(previous.body)
+        if len(entry.body) > self.max_memory_bytes:
+            return
+        self.memory[entry.uri] = entry
+        self.memory_bytes += len(entry.body)
+        while self.memory_bytes > self.max_memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted.body)
+
+    def read(self, uri: str) -> Optional[CacheEntry]:
+        """
+        Load a page from disk.
+        """
+        if self.directory is None:
+            return None
+        name = self.file_name(uri)
+        try:
+            with open(os.path.join(self.directory, name), 'rb') as file:
+                metadata = json.loads(file.readline())
+                body = file.read()
+        except (OSError, ValueError):
+            return None
+        with self.lock:
+            if name in self.disk:
+                self.disk.move_to_end(name)
+        return CacheEntry(uri, body, metadata['etag'], metadata['last_modified'], metadata['stored'],
+                          metadata['ttl'])
+
+    def write(self, entry: CacheEntry):
+        """
+        Save a page to disk, and evict the least recently used ones beyond the size limit.
+        """
+        if self.directory is None:
+            return
+        name = self.file_name(entry.uri)
+        metadata = json.dumps({'uri': entry.uri, 'etag': entry.etag, 'last_modified': entry.last_modified,
+                               'stored': entry.stored, 'ttl': entry.ttl})
+        # Written aside then moved in place, so a reader never sees half a page.
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(metadata.encode('utf-8') + b'\n')
+            file.write(entry.body)
+            size = file.tell()
+        os.replace(temporary, os.path.join(self.directory, name))
+
+        evicted = []
+        with self.lock:
+            self.disk_bytes += size - self.disk.pop(name, 0)
+            self.disk[name] = size
+            while self.disk_bytes > self.max_disk_bytes and len(self.disk) > 1:
+                old_name, old_size = self.disk.popitem(last=False)
+                self.disk_bytes -= old_size
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.directory, old_name))
+            except OSError:
+                pass
+
+    def clear(self):
+        """
+        Forget every page, in memory and on disk.
+        """
+        with self.lock:
+            names = list(self.disk)
+            self.memory.clear()
+            self.memory_bytes = 0
+            self.disk.clear()
+            self.disk_bytes = 0
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
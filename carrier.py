@@ -1,19 +1,37 @@
+import dataclasses
+import logging
+import re
+import time
 from abc import ABC
-from typing import Mapping, ClassVar, List, Callable, Optional, Type, Generator
+from collections import defaultdict
+from typing import Mapping, ClassVar, List, Callable, Optional, Type, Generator, Union, Dict, Tuple, Iterable
 from datetime import date
 from decimal import Decimal
 
+import lxml.etree
 import lxml.html
 
-from customtypes import PolicyFields, Customer, Agent, IndexedXpath
+import conversions
+from changes import content_hash
+from customtypes import PolicyFields, Customer, Agent, IndexedXpath, RowLayout
+from metrics import Metrics
+from ratelimit import HostLimits
+from xpaths import compile_xpath, compile_map
+
+logger = logging.getLogger(__name__)
 
 
 class Policy(ABC):
     """
     A policy is a datatype that is present within a carrier page.
     Each policy type should inherit this class.
+    Policies are kept by the million, so each type should be a slotted dataclass, without a __dict__.
+    It should be frozen too: the same policy object is shared by the page memo, every version of its customer
+    that has it unchanged, and the indexes, so a change made through one of them would go stale in the others.
     """
 
+    __slots__ = ()
+
     # Where each part of one policy can be found from a given XPath node.
     policy_xpath: ClassVar[Mapping[PolicyFields, IndexedXpath]] = {}
 
@@ -26,6 +44,17 @@ class Policy(ABC):
     # This should probably be renamed.
     data_types: ClassVar[Mapping[PolicyFields, Callable]] = {}
 
+    # If set, the fields it covers are read in a single pass over the policy's elements
+    # instead of one XPath evaluation each. See Carrier.row_texts.
+    row_layout: ClassVar[Optional[RowLayout]] = None
+
+    # The same as policy_xpath, compiled once when the class is defined.
+    compiled_xpath: ClassVar[Mapping[PolicyFields, IndexedXpath]] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.compiled_xpath = compile_map(cls.policy_xpath, cls.__name__)
+
     _serialize = ['id', 'premium', 'status', 'effective_date', 'effective_date',
                   'termination_date', 'last_payment_date', 'commission_rate', 'number_of_insured']
 
@@ -34,11 +63,8 @@ class Policy(ABC):
         Serialize to a dictionary.
         This method should not need to be overridden.
         """
-        policy_copy = self.__dict__.copy()
-
-        for key in policy_copy.copy().keys():
-            if key not in self._serialize:
-                del policy_copy[key]
+        policy_copy = {field.name: getattr(self, field.name) for field in dataclasses.fields(self)
+                       if field.name in self._serialize}
 
         policy_copy['status'] = policy_copy['status'].name
 
@@ -66,17 +92,93 @@ class Carrier(ABC):
     # The XPath address of each policy item.
     POLICIES: str
 
-    # The web location of this carrier.
+    # The web location of a customer of this carrier, with a "{customer_id}" placeholder.
+    URI_TEMPLATE: str
+
+    # The customer scraped when none is given.
+    DEFAULT_CUSTOMER: str
+
+    # The web location of the default customer of this carrier.
     URI: str
 
     # The policy type this carrier will return.
     policy_type: any
 
-    # The root of the page of XPath searches.
-    tree: Optional[lxml.html.HtmlElement] = None
+    # How the pages of this carrier are parsed. See parsers.PARSERS.
+    # "auto" uses lxml's native parser and only falls back on BeautifulSoup for malformed pages.
+    parser: str = 'auto'
+
+    # How long a downloaded page of this carrier may be reused without asking the carrier again, in seconds.
+    # Once it is older, it is revalidated, and only downloaded again if it has changed.
+    cache_ttl: float = 60
+
+    # How often the background scheduler scrapes each customer of this carrier again, in seconds.
+    refresh_interval: float = 15 * 60
+
+    # How hard the host of this carrier may be hit: how fast requests start, and how many may be in flight.
+    # Carriers that share a host get the strictest of their limits. See ratelimit.HostLimits.
+    host_limits: ClassVar[HostLimits] = HostLimits()
 
     DateSeparators = frozenset(['-', '/'])
 
+    # The memoized parser of this carrier's dates, built once for its DateSeparators.
+    parse_date: ClassVar[Callable[[str], date]] = staticmethod(conversions.date_parser(DateSeparators))
+
+    # Every carrier, by system name, so that it can be named in another process. See named.
+    registry: ClassVar[Dict[str, Type['Carrier']]] = {}
+
+    # The converters of each field of a policy type, for each carrier. See converters.
+    converter_cache: ClassVar[Dict[Tuple[type, type], List[Callable]]] = {}
+
+    # The same as POLICIES, agent_xpath and customer_xpath, compiled once when the class is defined.
+    compiled_policies: ClassVar[Optional[lxml.etree.XPath]] = None
+    compiled_agent_xpath: ClassVar[Mapping[Agent.Fields, IndexedXpath]] = {}
+    compiled_customer_xpath: ClassVar[Mapping[Customer.Fields, IndexedXpath]] = {}
+
+    # For streaming: the tag of the policy elements, and the XPath that tells whether an element of
+    # that tag is a policy. Both are derived from POLICIES when it is a single "//tag[predicate]" step.
+    stream_tag: ClassVar[Optional[str]] = None
+    compiled_stream: ClassVar[Optional[lxml.etree.XPath]] = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if hasattr(cls, 'POLICIES'):
+            cls.compiled_policies = compile_xpath(cls.POLICIES, f'{cls.__name__}.POLICIES')
+            step = re.fullmatch(r'//(\w+)((?:\[[^\[\]]*\])*)', cls.POLICIES)
+            if step is not None:
+                cls.stream_tag = step[1]
+                cls.compiled_stream = compile_xpath(f'self::{step[1]}{step[2]}', f'{cls.__name__}.POLICIES')
+        cls.compiled_agent_xpath = compile_map(cls.agent_xpath, f'{cls.__name__}.agent_xpath')
+        cls.compiled_customer_xpath = compile_map(cls.customer_xpath, f'{cls.__name__}.customer_xpath')
+        cls.parse_date = staticmethod(conversions.date_parser(cls.DateSeparators))
+        # Only the carriers themselves, not the classes they are built on, like specs.SpecCarrier.
+        if 'system_name' in vars(cls):
+            Carrier.registry[cls.system_name] = cls
+
+    @staticmethod
+    def named(system_name: str) -> Type['Carrier']:
+        """
+        Find a carrier by its system name, among those whose module has been imported or whose spec has been loaded.
+        See specs.named to load it if it is not.
+        :param system_name: The name used for the carrier in the requests, like "MOCK_INDEMNITY".
+        :return: The carrier class.
+        """
+        try:
+            return Carrier.registry[system_name]
+        except KeyError:
+            raise ValueError(f'Unknown carrier: "{system_name}".')
+
+    @classmethod
+    def uri(cls, customer_id: Optional[str] = None) -> str:
+        """
+        The web location of a customer of this carrier.
+        :param customer_id: The customer, or None for the default one.
+        :return: The URI of the customer's first page.
+        """
+        if customer_id is None:
+            return cls.URI
+        return cls.URI_TEMPLATE.format(customer_id=customer_id)
+
     @classmethod
     def us_date(cls, date_in: str) -> date:
         """
@@ -84,15 +186,7 @@ class Carrier(ABC):
         :param date_in: A text date in dd/mm/yyyy format.
         :return: A Python date of the same value as the text input.
         """
-        # Handle one-digit month AND day:
-        if date_in.startswith(':'):
-            date_in = date_in[1:]
-
-        for separator in cls.DateSeparators:
-            if separator in date_in:
-                parts = [int(num) for num in date_in.split(separator)]
-                return date(parts[2], parts[0], parts[1])
-        raise ValueError(f'Date format cannot be handled for input: "{date_in}".')
+        return cls.parse_date(date_in)
 
     @staticmethod
     def to_decimal(number: str) -> Decimal:
@@ -103,34 +197,242 @@ class Carrier(ABC):
         :param number: The number as a string.
         :return: The number in pythvon Decimal type.
         """
-        if number.endswith('%'):
-            number = number[:-1]
-        number = number.split(' ')[1]
-        return Decimal(number)
+        return conversions.to_decimal(number)
 
     @classmethod
-    def fetch_policies(cls, tree: lxml.html.HtmlElement, xpath: str) -> Generator[lxml.html.HtmlElement, None, None]:
+    def fetch_policies(cls, tree: lxml.html.HtmlElement, xpath: Union[str, lxml.etree.XPath],
+                       session=None) -> Generator[lxml.html.HtmlElement, None, None]:
         """
         Generator for all the policies of this carrier.
+        Carriers override this to build their policy objects. They receive the scrape session, if there is one,
+        so they can record the pages they turn.
         """
-        for policy in tree.xpath(xpath):
+        if isinstance(xpath, str):
+            xpath = compile_xpath(xpath, cls.__name__)
+        for policy in xpath(tree):
             yield policy
 
+    @classmethod
+    def converter(cls, data_type: Callable[[str], object]) -> Callable[[str], object]:
+        """
+        The fastest way for this carrier to run one of the data_types of a policy: the dates are read with
+        the carrier's own parser.
+        """
+        if data_type == Carrier.us_date:
+            return cls.parse_date
+        return data_type
+
+    @classmethod
+    def converters(cls, policy_type) -> List[Callable[[str], object]]:
+        """
+        How this carrier converts each text of a policy, in the order of its used_fields. Worked out once.
+        """
+        key = (cls, policy_type)
+        converters = cls.converter_cache.get(key)
+        if converters is None:
+            converters = [cls.converter(policy_type.data_types[field]) for field in policy_type.used_fields]
+            cls.converter_cache[key] = converters
+        return converters
+
     @classmethod
     def fetch_policy(cls, policy: lxml.html.HtmlElement, policy_type) -> Optional[Type[Policy]]:
         """
         Fetch data for a single policy and build its object.
         """
-        attributes = []
+        texts = cls.policy_texts(policy, policy_type)
+        return policy_type(*[convert(text) for convert, text in zip(cls.converters(policy_type), texts)])
+
+    @classmethod
+    def policy_elements(cls, tree: lxml.html.HtmlElement) -> Iterable[lxml.html.HtmlElement]:
+        """
+        The node of each policy on a page, as fetch_policy takes it.
+        """
+        return cls.compiled_policies(tree)
+
+    @classmethod
+    def page_rows(cls, tree: lxml.html.HtmlElement, metrics: Optional[Metrics] = None) -> List[List]:
+        """
+        The values of each policy on a page, in the order of the policy type's fields.
+        :param tree: The page.
+        :param metrics: Where to record the time spent reading each field and converting, if anywhere.
+        """
+        return cls.element_rows(cls.policy_elements(tree), metrics)
+
+    @classmethod
+    def element_rows(cls, elements: Iterable[lxml.html.HtmlElement], metrics: Optional[Metrics] = None) -> List[List]:
+        """
+        The values of each of the given policy nodes, in the order of the policy type's fields.
+        All the texts are read first, then converted a column at a time, so each distinct text of a field
+        is only converted once.
+        :param elements: The nodes of the policies, as policy_elements gives them.
+        :param metrics: Where to record the time spent reading each field and converting, if anywhere.
+        """
+        if metrics is None:
+            rows = [cls.policy_texts(policy, cls.policy_type) for policy in elements]
+            return conversions.convert_rows(cls.converters(cls.policy_type), rows)
+
+        times = defaultdict(float)
+        rows = [cls.timed_texts(policy, cls.policy_type, times) for policy in elements]
+        for field, seconds in times.items():
+            metrics.observe('xpath_seconds', seconds, carrier=cls.system_name, field=field)
+        with metrics.timer('conversion_seconds', carrier=cls.system_name):
+            converted = conversions.convert_rows(cls.converters(cls.policy_type), rows)
+        metrics.count('policies_total', len(converted), carrier=cls.system_name)
+        return converted
+
+    @classmethod
+    def timed_texts(cls, policy: lxml.html.HtmlElement, policy_type, times: Dict[str, float]) -> List[str]:
+        """
+        The same as policy_texts, adding the time spent reading each field to "times", by field name.
+        The fields of a row layout are read in a single walk, which is timed as a whole, as "row_layout".
+        """
+        if policy_type.row_layout is not None:
+            start = time.perf_counter()
+            texts = cls.row_texts(policy, policy_type)
+            times['row_layout'] += time.perf_counter() - start
+            return texts
+        texts = []
+        for field in policy_type.used_fields:
+            start = time.perf_counter()
+            xpath = policy_type.compiled_xpath[field]
+            data = xpath.xpath(policy)
+            if not isinstance(data, str):
+                data = data[xpath.place]
+            texts.append(data)
+            times[field.name] += time.perf_counter() - start
+        return texts
+
+    @classmethod
+    def fetch_page(cls, tree: lxml.html.HtmlElement, metrics: Optional[Metrics] = None) -> List[Policy]:
+        """
+        Fetch data for every policy on a page and build their objects.
+        :param metrics: Where to record the time spent, if anywhere. See page_rows.
+        """
+        return [cls.policy_type(*values) for values in cls.page_rows(tree, metrics)]
+
+    @classmethod
+    def fetch_changed_page(cls, tree: lxml.html.HtmlElement, known: Mapping[bytes, Policy],
+                           metrics: Optional[Metrics] = None) -> Tuple[List[Policy], Dict[bytes, Policy]]:
+        """
+        Like fetch_page, but a policy whose HTML has not changed since it was last read is not read again.
+        :param tree: The page.
+        :param known: The policies read before, by the hash of their HTML.
+        :param metrics: Where to record the time spent, if anywhere. See page_rows.
+        :return: Every policy on the page, and the same by the hash of their HTML.
+        """
+        elements = list(cls.policy_elements(tree))
+        hashes = [content_hash(lxml.etree.tostring(element, with_tail=False)) for element in elements]
+        fresh = [element for element, row_hash in zip(elements, hashes) if row_hash not in known]
+        built = iter([cls.policy_type(*values) for values in cls.element_rows(fresh, metrics)])
+        policies = [known[row_hash] if row_hash in known else next(built) for row_hash in hashes]
+        if metrics is not None:
+            metrics.count('unchanged_policies_total', len(elements) - len(fresh), carrier=cls.system_name)
+        return policies, dict(zip(hashes, policies))
+
+    @classmethod
+    def unique_values(cls, item_type, data_point: str, tree: lxml.html.HtmlElement) -> List:
+        """
+        The values of an item that is unique within an entry, as opposed to iterated items.
+        :param item_type: The type of the item, Agent or Customer.
+        :param data_point: The type of top-level data to get, "agent" or "customer".
+        :param tree: The page to get it from.
+        :return: The values to build the item with, in order.
+        """
+        values = []
+        compiled_xpath = getattr(cls, f'compiled_{data_point}_xpath')
+        for field in item_type.Fields:
+            try:
+                indexed_xpath = compiled_xpath[field]
+            except KeyError:
+                logger.debug('%s has no XPath for %s.', cls.__name__, field)
+                continue
+            node = indexed_xpath.xpath(tree)
+            text = None
+            if isinstance(node, list):
+                text = node[indexed_xpath.place]
+            elif isinstance(node, str):
+                text = node
+            if text:
+                values.append(item_type.types[field](text))
+        return values
+
+    @classmethod
+    def policy_texts(cls, policy: lxml.html.HtmlElement, policy_type) -> List[str]:
+        """
+        Read the texts of a single policy, in the order of its used_fields, before they are converted.
+        """
+        if policy_type.row_layout is not None:
+            return cls.row_texts(policy, policy_type)
+        texts = []
         for field in policy_type.used_fields:
-            xpath = policy_type.policy_xpath[field]
-            data = policy.xpath(xpath.xpath)
+            xpath = policy_type.compiled_xpath[field]
+            data = xpath.xpath(policy)
             if not isinstance(data, str):
                 data = data[xpath.place]
-            data = policy_type.data_types[field](data)
-            attributes.append(data)
-        result = policy_type(*attributes)
-        return result
+            texts.append(data)
+        return texts
+
+    @classmethod
+    def row_texts(cls, policy: lxml.html.HtmlElement, policy_type) -> List[str]:
+        """
+        Read the texts of a single policy laid out as table rows.
+        The cells and the detail lines are all collected in one walk of the policy's elements.
+        The fields that the row layout does not cover are read with their XPath.
+        """
+        layout: RowLayout = policy_type.row_layout
+        cells = []
+        lines = []
+        for element in policy.iter(layout.cell_tag, layout.line_tag):
+            text = element.text
+            if text is None:
+                continue
+            if element.tag == layout.cell_tag:
+                cells.append(text)
+            else:
+                lines.append(text.strip())
+
+        values = {}
+        for field, column in layout.columns.items():
+            values[field] = cells[column]
+        for line in lines:
+            for field, prefix in layout.line_prefixes.items():
+                if line.startswith(prefix):
+                    values[field] = line[len(prefix):].strip(' :')
+                    break
+
+        texts = []
+        for field in policy_type.used_fields:
+            try:
+                data = values[field]
+            except KeyError:
+                xpath = policy_type.compiled_xpath[field]
+                data = xpath.xpath(policy)
+                if not isinstance(data, str):
+                    data = data[xpath.place]
+            texts.append(data)
+        return texts
+
+    @classmethod
+    def stream_policy(cls, element: lxml.html.HtmlElement) -> Optional[lxml.html.HtmlElement]:
+        """
+        While a page is streamed, tell whether an element that has just been read completes a policy.
+        :param element: An element of the "stream_tag" tag, with all its content.
+        :return: The node to give to fetch_policy, or None if this is not a policy.
+        """
+        if cls.compiled_stream(element):
+            return element
+        return None
+
+    @classmethod
+    def change_page(cls, node: lxml.html.HtmlElement, uri: Optional[str] = None) -> Optional[str]:
+        """
+        Find the address of the next page of policies. Carriers whose policies span several pages override this.
+        :param node: The XML object of the current page.
+        :param uri: The address of the current page, which relative links are resolved against. By default, the
+                    address of the carrier's default customer.
+        :return: The full link to the next page, or None on the last page.
+        """
+        return None
 
     # The XPath coordinates to get the Agent information on this page.
     agent_xpath: Mapping[Agent.Fields, IndexedXpath] = {}
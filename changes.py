@@ -0,0 +1,159 @@
+"""
+Change detection for the customers that are scraped again.
+Each page is hashed as it is downloaded. A page whose hash has not changed since it was last read is not parsed
+again: what was read from it is reused. On a page that has changed, each policy is hashed too, and only the
+policies whose HTML changed are read. The new customer is then compared with the one it replaces, and only the
+difference, a Delta, is applied to the stores and indexes and sent to the subscribers.
+So a refresh costs time in proportion to what changed, not to the size of the portfolio.
+"""
+
+import dataclasses
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from dataclasses import dataclass, field
+from typing import Dict, Mapping, Optional, Tuple
+
+from customtypes import Customer
+
+# A page, or the first page of a customer, as the system name of its carrier and its URI.
+PageKey = Tuple[str, str]
+
+# What was read from a page: the hash of its content, the values of the customer and of the agent, only for
+# the first page of a customer, its policies, the link to the next page, and its policies by the hash of their
+# HTML, when they were hashed.
+PageRead = namedtuple('PageRead', ['content_hash', 'customer', 'agent', 'policies', 'next_page', 'rows'])
+
+# The fields of a customer that make it change, apart from its policies, which are compared one by one.
+CUSTOMER_FIELDS = [item.name for item in dataclasses.fields(Customer) if item.compare and item.name != 'policies']
+
+
+def content_hash(content: bytes) -> bytes:
+    """
+    A short hash of some content, to tell whether it has changed.
+    """
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+class PageMemo:
+    """
+    What was last read from each page, and the policies last read for each customer, by the hash of their HTML.
+    Both are bounded: the pages and the customers used least recently are forgotten first.
+    Every method is thread-safe.
+    """
+
+    def __init__(self, max_pages: int = 100_000, max_customers: int = 10_000):
+        """
+        :param max_pages: The most pages remembered.
+        :param max_customers: The most customers whose policies are remembered.
+        """
+        self.max_pages = max_pages
+        self.max_customers = max_customers
+        self.lock = threading.Lock()
+        self.pages: OrderedDict[PageKey, PageRead] = OrderedDict()
+        self.rows: OrderedDict[PageKey, Dict[bytes, object]] = OrderedDict()
+
+    def get(self, page: PageKey, page_hash: bytes) -> Optional[PageRead]:
+        """
+        What was read from a page, if its content has not changed since.
+        :param page: The carrier and the address of the page.
+        :param page_hash: The hash of its content now.
+        """
+        with self.lock:
+            read = self.pages.get(page)
+            if read is None or read.content_hash != page_hash:
+                return None
+            self.pages.move_to_end(page)
+            return read
+
+    def put(self, page: PageKey, read: PageRead):
+        """
+        Remember what was read from a page.
+        """
+        with self.lock:
+            self.pages[page] = read
+            self.pages.move_to_end(page)
+            while len(self.pages) > self.max_pages:
+                self.pages.popitem(last=False)
+
+    def known_rows(self, customer: PageKey) -> Mapping[bytes, object]:
+        """
+        The policies last read for a customer, by the hash of their HTML.
+        :param customer: The carrier and the address of the customer's first page.
+        """
+        with self.lock:
+            rows = self.rows.get(customer)
+            if rows is None:
+                return {}
+            self.rows.move_to_end(customer)
+            return rows
+
+    def remember_rows(self, customer: PageKey, rows: Dict[bytes, object]):
+        """
+        Replace the policies remembered for a customer with those of its latest scrape.
+        """
+        with self.lock:
+            self.rows[customer] = rows
+            self.rows.move_to_end(customer)
+            while len(self.rows) > self.max_customers:
+                self.rows.popitem(last=False)
+
+    def clear(self):
+        """
+        Forget everything, so that the next scrapes read every page.
+        """
+        with self.lock:
+            self.pages.clear()
+            self.rows.clear()
+
+
+@dataclass(frozen=True)
+class Delta:
+    """
+    How a customer changed between two scrapes.
+    It is empty when nothing changed, and then the previous customer is kept as it was, with its version.
+    """
+    carrier: str
+    customer: Customer
+    previous: Optional[Customer]
+    # Whether the customer itself, or its agent, changed. Always true for a new customer.
+    customer_changed: bool
+    added: Mapping[str, object] = field(default_factory=dict)
+    removed: Mapping[str, object] = field(default_factory=dict)
+    # The policies that changed, as (before, after), by ID.
+    modified: Mapping[str, Tuple[object, object]] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.customer_changed or self.added or self.removed or self.modified)
+
+    @property
+    def customer_id(self) -> str:
+        return self.customer.id
+
+
+def diff(system_name: str, previous: Optional[Customer], customer: Customer) -> Delta:
+    """
+    Compare a customer that has just been scraped with the one it replaces.
+    The policies that did not change are swapped for the objects the previous customer had, so that the stores
+    and indexes that hold them stay valid.
+    :param system_name: The system name of the customer's carrier.
+    :param previous: The customer as it was stored, or None if it is new.
+    :param customer: The customer as it was just scraped, linked to its agent and policies.
+    :return: What changed.
+    """
+    if previous is None:
+        return Delta(system_name, customer, None, True, added=dict(customer.policies))
+    customer_changed = any(getattr(previous, name) != getattr(customer, name) for name in CUSTOMER_FIELDS)
+    old, new = previous.policies or {}, customer.policies
+    added, modified = {}, {}
+    for policy_id, policy in new.items():
+        before = old.get(policy_id)
+        if before is None:
+            added[policy_id] = policy
+        elif before is not policy:
+            if before == policy:
+                new[policy_id] = before
+            else:
+                modified[policy_id] = (before, policy)
+    removed = {policy_id: policy for policy_id, policy in old.items() if policy_id not in new}
+    return Delta(system_name, customer, previous, customer_changed, added, removed, modified)
@@ -0,0 +1,88 @@
+"""
+Fast conversions of the texts read from the carrier pages into field values.
+The pages repeat the same dates and rates over and over, so the converters are memoized, within a bounded
+size, and a whole page of texts is converted one column at a time, each distinct text only once.
+The values are immutable, so the policies that share a text share its value, which also saves memory.
+"""
+
+import re
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+from typing import AbstractSet, Callable, Dict, Iterable, List, Sequence, TypeVar
+
+Value = TypeVar('Value')
+
+# How many distinct texts each memoized converter remembers.
+MEMO_SIZE = 4096
+
+
+def memoized(converter: Callable[[str], Value], size: int = MEMO_SIZE) -> Callable[[str], Value]:
+    """
+    A converter that remembers its last results. Only use it for converters without side effects whose
+    values are immutable.
+    """
+    return lru_cache(maxsize=size)(converter)
+
+
+@lru_cache(maxsize=None)
+def date_parser(separators: AbstractSet[str]) -> Callable[[str], date]:
+    """
+    A memoized parser of month-day-year dates, like "1/31/2022", with any of the given separators between the
+    numbers, the same one twice. It is built once for each set of separators.
+    A leading colon, left over from a label, and surrounding spaces are ignored.
+    """
+    pattern = re.compile(r':?\s*(\d+)\s*([{}])\s*(\d+)\s*\2\s*(\d+)\s*'.format(
+        ''.join(re.escape(separator) for separator in sorted(separators))))
+
+    def parse(text: str) -> date:
+        match = pattern.fullmatch(text)
+        if match is None:
+            raise ValueError(f'Date format cannot be handled for input: "{text}".')
+        month, _, day, year = match.groups()
+        return date(int(year), int(month), int(day))
+
+    return memoized(parse)
+
+
+def parse_decimal(number: str) -> Decimal:
+    """
+    A number as present in the HTML pages, possibly after a label and with a percent sign, as a Decimal.
+    """
+    if number.endswith('%'):
+        number = number[:-1]
+    return Decimal(number.split(' ')[-1])
+
+
+to_decimal = memoized(parse_decimal)
+
+
+def convert_column(converter: Callable[[str], Value], texts: Iterable[str]) -> List[Value]:
+    """
+    Convert a column of texts, each distinct one only once.
+    :param converter: How to convert one text.
+    :param texts: The texts of one field, for a page of policies.
+    :return: The values, in the same order.
+    """
+    values: Dict[str, Value] = {}
+    column = []
+    for text in texts:
+        try:
+            value = values[text]
+        except KeyError:
+            value = values[text] = converter(text)
+        column.append(value)
+    return column
+
+
+def convert_rows(converters: Sequence[Callable[[str], Value]], rows: Sequence[Sequence[str]]) -> List[List]:
+    """
+    Convert the texts of a page of policies, one column at a time.
+    :param converters: How to convert each column.
+    :param rows: The texts of each policy, one per column.
+    :return: The values of each policy, in the same order.
+    """
+    if not rows:
+        return []
+    columns = [convert_column(converter, column) for converter, column in zip(converters, zip(*rows))]
+    return [list(values) for values in zip(*columns)]
@@ -2,7 +2,7 @@
 All the custom types that this script uses.
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 from typing import ClassVar, Mapping, Optional, Callable, List
 from collections import namedtuple
 from enum import Enum, auto
@@ -11,8 +11,13 @@ from enum import Enum, auto
 # result is expected.
 IndexedXpath = namedtuple('IndexedXpath', ['xpath', 'place'])
 
+# How to read a policy laid out as table rows in a single pass over its elements.
+# "columns" maps fields to their position among the texts of the "cell_tag" elements.
+# "line_prefixes" maps fields to the label that starts their line among the texts of the "line_tag" elements.
+RowLayout = namedtuple('RowLayout', ['cell_tag', 'columns', 'line_tag', 'line_prefixes'])
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class Agent:
     """
     The costumer's agent details.
@@ -41,18 +46,16 @@ class Agent:
         """
         Serialize to a dictionary.
         """
-        agent_copy = self.__dict__.copy()
-        for key in agent_copy.copy().keys():
-            if key not in self._serialize:
-                del agent_copy[key]
-        return agent_copy
+        return {field.name: getattr(self, field.name) for field in fields(self) if field.name in self._serialize}
 
 
-@dataclass
+@dataclass(slots=True)
 class Customer:
     """
     Identity and information about the customer.
     Which user data is used can vary from one carrier to the next.
+    Unlike agents and policies, a customer is not frozen: it is linked to them, and given its version,
+    after it is built.
     """
     name: str
     id: str
@@ -61,6 +64,9 @@ class Customer:
     ssn: Optional[int] = None
     agent: Optional[Agent] = None
     policies: Optional[List] = None
+    # Which snapshot of the customer this is. Every scrape that stores a customer gives it a new version,
+    # so anything derived from a version, like its encoded JSON, stays valid until the next one.
+    version: int = field(default=0, compare=False)
 
     class Fields(Enum):
         Name = auto()
@@ -83,10 +89,8 @@ class Customer:
         """
         Serialize to a dictionary.
         """
-        customer_copy = self.__dict__.copy()
-        for key in customer_copy.copy().keys():
-            if key not in self._serialize:
-                del customer_copy[key]
+        customer_copy = {field.name: getattr(self, field.name) for field in fields(self)
+                         if field.name in self._serialize}
         customer_copy['agent'] = customer_copy['agent'].to_dict()
         customer_copy['policies'] = {key: policy.to_dict() for key, policy in customer_copy['policies'].items()}
         return customer_copy
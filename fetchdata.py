@@ -1,47 +1,272 @@
-import urllib.request
+import itertools
+import logging
+import threading
+import time
+import urllib.error
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import lxml.html
 
+from cache import PageCache
 from carrier import Carrier, Policy
+from changes import Delta, PageMemo, PageRead, content_hash, diff
 from customtypes import Customer, Agent
-from lxml.html.soupparser import fromstring
-from typing import Type, List
+from indexes import Indexes
+from metrics import Metrics
+from parsepool import ParsePool
+from parsers import get_parser, pull_parser
+from ratelimit import HostLimiter, OVERLOAD_STATUSES
+from session import ScrapeSession
+from snapshot import SnapshotStore
+from store import PolicyStore
+from transport import Transport, PooledTransport, Response, http_error, retry_delay
+from typing import Type, List, Generator, Iterable, Tuple, Optional, MutableMapping, Callable, Mapping
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# How many bytes of a streamed page are given to the parser at a time.
+STREAM_CHUNK = 65536
+
+# The outcome of scraping one customer in a bulk scrape. Exactly one of "customer" and "error" is set.
+ScrapeResult = namedtuple('ScrapeResult', ['carrier', 'customer_id', 'customer', 'error'])
 
 
 class FetchData:
 
-    def __init__(self, carrier: Type[Carrier]):
+    # How the pages are downloaded. Replace it with a LocalTransport to scrape offline.
+    # It does not retry: each try of a request waits for its own slot of the limiter instead. See request.
+    transport: Transport = PooledTransport(retries=0)
+
+    # How many times a request is tried again after a transient failure, and the wait before the first retry, in
+    # seconds, which doubles after each one up to "max_backoff". A Retry-After header from the host wins.
+    retries: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 30.0
+
+    # How many requests each host gets at once, and how fast they start. Each carrier sets the limits of its host.
+    limiter: HostLimiter = HostLimiter()
+
+    # The pages downloaded so far. Set it to None to always download every page.
+    cache: Optional[PageCache] = PageCache()
+
+    # Every stored policy, for questions about the whole portfolio. Set it to None to keep none.
+    store: Optional[PolicyStore] = PolicyStore()
+
+    # Every stored customer, agent and policy, by the values they are looked up by other than their IDs.
+    indexes: Optional[Indexes] = Indexes()
+
+    # Where every stored customer is saved, so that a restarted service can answer at once. None saves nothing.
+    snapshots: Optional[SnapshotStore] = None
+
+    # Parses the pages in other processes, if set, so that scraping many customers at once uses every core.
+    # Streamed scrapes still parse in their own thread.
+    parsers: Optional[ParsePool] = None
+
+    # Where the time spent on each stage of the scrapes is recorded. None records nothing. See metrics.
+    metrics: Optional[Metrics] = None
+
+    # What was read from each page the last time, by the hash of its content, so that a customer scraped again only
+    # costs the pages and policies that changed. None reads every page in full. See changes.
+    pages: Optional[PageMemo] = PageMemo()
+
+    # Downloads the next page of a customer while the current one is read. See prefetch.
+    downloads: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='prefetch')
+
+    # Called with the Delta of every customer stored, when something changed. See subscribe.
+    subscribers: List[Callable[[Delta], None]] = []
+
+    # The versions given to the stored customers. They are never reused, whatever the carrier or customer.
+    versions = itertools.count(1)
+
+    def __init__(self, carrier: Type[Carrier], stream: bool = False):
+        """
+        :param carrier: The carrier to scrape.
+        :param stream: Parse the policies while their pages download, and free each one once it is read,
+                       instead of building the whole page first.
+        """
         self.carrier = carrier
+        self.stream = stream
         self.uri = self.carrier.URI
-        self.data = {}
         self.customers = {}
         self.agents = {}
         self.policies = {}
+        # Held while a customer is stored, so that the stores and indexes all end up with the same one.
+        self.lock = threading.Lock()
+        self.limiter.configure(self.uri, self.carrier.host_limits)
 
-    def fetch_my_carrier(self):
+    def fetch_my_carrier(self, customer_id: Optional[str] = None) -> ScrapeSession:
         """
         Scrape all the data for the loaded agency and store it in this instance.
+        Each call works on its own session, so calls can run at the same time.
+        :param customer_id: The customer to scrape, or None for the carrier's default customer.
+        :return: The session of this scrape, with what it found.
+        """
+        session = ScrapeSession(self.carrier, self.uri if customer_id is None else self.carrier.uri(customer_id),
+                                metrics=self.metrics)
+        start = time.perf_counter()
+        try:
+            self.scrape(session)
+        except Exception:
+            if session.metrics is not None:
+                session.metrics.count('scrape_failures_total', carrier=self.carrier.system_name)
+            raise
+        if session.metrics is not None:
+            session.metrics.observe('scrape_seconds', time.perf_counter() - start, carrier=self.carrier.system_name)
+            session.metrics.observe('pages_per_customer', session.page, carrier=self.carrier.system_name)
+        return session
+
+    def scrape(self, session: ScrapeSession):
+        """
+        Scrape the customer of a session, with its agent and policies, and store them in this instance.
         """
-        self.get_root()
-        print(f'Getting customer data for {self.carrier.name} ...')
-        self.data['customer_data']: Customer = self.scrape_unique_item(Customer, 'customer')
-        print(f'Getting agent data for {self.carrier.name} ...')
-        self.data['agent_data']: Agent = self.scrape_unique_item(Agent, 'agent')
+        if (self.parsers is not None or self.pages is not None) and not self.stream:
+            logger.debug('Getting the data for %s a page at a time ...', self.carrier.name)
+            self.fetch_pages(session)
+        else:
+            if self.stream:
+                # The customer and the agent are read from what is left of the first page once it is streamed.
+                session.policies = list(self.stream_policies(session))
+            else:
+                self.get_root(session)
+            logger.debug('Getting customer data for %s ...', self.carrier.name)
+            session.customer = self.scrape_unique_item(Customer, 'customer', session.tree)
+            logger.debug('Getting agent data for %s ...', self.carrier.name)
+            session.agent = self.scrape_unique_item(Agent, 'agent', session.tree)
+            logger.debug('Getting policy data for %s ...', self.carrier.name)
+            if not self.stream:
+                session.policies = list(self.scrape_policies(session))
         # Let's link the customer with the agent and policies here.
-        print(f'Getting policy data for {self.carrier.name} ...')
-        self.data['policy_data']: List[Type[Policy]] = self.scrape_policies()
-        print('Aggregating...')
+        logger.debug('Aggregating...')
 
         # We're in a non-relational database context anyway.
-        self.data['customer_data'].agent = self.data['agent_data']
-        self.data['customer_data'].policies = self.data['policy_data']
+        session.customer.agent = session.agent
+        session.customer.policies = {policy.id: policy for policy in session.policies}
+        session.delta = self.keep(session.customer)
+        if not session.delta:
+            # Nothing changed: the customer already stored stays, with its version.
+            session.customer = session.delta.previous
+        session.policies = list(session.customer.policies.values())
+        logger.info('All the data for the carrier %s has been scraped and aggregated.', self.carrier.name)
 
-        self.customers[self.data['customer_data'].id] = self.data['customer_data']
-        self.agents[self.data['agent_data'].producer_code] = self.data['agent_data']
-        for policy in self.data['policy_data']:
-            self.policies[policy.id] = policy
-        self.data['customer_data'].policies = self.policies
-        print(f'All the data for the carrier {self.carrier.name} has been scraped and aggregated.')
+    def keep(self, customer: Customer, save: bool = True, replace: bool = True) -> Optional[Delta]:
+        """
+        Store a customer, linked to its agent and policies, in place of the one that has the same ID.
+        Only what changed since that one is applied to the policy store and the indexes, and sent to the
+        subscribers. If nothing changed, that one is kept, with its version. Otherwise the customer is given a
+        new version.
+        :param customer: The customer to store.
+        :param save: Also save it in the snapshots, if there are.
+        :param replace: Store it even if there already is a customer with the same ID.
+        :return: How the customer changed, or None if it was not stored.
+        """
+        system_name = self.carrier.system_name
+        with self.lock:
+            previous = self.customers.get(customer.id)
+            if not replace and previous is not None:
+                return None
+            delta = diff(system_name, previous, customer)
+            if not delta:
+                return delta
+            customer.version = next(self.versions)
+            self.customers[customer.id] = customer
+            self.agents[customer.agent.producer_code] = customer.agent
+            for policy_id, policy in delta.removed.items():
+                if self.policies.get(policy_id) is policy:
+                    del self.policies[policy_id]
+            self.policies.update(delta.added)
+            self.policies.update((policy_id, after) for policy_id, (_, after) in delta.modified.items())
+            if self.store is not None:
+                if previous is None:
+                    self.store.replace(system_name, customer.id, customer.policies.values())
+                else:
+                    changed = [*delta.added.values(), *(after for _, after in delta.modified.values())]
+                    self.store.update(system_name, customer.id, changed, delta.removed)
+            if self.indexes is not None:
+                if previous is None:
+                    self.indexes.replace(system_name, customer)
+                else:
+                    self.indexes.apply(delta)
+            if save and self.snapshots is not None:
+                self.snapshots.save(system_name, customer)
+        if self.metrics is not None:
+            for kind, policies in (('added', delta.added), ('removed', delta.removed), ('modified', delta.modified)):
+                if policies:
+                    self.metrics.count('policy_changes_total', len(policies), carrier=system_name, kind=kind)
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber(delta)
+            except Exception:
+                logger.exception('A subscriber failed on the changes of the customer %s of %s.',
+                                 customer.id, self.carrier.name)
+        return delta
+
+    @classmethod
+    def subscribe(cls, subscriber: Callable[[Delta], None]):
+        """
+        Have a function called with the changes of every customer stored from now on, by any carrier.
+        It is called in the thread of the scrape, once the customer is stored. It is not called when nothing
+        changed.
+        :param subscriber: The function. What it raises is logged, and does not fail the scrape.
+        """
+        cls.subscribers.append(subscriber)
+
+    @classmethod
+    def unsubscribe(cls, subscriber: Callable[[Delta], None]):
+        """
+        Stop calling a function that was subscribed.
+        """
+        if subscriber in cls.subscribers:
+            cls.subscribers.remove(subscriber)
+
+    @classmethod
+    def fetch_many(cls, customers: Iterable[Tuple[Type[Carrier], str]],
+                   fetchers: Optional[MutableMapping[Type[Carrier], 'FetchData']] = None,
+                   max_workers: int = 16) -> Generator[ScrapeResult, None, None]:
+        """
+        Scrape many customers, of any carriers, at the same time.
+        The requests to each host stay within the limits of "limiter" however many customers are in flight.
+        :param customers: The carrier and customer ID of each customer to scrape. It is read lazily,
+                          so it can be a generator over thousands of customers.
+        :param fetchers: Where each carrier's data is stored. A fetcher is added for the carriers that have none.
+        :param max_workers: The most customers scraped at once.
+        :return: The result of each customer, as soon as it is done, in no particular order.
+        """
+        fetchers = {} if fetchers is None else fetchers
+        customers = iter(customers)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {}
+
+            def submit() -> bool:
+                try:
+                    carrier, customer_id = next(customers)
+                except StopIteration:
+                    return False
+                fetcher = fetchers.get(carrier)
+                if fetcher is None:
+                    fetcher = fetchers[carrier] = cls(carrier)
+                pending[executor.submit(fetcher.fetch_my_carrier, customer_id)] = (carrier, customer_id)
+                return True
+
+            # Keep a little more than the workers busy, without reading every customer up front.
+            while len(pending) < max_workers * 2 and submit():
+                pass
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        carrier, customer_id = pending.pop(future)
+                        try:
+                            result = ScrapeResult(carrier, customer_id, future.result().customer, None)
+                        except Exception as error:
+                            result = ScrapeResult(carrier, customer_id, None, error)
+                        yield result
+                        submit()
+            finally:
+                # If the caller stops reading, the customers not started yet are dropped.
+                for future in pending:
+                    future.cancel()
 
     @staticmethod
     def encoding() -> str:
@@ -51,57 +276,294 @@ class FetchData:
         return 'utf-8'
 
     @staticmethod
-    def uri_to_xpath(uri: str) -> lxml.html.HtmlElement:
+    def download(uri: str, ttl: float = 0) -> bytes:
+        """
+        Get the content of a URI, from the cache if it is fresh there.
+        A stale page is revalidated with the carrier, which only sends it again if it has changed.
+        :param uri: The URI to fetch.
+        :param ttl: How long the page may be served from the cache without asking the carrier, in seconds.
+        :return: The content of the page.
+        """
+        cache = FetchData.cache
+        if cache is None:
+            response = FetchData.request(uri, {})
+            if response.status >= 400:
+                raise http_error(uri, response.status, response.headers)
+            return response.body
+        entry = cache.get(uri)
+        if entry is not None and cache.fresh(entry):
+            if FetchData.metrics is not None:
+                FetchData.metrics.count('cache_hits_total', host=urlsplit(uri).netloc)
+            return entry.body
+        response = FetchData.request(uri, cache.validators(entry))
+        if response.status == 304:
+            if entry is not None:
+                return cache.revalidated(entry, response.headers, ttl).body
+            # There is nothing cached to reuse, so the page has to be sent again in full.
+            response = FetchData.request(uri, {})
+        if response.status == 304 or response.status >= 400:
+            raise http_error(uri, response.status, response.headers)
+        return cache.put(uri, response.body, response.headers, ttl).body
+
+    @staticmethod
+    def request(uri: str, headers: Mapping[str, str]) -> Response:
+        """
+        Make a request within the limits of its host, and try it again after a transient failure.
+        Each try waits for its own slot of the rate limiter and its own token, and tells the limiter how it went,
+        so that a host that throttles is backed off from even when a retry goes through. The waits between two
+        tries hold no slot. Each try is recorded in the metrics.
+        :param uri: The URI to get.
+        :param headers: Extra request headers.
+        :return: The response to the last try.
+        """
+        attempt = 0
+        while True:
+            response = None
+            try:
+                with FetchData.limiter.slot(uri) as slot:
+                    start = time.perf_counter()
+                    response = FetchData.transport.request(uri, headers)
+                    if response.status in OVERLOAD_STATUSES:
+                        slot.overload()
+            except urllib.error.HTTPError:
+                raise
+            except PooledTransport.retry_errors:
+                if attempt >= FetchData.retries:
+                    raise
+            if response is not None:
+                if FetchData.metrics is not None:
+                    FetchData.record_download(uri, time.perf_counter() - start, len(response.body))
+                if response.status not in PooledTransport.retry_statuses or attempt >= FetchData.retries:
+                    return response
+            time.sleep(retry_delay(attempt, None if response is None else response.headers,
+                                   FetchData.backoff, FetchData.max_backoff))
+            attempt += 1
+
+    @staticmethod
+    def record_download(uri: str, seconds: float, size: int):
+        """
+        Record the time and the bytes of a download in the metrics.
+        """
+        host = urlsplit(uri).netloc
+        FetchData.metrics.observe('http_request_seconds', seconds, host=host)
+        FetchData.metrics.count('downloaded_bytes_total', size, host=host)
+
+    @staticmethod
+    def uri_to_xpath(uri: str, parser: str = 'auto', ttl: float = 0) -> lxml.html.HtmlElement:
         """
         Given a URI, fetch its content and turn it into a searchable XML tree.
         :param uri: The URI to fetch.
+        :param parser: The name of the parser to use. See parsers.PARSERS.
+        :param ttl: How long the page may be served from the cache without asking the carrier, in seconds.
         :return: The destination of the URI as a searchable XML tree.
         """
-        response = urllib.request.urlopen(uri)
-        source = response.read().decode(FetchData.encoding())
-        return fromstring(source)
+        return FetchData.parse(FetchData.download(uri, ttl).decode(FetchData.encoding()), parser)
 
-    def get_root(self):
+    @staticmethod
+    def parse(source: str, parser: str = 'auto') -> lxml.html.HtmlElement:
         """
-        Fetch the raw HTML text specified by this carrier's URI. Turn into a tree usable by XPath.
-        Set the value to the "tree" member of this instance.
+        Turn the content of a page into a searchable XML tree.
+        :param source: The content of the page.
+        :param parser: The name of the parser to use. See parsers.PARSERS.
         """
-        if self.carrier.tree is not None:
-            return
-        self.carrier.tree = self.uri_to_xpath(self.uri)
+        if FetchData.metrics is None:
+            return get_parser(parser)(source)
+        with FetchData.metrics.timer('parse_seconds', parser=parser):
+            return get_parser(parser)(source)
 
-    def scrape_unique_item(self, cls, data_point: str) -> List:
+    def get_root(self, session: ScrapeSession):
+        """
+        Fetch the raw HTML text specified by the session's URI. Turn into a tree usable by XPath.
+        Set the value to the "tree" member of the session.
+        """
+        session.turn_page(self.uri_to_xpath(session.uri, self.carrier.parser, self.carrier.cache_ttl), session.uri)
+
+    def scrape_unique_item(self, cls, data_point: str, tree: lxml.html.HtmlElement) -> List:
         """
         Scrapes an item that is unique within an entry, as opposed to iterated items.
         Given that the data can be different from one carrier to the next, if Python were really used,
         it would be a good idea to use keyword attribute rather than placed attributes.
         :param cls: The type of the item to return.
         :param data_point: The type of top-level data to get, "agent" or "customer".
+        :param tree: The page to get it from.
         :return: An object representing the scraped data.
         """
-        fields = []
-        data_point += '_xpath'
-        for field in cls.Fields:
-            try:
-                indexed_xpath = getattr(self.carrier, data_point)[field]
-            except KeyError:
-                print(f'missing: {field}')
-                continue
-            node = self.carrier.tree.xpath(indexed_xpath.xpath)
-            text = None
-            if isinstance(node, list):
-                text = node[indexed_xpath.place]
-            elif isinstance(node, str):
-                text = node
-            if text:
-                fields.append(cls.types[field](text))
-        return cls(*fields)
-
-    def scrape_policies(self) -> List[Type[Policy]]:
+        return cls(*self.carrier.unique_values(cls, data_point, tree))
+
+    def fetch_pages(self, session: ScrapeSession):
+        """
+        Download every page of the session, and read what has changed on each.
+        The next page downloads while the current one is read: as soon as the link to it is found, or right away
+        when the current page has not changed.
+        A page whose content has not changed since it was last read is not parsed again: what was read from it is
+        reused. On the pages that have changed, the policies whose HTML has not changed are reused too, unless the
+        pages are parsed by the parsing processes. See changes.
+        The session's tree is the first page, if it was parsed in this process.
+        :param session: The scrape to get them for.
+        """
+        memo = self.pages
+        system_name = self.carrier.system_name
+        known = {} if memo is None else memo.known_rows((system_name, session.uri))
+        rows = {}
+        uri = session.uri
+        first = True
+        try:
+            while uri is not None:
+                body = self.reach(session, uri)
+                page_hash = None if memo is None else content_hash(body)
+                read = None if memo is None else memo.get((system_name, uri), page_hash)
+                # A page first read further into a customer does not have the customer and the agent.
+                if read is None or (first and read.customer is None):
+                    read = self.read_page(session, uri, body, page_hash, first, known)
+                    if memo is not None:
+                        memo.put((system_name, uri), read)
+                else:
+                    self.prefetch(session, read.next_page)
+                    if session.metrics is not None:
+                        session.metrics.count('unchanged_pages_total', carrier=system_name)
+                if read.rows is not None:
+                    rows.update(read.rows)
+                if first:
+                    session.customer = Customer(*read.customer)
+                    session.agent = Agent(*read.agent)
+                    first = False
+                session.page += 1
+                session.page_uri = uri
+                session.policies.extend(read.policies)
+                uri = read.next_page
+        finally:
+            self.stop_prefetching(session)
+        if memo is not None:
+            memo.remember_rows((system_name, session.uri), rows)
+
+    def read_page(self, session: ScrapeSession, uri: str, body: bytes, page_hash: Optional[bytes], first: bool,
+                  known: Mapping[bytes, Policy]) -> PageRead:
+        """
+        Read everything on a downloaded page, in the parsing processes if there are.
+        The next page starts downloading as soon as the link to it is found.
+        :param session: The scrape the page is for.
+        :param uri: The address of the page.
+        :param body: The page, as downloaded.
+        :param page_hash: The hash of the page, to remember it by.
+        :param first: Whether this is the first page of a customer, which has the customer and the agent.
+        :param known: The policies read before, by the hash of their HTML. Only used in this process.
+        :return: What was read.
+        """
+        if self.parsers is not None:
+            # The next page downloads while the worker reads the policies of this one.
+            page = self.parsers.submit(self.carrier, body, self.encoding(), first, session.metrics is not None,
+                                       lambda link: self.prefetch(session, link), uri).result()
+            if page.metrics is not None:
+                session.metrics.merge(page.metrics)
+            return PageRead(page_hash, page.customer, page.agent,
+                            [self.carrier.policy_type(*values) for values in page.policies], page.next_page, None)
+        tree = self.parse(body.decode(self.encoding()), self.carrier.parser)
+        next_page = self.carrier.change_page(tree, uri)
+        self.prefetch(session, next_page)
+        customer = agent = None
+        if first:
+            session.tree = tree
+            customer = tuple(self.carrier.unique_values(Customer, 'customer', tree))
+            agent = tuple(self.carrier.unique_values(Agent, 'agent', tree))
+        policies, rows = self.carrier.fetch_changed_page(tree, known, session.metrics)
+        return PageRead(page_hash, customer, agent, policies, next_page, rows)
+
+    def prefetch(self, session: ScrapeSession, uri: Optional[str]):
+        """
+        Start downloading a page of a session before it is reached, unless it already is, or was.
+        :param session: The scrape the page is for.
+        :param uri: The page, or None if there is no next page.
+        """
+        if uri is None:
+            return
+        with session.ahead_lock:
+            if session.ahead is None or uri in session.ahead:
+                return
+            session.ahead[uri] = self.downloads.submit(self.download, uri, self.carrier.cache_ttl)
+
+    def reach(self, session: ScrapeSession, uri: str) -> bytes:
+        """
+        The content of the next page of a session: the download that was started ahead for it, if there is one.
+        A download that has not started yet is cancelled, and the page is downloaded right away instead.
+        """
+        with session.ahead_lock:
+            future = session.ahead.get(uri)
+            session.ahead[uri] = None
+        if future is not None and not future.cancel():
+            return future.result()
+        return self.download(uri, self.carrier.cache_ttl)
+
+    @staticmethod
+    def stop_prefetching(session: ScrapeSession):
+        """
+        Cancel the downloads of a session that have not started, and start no more.
+        """
+        with session.ahead_lock:
+            ahead, session.ahead = session.ahead, None
+        for future in ahead.values():
+            if future is not None:
+                future.cancel()
+
+    def scrape_policies(self, session: ScrapeSession) -> List[Type[Policy]]:
         """
         Get all the policy object from the current carrier.
+        :param session: The scrape to get them for.
         :return:  A list of policy objects.
         """
-        self.get_root()
-        for policy in self.carrier.fetch_policies(self.carrier.tree, self.carrier.POLICIES):
+        if session.tree is None:
+            self.get_root(session)
+        for policy in self.carrier.fetch_policies(session.tree, session=session):
             yield policy
+
+    def stream_policies(self, session: ScrapeSession) -> Generator[Type[Policy], None, None]:
+        """
+        Get all the policy objects from the current carrier, while their pages download.
+        Each page is downloaded whole, then fed to the parser in pieces. Each policy is parsed as soon as its
+        element is complete, then removed from the page, so the tree does not grow with the size of the page.
+        What remains of the first page, with the customer and agent data, becomes the session's tree.
+        The slot of each download is given back before its policies are read, so that how fast they are read
+        does not count in how fast the host answers.
+        Streamed pages do not go through the cache.
+        :param session: The scrape to get them for.
+        :return: The policy objects, in page order.
+        """
+        if self.carrier.stream_tag is None:
+            raise ValueError(f'The policies of {self.carrier.name} cannot be streamed: '
+                             f'"{self.carrier.POLICIES}" is not a single "//tag[predicate]" step.')
+        uri = session.uri
+        first = True
+        while uri is not None:
+            response = self.request(uri, {})
+            if response.status >= 400:
+                raise http_error(uri, response.status, response.headers)
+            parser = pull_parser(self.carrier.stream_tag, self.encoding())
+            body = response.body
+            for start in range(0, len(body), STREAM_CHUNK):
+                parser.feed(body[start:start + STREAM_CHUNK])
+                yield from self.read_stream(parser)
+            del response, body
+            root = parser.close()
+            yield from self.read_stream(parser)
+            if first:
+                session.turn_page(root, uri)
+                first = False
+            else:
+                session.page += 1
+                session.page_uri = uri
+            uri = self.carrier.change_page(root, uri)
+
+    def read_stream(self, parser) -> Generator[Type[Policy], None, None]:
+        """
+        Parse the policies that the streaming parser has completed since it was last asked.
+        :param parser: The parser being fed the page.
+        :return: The policy objects.
+        """
+        for _, element in parser.read_events():
+            node = self.carrier.stream_policy(element)
+            if node is None:
+                continue
+            yield self.carrier.fetch_policy(node)
+            parent = node.getparent()
+            if parent is not None:
+                parent.remove(node)
+            node.clear()
@@ -0,0 +1,139 @@
+"""
+Synthetic carrier pages, shaped like the real Mock Indemnity and Placeholder Insurance pages,
+so the scraper can be exercised and measured without the live site.
+"""
+
+import re
+from typing import Mapping, Optional
+
+from transport import LocalTransport, LocalPage
+
+STATUSES = ['active', 'endorsement_pending', 'pending_cancelation', 'claim_pending', 'claim_rejected']
+
+
+def us_date(index: int, year: int) -> str:
+    """
+    A date in the m/d/yyyy format the carriers use, that varies with the index.
+    """
+    return f'{index % 12 + 1}/{index % 28 + 1}/{year}'
+
+
+def mock_policy(customer_id: str, index: int) -> str:
+    """
+    One policy of a Mock Indemnity page.
+    """
+    return f'''
+            <li class="list-group-item">
+                <div><label for="id">Id:</label> <span>{customer_id}-M{index:06d}</span></div>
+                <div><label for="premium">Premium:</label> <span>{100 + index % 900}.{index % 100:02d}</span></div>
+                <div><label for="status">Status:</label> <span>{STATUSES[index % len(STATUSES)]}</span></div>
+                <div><label for="effectiveDate">Effective Date:</label> <span>{us_date(index, 2020)}</span></div>
+                <div><label for="terminationDate">Termination Date:</label> <span>{us_date(index, 2023)}</span></div>
+                <div><label for="lastPaymentDate">Last Payment Date:</label> <span>{us_date(index * 7, 2022)}</span></div>
+            </li>'''
+
+
+def mock_page(customer_id: str = 'a0dfjw9a', policies: int = 10) -> str:
+    """
+    A Mock Indemnity customer page.
+    :param customer_id: The customer whose page this is.
+    :param policies: How many policies are on the page.
+    :return: The HTML text of the page.
+    """
+    return f'''<!DOCTYPE html>
+<html>
+    <head><title>Mock Indemnity</title></head>
+    <body>
+        <div class="agent-details">
+            <dl>
+                <dt>Name</dt><dd class="value-name value-holder" data-value-for="name">Agent {customer_id}</dd>
+                <dt>Producer Code</dt><dd data-value-for="producerCode">PC-{customer_id}</dd>
+                <dt>Agency Name</dt><dd data-value-for="agencyName">Agency of {customer_id}</dd>
+                <dt>Agency Code</dt><dd data-value-for="agencyCode">AC-{customer_id[:4]}</dd>
+            </dl>
+        </div>
+        <div class="customer-details">
+            <dl>
+                <dt>Name</dt><dd class="value-name value-holder" data-value-for="name">Customer {customer_id}</dd>
+                <dt>Id</dt><dd class="value-id value-holder" data-value-for="id">{customer_id}</dd>
+                <dt>Email</dt><dd class="value-email value-holder" data-value-for="email">{customer_id}@example.com</dd>
+                <dt>Address</dt><dd class="value-address value-holder" data-value-for="address">1 Main St</dd>
+            </dl>
+        </div>
+        <ul class="list-group">{''.join(mock_policy(customer_id, index) for index in range(policies))}
+        </ul>
+    </body>
+</html>
+'''
+
+
+def placeholder_policy(customer_id: str, index: int) -> str:
+    """
+    One policy of a Placeholder Insurance page: its row and its details row.
+    """
+    return f'''
+                <tr class="policy-info-row"><td>{customer_id}-P{index:06d}</td><td>{200 + index % 800}.{index % 100:02d}</td><td>{STATUSES[index % len(STATUSES)]}</td><td>{us_date(index, 2021)}</td><td>{us_date(index, 2024)}</td></tr>
+                <tr class="policy-details-row"><td class="details-row" colspan="5"><div>Last Payment Date: {us_date(index * 3, 2023)}</div><div>Commission Rate: {index % 20 + 1}%</div><div>Number of Insureds: {index % 9 + 1}</div></td></tr>'''
+
+
+def placeholder_page(customer_id: str = 'f02dkl4e', page: int = 1, pages: int = 1, policies: int = 10) -> str:
+    """
+    One page of a Placeholder Insurance customer.
+    :param customer_id: The customer whose page this is.
+    :param page: The number of this page, starting at 1.
+    :param pages: How many pages this customer has.
+    :param policies: How many policies are on each page.
+    :return: The HTML text of the page.
+    """
+    first = (page - 1) * policies
+    rows = ''.join(placeholder_policy(customer_id, index) for index in range(first, first + policies))
+    next_link = ''
+    if page < pages:
+        next_link = f'<a class="page-link" href="/placeholder_carrier/{customer_id}/policies/{page + 1}">Next</a>'
+    return f'''<!DOCTYPE html>
+<html>
+    <head><title>Placeholder Insurance</title></head>
+    <body>
+        <div class="card agent-details">
+            <div class="card-body">
+                <div><label for="name">Name:</label><span>Agent {customer_id}</span></div>
+                <div><label for="producerCode">Producer Code:</label><span>PC-{customer_id}</span></div>
+                <div><label for="agencyName">Agency Name:</label><span>Agency of {customer_id}</span></div>
+                <div><label for="agencyCode">Agency Code:</label><span>AC-{customer_id[:4]}</span></div>
+            </div>
+        </div>
+        <div class="card customer-details">
+            <div class="card-body">{customer_id}@example.com<div><label for="name">Name:</label><span>Customer {customer_id}</span></div><div><label for="id">Id:</label><span>{customer_id}</span></div><div>Email: {customer_id}@example.com</div><div>Address: 2 Side Rd</div><div style="display:none"><span>SSN:</span><span>{sum(map(ord, customer_id)) * 1000003 % 900000000 + 100000000}</span></div></div>
+        </div>
+        <table class="table">
+            <tbody>{rows}
+            </tbody>
+            <tfoot><tr><td colspan="5">{next_link}</td></tr></tfoot>
+        </table>
+    </body>
+</html>
+'''
+
+
+MOCK_URI = re.compile(r'/mock_indemnity/(?P<customer>[^/]+)$')
+PLACEHOLDER_URI = re.compile(r'/placeholder_carrier/(?P<customer>[^/]+)/policies/(?P<page>\d+)$')
+
+
+def transport(policies: int = 10, pages: int = 1, overrides: Optional[Mapping[str, LocalPage]] = None) -> LocalTransport:
+    """
+    A transport that answers every Mock Indemnity and Placeholder Insurance customer URI with a synthetic page.
+    :param policies: How many policies are on each page.
+    :param pages: How many pages each Placeholder Insurance customer has.
+    :param overrides: Fixed pages that win over the generated ones, by URI.
+    :return: The offline transport.
+    """
+    def handler(uri: str, _) -> Optional[str]:
+        match = MOCK_URI.search(uri)
+        if match:
+            return mock_page(match['customer'], policies)
+        match = PLACEHOLDER_URI.search(uri)
+        if match and int(match['page']) <= pages:
+            return placeholder_page(match['customer'], int(match['page']), pages, policies)
+        return None
+
+    return LocalTransport(overrides, handler)
@@ -0,0 +1,260 @@
+"""
+Indexes over the customers, agents and policies of every carrier.
+FetchData only keeps each carrier's data by its own IDs. These indexes answer the other questions, like the
+customers of an agency or the policies terminating this month, across carriers and without a full scan.
+They are updated one customer at a time, as each scrape lands.
+"""
+
+import bisect
+import threading
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from carrier import Policy
+from changes import Delta
+from customtypes import Customer, Status
+
+# A customer, as the system name of its carrier and its ID.
+Key = Tuple[str, str]
+
+# A policy, as the system name of its carrier and its ID.
+PolicyKey = Tuple[str, str]
+
+# The policy dates that can be looked up by range.
+DATE_ATTRIBUTES = ['effective_date', 'termination_date']
+
+
+class DateIndex:
+    """
+    Policies by date, for range lookups: the dates in use, sorted, and the policies of each.
+    There are far fewer dates than policies, so keeping the dates sorted as policies come and go is cheap.
+    """
+
+    def __init__(self):
+        self.dates: List[date] = []
+        self.policies: Dict[date, Set[PolicyKey]] = {}
+
+    def add(self, day: date, key: PolicyKey):
+        """
+        Index a policy under a date.
+        """
+        keys = self.policies.get(day)
+        if keys is None:
+            keys = self.policies[day] = set()
+            bisect.insort(self.dates, day)
+        keys.add(key)
+
+    def discard(self, day: date, key: PolicyKey):
+        """
+        Stop indexing a policy under a date.
+        """
+        keys = self.policies.get(day)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self.policies[day]
+            del self.dates[bisect.bisect_left(self.dates, day)]
+
+    def between(self, start: Optional[date], end: Optional[date]) -> Iterable[PolicyKey]:
+        """
+        The policies from one date to another, both included. Either can be None.
+        """
+        low = 0 if start is None else bisect.bisect_left(self.dates, start)
+        high = len(self.dates) if end is None else bisect.bisect_right(self.dates, end)
+        for day in self.dates[low:high]:
+            yield from self.policies[day]
+
+
+class Indexes:
+    """
+    Secondary indexes over every stored customer, with its agent and policies.
+    Storing a customer again replaces everything it was indexed under, so the indexes always match the latest
+    scrape. Every method is thread-safe.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.customers: Dict[Key, Customer] = {}
+        self.policies: Dict[PolicyKey, Policy] = {}
+        self.by_producer: Dict[str, Set[Key]] = defaultdict(set)
+        self.by_agency: Dict[str, Set[Key]] = defaultdict(set)
+        self.by_email: Dict[str, Set[Key]] = defaultdict(set)
+        self.by_status: Dict[Status, Set[PolicyKey]] = defaultdict(set)
+        self.by_date: Dict[str, DateIndex] = {attribute: DateIndex() for attribute in DATE_ATTRIBUTES}
+
+    @staticmethod
+    def normalize_email(email: str) -> str:
+        """
+        Emails are looked up regardless of case and surrounding spaces.
+        """
+        return email.strip().lower()
+
+    def replace(self, system_name: str, customer: Customer):
+        """
+        Index a customer that has just been scraped, with its agent and policies, in place of what it had.
+        :param system_name: The system name of the customer's carrier.
+        :param customer: The customer, linked to its agent and policies.
+        """
+        key = (system_name, customer.id)
+        with self.lock:
+            previous = self.customers.get(key)
+            if previous is not None:
+                self.unindex(system_name, previous)
+            self.customers[key] = customer
+            self.index_customer(system_name, customer)
+            for policy in (customer.policies or {}).values():
+                self.index_policy((system_name, policy.id), policy)
+
+    def apply(self, delta: Delta):
+        """
+        Index only what changed in a customer that has just been scraped again.
+        :param delta: How the customer changed. See changes.diff.
+        """
+        system_name, customer = delta.carrier, delta.customer
+        key = (system_name, customer.id)
+        with self.lock:
+            previous = self.customers.get(key)
+            if previous is not None:
+                self.unindex_customer(system_name, previous)
+            self.customers[key] = customer
+            self.index_customer(system_name, customer)
+            for policy_id, policy in delta.removed.items():
+                policy_key = (system_name, policy_id)
+                if self.policies.get(policy_key) is policy:
+                    self.unindex_policy(policy_key, policy)
+            for policy_id, (before, after) in delta.modified.items():
+                policy_key = (system_name, policy_id)
+                if self.policies.get(policy_key) is before:
+                    self.unindex_policy(policy_key, before)
+                self.index_policy(policy_key, after)
+            for policy_id, policy in delta.added.items():
+                self.index_policy((system_name, policy_id), policy)
+
+    def index_customer(self, system_name: str, customer: Customer):
+        """
+        Index a customer by its agent and email. Must be called with the lock held.
+        """
+        key = (system_name, customer.id)
+        if customer.agent is not None:
+            self.by_producer[customer.agent.producer_code].add(key)
+            self.by_agency[customer.agent.agency_code].add(key)
+        if customer.email:
+            self.by_email[self.normalize_email(customer.email)].add(key)
+
+    def index_policy(self, policy_key: PolicyKey, policy: Policy):
+        """
+        Index a policy by its status and dates. Must be called with the lock held.
+        """
+        # A policy that moved from another customer is only indexed once, as its latest self.
+        moved = self.policies.get(policy_key)
+        if moved is not None:
+            self.unindex_policy(policy_key, moved)
+        self.policies[policy_key] = policy
+        self.by_status[policy.status].add(policy_key)
+        for attribute, index in self.by_date.items():
+            day = getattr(policy, attribute, None)
+            if day is not None:
+                index.add(day, policy_key)
+
+    def remove(self, system_name: str, customer_id: str):
+        """
+        Stop indexing a customer.
+        """
+        with self.lock:
+            customer = self.customers.pop((system_name, customer_id), None)
+            if customer is not None:
+                self.unindex(system_name, customer)
+
+    def unindex(self, system_name: str, customer: Customer):
+        """
+        Remove a customer from every index but "customers". Must be called with the lock held.
+        """
+        self.unindex_customer(system_name, customer)
+        for policy in (customer.policies or {}).values():
+            policy_key = (system_name, policy.id)
+            # Another customer may have been given the same policy since.
+            if self.policies.get(policy_key) is policy:
+                self.unindex_policy(policy_key, policy)
+
+    def unindex_customer(self, system_name: str, customer: Customer):
+        """
+        Remove a customer from the agent and email indexes. Must be called with the lock held.
+        """
+        key = (system_name, customer.id)
+        if customer.agent is not None:
+            self.discard(self.by_producer, customer.agent.producer_code, key)
+            self.discard(self.by_agency, customer.agent.agency_code, key)
+        if customer.email:
+            self.discard(self.by_email, self.normalize_email(customer.email), key)
+
+    def unindex_policy(self, policy_key: PolicyKey, policy: Policy):
+        """
+        Remove a policy from every index. Must be called with the lock held.
+        """
+        del self.policies[policy_key]
+        self.discard(self.by_status, policy.status, policy_key)
+        for attribute, index in self.by_date.items():
+            day = getattr(policy, attribute, None)
+            if day is not None:
+                index.discard(day, policy_key)
+
+    @staticmethod
+    def discard(index: Dict, value, key: Tuple[str, str]):
+        """
+        Remove a key from an index entry, and the entry once it is empty.
+        """
+        keys = index.get(value)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[value]
+
+    def customers_of(self, index: Dict[str, Set[Key]], value: str) -> List[Customer]:
+        """
+        The customers indexed under a value.
+        """
+        with self.lock:
+            return [self.customers[key] for key in index.get(value, ())]
+
+    def customers_by_producer(self, producer_code: str) -> List[Customer]:
+        """
+        The customers of an agent, whatever their carrier.
+        """
+        return self.customers_of(self.by_producer, producer_code)
+
+    def customers_by_agency(self, agency_code: str) -> List[Customer]:
+        """
+        The customers of an agency, whatever their carrier.
+        """
+        return self.customers_of(self.by_agency, agency_code)
+
+    def customers_by_email(self, email: str) -> List[Customer]:
+        """
+        The customers with an email, one per carrier they are a customer of.
+        """
+        return self.customers_of(self.by_email, self.normalize_email(email))
+
+    def policies_by_status(self, status: Status) -> List[Policy]:
+        """
+        The policies in a status, whatever their carrier.
+        """
+        with self.lock:
+            return [self.policies[key] for key in self.by_status.get(status, ())]
+
+    def policies_between(self, attribute: str, start: Optional[date] = None,
+                         end: Optional[date] = None) -> List[Policy]:
+        """
+        The policies whose date is within a range, whatever their carrier.
+        :param attribute: The date to look at: "effective_date" or "termination_date".
+        :param start: The first date of the range, or None for no lower bound.
+        :param end: The last date of the range, included, or None for no upper bound.
+        :return: The policies, by date.
+        """
+        try:
+            index = self.by_date[attribute]
+        except KeyError:
+            raise ValueError(f'Policies cannot be looked up by "{attribute}".')
+        with self.lock:
+            return [self.policies[key] for key in index.between(start, end)]
@@ -2,18 +2,62 @@
 Main script for the Adapt test.
 """
 
+import argparse
+import logging
+from typing import Optional
+
+import specs
 from rest import MockRestService
 
 
-def run():
+def run(processes: Optional[int] = None):
     """
     Produces the demo output for the application.
+    :param processes: Parse the pages in this many other processes. 0 uses one per core.
     """
     print('Scraping the data.')
-    rest_service = MockRestService()
-    print('Producing the JSON.\n\n')
-    print(rest_service.respond())
+    with MockRestService(processes=processes) as rest_service:
+        print('Producing the JSON.\n\n')
+        print(rest_service.respond())
+
+
+def main():
+    """
+    Run the demo, or serve the customers over HTTP with "serve".
+    """
+    arguments = argparse.ArgumentParser(description=__doc__)
+    commands = arguments.add_subparsers(dest='command')
+    serve_command = commands.add_parser('serve', help='Serve the customers over HTTP.')
+    serve_command.add_argument('--host', default='127.0.0.1', help='The interface to listen on.')
+    serve_command.add_argument('--port', type=int, default=8080, help='The port to listen on.')
+    serve_command.add_argument('--eager', action='store_true',
+                               help="Scrape every carrier's default customer before listening.")
+    serve_command.add_argument('--no-refresh', dest='refresh', action='store_false',
+                               help='Do not refresh the served customers in the background.')
+    serve_command.add_argument('--snapshot', metavar='FILE',
+                               help='Save the customers to this file, and serve them from it on the next start.')
+    serve_command.add_argument('--metrics', action='store_true',
+                               help='Record the time spent on each stage of the scrapes, and serve it on /metrics.')
+    arguments.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                           help='The least severe messages to log.')
+    arguments.add_argument('--specs', metavar='DIRECTORY', action='append',
+                           help='Also load the carriers described by the JSON specs in this directory, named '
+                                '"<SYSTEM_NAME>.json". Only the carriers written in Python are loaded otherwise. '
+                                'Can be repeated. See specs.')
+    arguments.add_argument('--processes', type=int, metavar='COUNT',
+                           help='Parse the pages in this many other processes. 0 uses one per core.')
+    options = arguments.parse_args()
+    logging.basicConfig(level=options.log_level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    for directory in options.specs or []:
+        specs.registry.add_directory(directory)
+
+    if options.command == 'serve':
+        from server import serve
+        serve(options.host, options.port, options.eager, options.refresh, options.snapshot, options.metrics,
+              options.processes)
+    else:
+        run(options.processes)
 
 
 if __name__ == '__main__':
-    run()
+    main()
@@ -0,0 +1,156 @@
+"""
+Counters and timings of the scrape pipeline, to see where the time goes under load.
+They are off by default: set FetchData.metrics to a Metrics to turn them on. Until then, each stage only checks
+that it is None, and the policies are read without any timing at all.
+Everything recorded can be exported in the Prometheus text format, and is served on GET /metrics.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Mapping, Tuple
+
+# The labels of a sample, as sorted (name, value) pairs.
+Labels = Tuple[Tuple[str, str], ...]
+
+# A sample, as its metric name and its labels.
+Key = Tuple[str, Labels]
+
+# What each metric measures. Counters end in "_total". The others are summaries: a count and a sum.
+DESCRIPTIONS: Mapping[str, str] = {
+    'http_request_seconds': 'Time spent downloading pages, by host.',
+    'downloaded_bytes_total': 'Bytes of pages downloaded, by host.',
+    'cache_hits_total': 'Pages served from the page cache without asking the carrier, by host.',
+    'parse_seconds': 'Time spent parsing pages into trees, by parser.',
+    'xpath_seconds': 'Time spent evaluating the XPath of each policy field, by carrier and field.',
+    'conversion_seconds': 'Time spent converting the texts of policy pages into values, by carrier.',
+    'policies_total': 'Policies read, by carrier.',
+    'pages_per_customer': 'Pages read for each scraped customer, by carrier.',
+    'scrape_seconds': 'Time spent scraping each customer, end to end, by carrier.',
+    'scrape_failures_total': 'Scrapes of a customer that failed, by carrier.',
+    'unchanged_pages_total': 'Pages not parsed again because their content had not changed, by carrier.',
+    'unchanged_policies_total': 'Policies not read again because their HTML had not changed, by carrier.',
+    'policy_changes_total': 'Policies added, removed or modified by scraping customers again, by carrier and kind.',
+}
+
+
+def labels_of(labels: Mapping[str, object]) -> Labels:
+    """
+    The labels of a sample, in a set order, so that the same labels always make the same key.
+    """
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def escape(value: str) -> str:
+    """
+    A label value as the Prometheus text format writes it.
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """
+    Counters and summaries, by metric name and labels.
+    Every method is thread-safe.
+    """
+
+    def __init__(self, prefix: str = 'adapt'):
+        """
+        :param prefix: What the name of every exported metric starts with.
+        """
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters: Dict[Key, float] = defaultdict(float)
+        # The count and the sum of the observations of each summary.
+        self.summaries: Dict[Key, List[float]] = defaultdict(lambda: [0, 0.0])
+
+    def count(self, name: str, value: float = 1, **labels):
+        """
+        Add to a counter.
+        """
+        key = (name, labels_of(labels))
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Record an observation of a summary, like a duration in seconds.
+        """
+        key = (name, labels_of(labels))
+        with self.lock:
+            summary = self.summaries[key]
+            summary[0] += 1
+            summary[1] += value
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """
+        Time a block, and record its duration in a summary, even if it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def samples(self) -> Tuple[Dict[Key, float], Dict[Key, List[float]]]:
+        """
+        A copy of everything recorded, as plain values, so that it can be sent from another process.
+        :return: The counters and the summaries.
+        """
+        with self.lock:
+            return dict(self.counters), {key: list(summary) for key, summary in self.summaries.items()}
+
+    def merge(self, samples: Tuple[Dict[Key, float], Dict[Key, List[float]]]):
+        """
+        Add what was recorded elsewhere, as given by "samples".
+        """
+        counters, summaries = samples
+        with self.lock:
+            for key, value in counters.items():
+                self.counters[key] += value
+            for key, (count, total) in summaries.items():
+                summary = self.summaries[key]
+                summary[0] += count
+                summary[1] += total
+
+    def reset(self):
+        """
+        Forget everything recorded.
+        """
+        with self.lock:
+            self.counters.clear()
+            self.summaries.clear()
+
+    def export(self) -> str:
+        """
+        Everything recorded, in the Prometheus text format.
+        """
+        counters, summaries = self.samples()
+        lines = []
+        for name in sorted({name for name, _ in counters} | {name for name, _ in summaries}):
+            full_name = f'{self.prefix}_{name}'
+            if name in DESCRIPTIONS:
+                lines.append(f'# HELP {full_name} {DESCRIPTIONS[name]}')
+            if name.endswith('_total'):
+                lines.append(f'# TYPE {full_name} counter')
+                for (sample_name, labels), value in sorted(counters.items()):
+                    if sample_name == name:
+                        lines.append(f'{full_name}{self.format_labels(labels)} {value:g}')
+            else:
+                lines.append(f'# TYPE {full_name} summary')
+                for (sample_name, labels), (count, total) in sorted(summaries.items()):
+                    if sample_name == name:
+                        lines.append(f'{full_name}_count{self.format_labels(labels)} {count:g}')
+                        lines.append(f'{full_name}_sum{self.format_labels(labels)} {total:.9g}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def format_labels(labels: Labels) -> str:
+        """
+        The labels of a sample as the Prometheus text format writes them.
+        """
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
@@ -2,12 +2,12 @@ import lxml.html
 from carrier import Carrier, Policy
 from decimal import *
 from customtypes import PolicyFields, Status, Agent, Customer, IndexedXpath
-from typing import ClassVar, Mapping, List, Optional, Callable, Generator, Type
+from typing import ClassVar, Mapping, List, Callable, Generator, Type
 from datetime import date
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class MockPolicy(Policy):
     """
     Information and details about a single policy.
@@ -59,18 +59,17 @@ class Mock(Carrier):
     Every policy is one a single page for one client.
     """
 
-    def __init__(self):
-        self.policy_elements: Mapping[int, lxml.html.HtmlElement] = {}
-
     name = "Mock Indemnity"
 
     system_name = "MOCK_INDEMNITY"
 
     policy_type = MockPolicy
 
-    tree: Optional[lxml.html.HtmlElement] = None
+    URI_TEMPLATE = 'https://scraping-interview.onrender.com/mock_indemnity/{customer_id}'
+
+    DEFAULT_CUSTOMER = 'a0dfjw9a'
 
-    URI = 'https://scraping-interview.onrender.com/mock_indemnity/a0dfjw9a'
+    URI = URI_TEMPLATE.format(customer_id=DEFAULT_CUSTOMER)
 
     POLICIES = '//li[@class="list-group-item"]'
 
@@ -93,11 +92,9 @@ class Mock(Carrier):
     }
 
     @classmethod
-    def fetch_policies(cls,  policy: lxml.html.HtmlElement, _) -> Generator[Type[Policy], None, None]:
-        for xml_object in Carrier.fetch_policies(policy, cls.POLICIES):
-            placeholder_object = cls.fetch_policy(xml_object)
-            yield placeholder_object
+    def fetch_policies(cls,  policy: lxml.html.HtmlElement, _=None, session=None) -> Generator[Type[Policy], None, None]:
+        yield from cls.fetch_page(policy, None if session is None else session.metrics)
 
     @classmethod
     def fetch_policy(cls, tree: lxml.html.HtmlElement, _=None):
-        return Carrier.fetch_policy(tree, MockPolicy)
+        return super().fetch_policy(tree, MockPolicy)
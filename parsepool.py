@@ -0,0 +1,199 @@
+"""
+The parsing of the downloaded pages, in other processes.
+Parsing a page and reading its policies is CPU work that holds the GIL, so however many threads download pages,
+they only ever parse on one core between them. With a ParsePool, the threads only download: each raw page is
+handed over to a worker process, which sends back plain tuples of values. Those are small to send, and cheap to
+turn into customers, agents and policies, so scraping many customers scales with the number of cores.
+A worker sends the link to the next page back as soon as the page is parsed, before it reads the policies, so the
+next page can download while they are read.
+"""
+
+import importlib
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Type, List, Mapping
+
+import specs
+from carrier import Carrier
+from customtypes import Agent, Customer
+from metrics import Metrics
+from parsers import get_parser
+from specs import CarrierRegistry, SpecCarrier
+
+logger = logging.getLogger(__name__)
+
+# What a worker makes of a page: the values of the customer and of the agent, only for the first page of a
+# customer, the values of each policy, in the order of the policy type's fields, and the link to the next page.
+# "metrics" has the samples of the time spent on the page, if they were asked for. See Metrics.samples.
+ParsedPage = namedtuple('ParsedPage', ['customer', 'agent', 'policies', 'next_page', 'metrics'])
+
+# Where a worker sends the link to the next page of each page it parses, with the number of its task.
+links: Optional[multiprocessing.Queue] = None
+
+
+def load_carriers(modules: Iterable[str], spec_paths: Iterable[str], directories: List[str],
+                  builtin: Mapping[str, str], link_queue: Optional[multiprocessing.Queue] = None):
+    """
+    Load the carriers in a worker, so that they can be found by their system names.
+    :param modules: The modules of the carriers written in Python to import now.
+    :param spec_paths: The specs of the carriers to compile now.
+    :param directories: Where the worker's registry finds the other specs, on first use. See specs.registry.
+    :param builtin: The modules of the other carriers written in Python, by system name.
+    :param link_queue: Where to send the links to the next pages, as soon as they are known.
+    """
+    global links
+    for module in modules:
+        importlib.import_module(module)
+    for path in spec_paths:
+        specs.load(path)
+    specs.registry = CarrierRegistry(directories, builtin)
+    links = link_queue
+
+
+def parse_page(system_name: str, body: bytes, encoding: str, first: bool, measure: bool,
+               task: Optional[int] = None, uri: Optional[str] = None) -> ParsedPage:
+    """
+    Parse a page of a carrier and read everything on it. This runs in a worker process.
+    :param system_name: The system name of the carrier.
+    :param body: The page, as downloaded.
+    :param encoding: The encoding of the page.
+    :param first: Whether this is the first page of a customer, which has the customer and the agent.
+    :param measure: Whether to time the parsing and the reading of the page.
+    :param task: If given, the link to the next page is sent to "links" with this number before the policies
+                 are read.
+    :param uri: The address of the page, which relative links are resolved against.
+    :return: The values read from the page.
+    """
+    carrier = specs.named(system_name)
+    metrics = Metrics() if measure else None
+    source = body.decode(encoding)
+    if metrics is None:
+        tree = get_parser(carrier.parser)(source)
+    else:
+        with metrics.timer('parse_seconds', parser=carrier.parser):
+            tree = get_parser(carrier.parser)(source)
+    next_page = carrier.change_page(tree, uri)
+    if task is not None and links is not None:
+        links.put((task, next_page))
+    customer = agent = None
+    if first:
+        customer = tuple(carrier.unique_values(Customer, 'customer', tree))
+        agent = tuple(carrier.unique_values(Agent, 'agent', tree))
+    policies = [tuple(values) for values in carrier.page_rows(tree, metrics)]
+    return ParsedPage(customer, agent, policies, next_page, None if metrics is None else metrics.samples())
+
+
+class ParsePool:
+    """
+    Worker processes that parse the pages of the given carriers.
+    Any number of threads can use it at once: each waits for its own page while the others are parsed.
+    Stop it with shutdown, or use it as a context manager.
+    """
+
+    def __init__(self, carriers: Iterable[Type[Carrier]] = (), max_workers: Optional[int] = None,
+                 registry: Optional[CarrierRegistry] = None):
+        """
+        :param carriers: Carriers whose pages will be parsed, loaded in the workers as they start.
+        :param max_workers: How many processes parse at once. By default, one per core.
+        :param registry: Where the workers find the other carriers, when they first parse one of their pages.
+                         By default, specs.registry.
+        """
+        registry = specs.registry if registry is None else registry
+        carriers = list(carriers)
+        modules = sorted({carrier.__module__ for carrier in carriers if not issubclass(carrier, SpecCarrier)})
+        spec_paths = sorted({carrier.spec_path for carrier in carriers
+                             if issubclass(carrier, SpecCarrier) and carrier.spec_path is not None})
+        self.links = multiprocessing.Queue()
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers or os.cpu_count(), initializer=load_carriers,
+            initargs=(modules, spec_paths, list(registry.directories), dict(registry.modules), self.links))
+        # What to call with the link to the next page, by the number of the task that parses the page.
+        self.waiting: Dict[int, Callable[[Optional[str]], None]] = {}
+        self.tasks = itertools.count()
+        self.lock = threading.Lock()
+        self.listener = threading.Thread(target=self.listen, name='parse-pool-links', daemon=True)
+        self.listener.start()
+
+    def __enter__(self) -> 'ParsePool':
+        return self
+
+    def __exit__(self, *_):
+        self.shutdown()
+
+    def submit(self, carrier: Type[Carrier], body: bytes, encoding: str = 'utf-8', first: bool = False,
+               measure: bool = False, on_link: Optional[Callable[[Optional[str]], None]] = None,
+               uri: Optional[str] = None) -> Future:
+        """
+        Parse a page in a worker.
+        :param carrier: The carrier of the page.
+        :param body: The page, as downloaded.
+        :param encoding: The encoding of the page.
+        :param first: Whether this is the first page of a customer, which has the customer and the agent.
+        :param measure: Whether to time the parsing and the reading of the page, in the worker.
+        :param on_link: Called with the link to the next page, or None if it is the last, as soon as the worker
+                        has parsed the page. It runs in a thread of the pool, so it should return quickly.
+        :param uri: The address of the page, which relative links are resolved against.
+        :return: The future of the values read from the page.
+        """
+        task = None
+        if on_link is not None:
+            task = next(self.tasks)
+            with self.lock:
+                self.waiting[task] = on_link
+        future = self.executor.submit(parse_page, carrier.system_name, body, encoding, first, measure, task, uri)
+        if task is not None:
+            def done(parsed: Future):
+                # A page that was parsed always sends its link, if only after its values. One that failed may not.
+                if parsed.cancelled() or parsed.exception() is not None:
+                    self.forget(task)
+
+            future.add_done_callback(done)
+        return future
+
+    def parse(self, carrier: Type[Carrier], body: bytes, encoding: str = 'utf-8', first: bool = False,
+              measure: bool = False, uri: Optional[str] = None) -> ParsedPage:
+        """
+        Parse a page in a worker, and wait for it. See submit.
+        :return: The values read from the page.
+        """
+        return self.submit(carrier, body, encoding, first, measure, uri=uri).result()
+
+    def forget(self, task: int):
+        """
+        Stop waiting for the link of a task.
+        """
+        with self.lock:
+            self.waiting.pop(task, None)
+
+    def listen(self):
+        """
+        Hand each link the workers send to the callback of its task, until the pool is shut down.
+        """
+        while True:
+            message = self.links.get()
+            if message is None:
+                return
+            task, link = message
+            with self.lock:
+                on_link = self.waiting.pop(task, None)
+            if on_link is None:
+                continue
+            try:
+                on_link(link)
+            except Exception:
+                logger.exception('Could not follow the link to %s.', link)
+
+    def shutdown(self):
+        """
+        Stop the workers.
+        """
+        self.executor.shutdown(cancel_futures=True)
+        if self.listener.is_alive():
+            self.links.put(None)
+            self.listener.join()
+        self.links.close()
@@ -0,0 +1,97 @@
+"""
+The ways a downloaded page can be turned into a searchable XML tree.
+Each carrier picks one by name with its "parser" attribute.
+"""
+
+from typing import Callable, Mapping
+
+import lxml.etree
+import lxml.html
+from lxml.html import soupparser
+
+# The libxml2 errors after which lxml's own recovery is not trusted, and BeautifulSoup is used instead.
+MALFORMED_ERRORS = frozenset([
+    'ERR_DOCUMENT_EMPTY',
+    'ERR_DOCUMENT_END',
+    'ERR_TAG_NAME_MISMATCH',
+    'ERR_TAG_NOT_FINISHED',
+])
+
+
+def native_parse(source: str) -> lxml.html.HtmlElement:
+    """
+    Parse a page with lxml's own HTML parser. This is the fast path.
+    :param source: The HTML text of the page.
+    :return: The root of the page.
+    """
+    return lxml.html.document_fromstring(source)
+
+
+def soup_parse(source: str) -> lxml.html.HtmlElement:
+    """
+    Parse a page with BeautifulSoup, then convert it to an lxml tree.
+    This is many times slower than the native parser, but copes better with broken markup.
+    :param source: The HTML text of the page.
+    :return: The root of the page.
+    """
+    return soupparser.fromstring(source)
+
+
+def is_malformed(tree: lxml.html.HtmlElement, parser: lxml.html.HTMLParser) -> bool:
+    """
+    Whether the native parser had to guess too much to be trusted with a page.
+    :param tree: What the native parser made of the page.
+    :param parser: The parser that made it, with its error log.
+    :return: True if the page should be parsed again by a more lenient parser.
+    """
+    if tree is None or tree.find('body') is None:
+        return True
+    return any(error.type_name in MALFORMED_ERRORS for error in parser.error_log)
+
+
+def auto_parse(source: str) -> lxml.html.HtmlElement:
+    """
+    Parse a page with the native parser, and only fall back on BeautifulSoup if the page is malformed.
+    :param source: The HTML text of the page.
+    :return: The root of the page.
+    """
+    parser = lxml.html.HTMLParser(collect_ids=False)
+    try:
+        tree = lxml.html.document_fromstring(source, parser=parser)
+    except lxml.etree.ParserError:
+        return soup_parse(source)
+    if is_malformed(tree, parser):
+        return soup_parse(source)
+    return tree
+
+
+def pull_parser(tag: str, encoding: str) -> lxml.etree.HTMLPullParser:
+    """
+    A native parser that is fed a page piece by piece, and reports each element of a tag as soon as it is closed.
+    There is no BeautifulSoup fallback for pages parsed this way.
+    :param tag: The tag of the elements to report.
+    :param encoding: The encoding of the pieces of the page.
+    :return: The parser. Its elements are the same as those of the other parsers.
+    """
+    parser = lxml.etree.HTMLPullParser(events=('end',), tag=tag, encoding=encoding, collect_ids=False)
+    parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+    return parser
+
+
+PARSERS: Mapping[str, Callable[[str], lxml.html.HtmlElement]] = {
+    'native': native_parse,
+    'soup': soup_parse,
+    'auto': auto_parse,
+}
+
+
+def get_parser(name: str) -> Callable[[str], lxml.html.HtmlElement]:
+    """
+    Find a parser by its name.
+    :param name: One of the keys of PARSERS.
+    :return: The parsing function.
+    """
+    try:
+        return PARSERS[name]
+    except KeyError:
+        raise ValueError(f'Unknown parser: "{name}". Use one of: {", ".join(PARSERS)}.') from None
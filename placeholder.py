@@ -1,13 +1,16 @@
 from carrier import Carrier, Policy
 from decimal import *
-from customtypes import PolicyFields, Status, Agent, Customer, IndexedXpath
-from typing import ClassVar, Mapping, List, Callable, Generator
+from customtypes import PolicyFields, Status, Agent, Customer, IndexedXpath, RowLayout
+from typing import ClassVar, Mapping, List, Callable, Generator, Optional, Iterable
 from datetime import date
+import queue
+import threading
 import lxml.html
 from dataclasses import dataclass
+from xpaths import compile_xpath
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PlaceholderPolicy(Policy):
     """
     Information and details about a single policy.
@@ -61,6 +64,24 @@ class PlaceholderPolicy(Policy):
             IndexedXpath('substring((.//td[@class="details-row"]/div/text())[3], 20)', 0),
     }
 
+    # The same fields as policy_xpath, read in a single pass over the row and its details.
+    row_layout: ClassVar[RowLayout] = RowLayout(
+        cell_tag='td',
+        columns={
+            PolicyFields.Id: 0,
+            PolicyFields.Premium: 1,
+            PolicyFields.Status: 2,
+            PolicyFields.EffectiveDate: 3,
+            PolicyFields.TerminationDate: 4,
+        },
+        line_tag='div',
+        line_prefixes={
+            PolicyFields.LastPaymentDate: 'Last Payment Date',
+            PolicyFields.CommissionRate: 'Commission Rate',
+            PolicyFields.NumberOfInsured: 'Number of Insureds',
+        },
+    )
+
 
 class Placeholder(Carrier):
     """
@@ -73,12 +94,26 @@ class Placeholder(Carrier):
 
     system_name = 'PLACEHOLDER_CARRIER'
 
-    URI = 'https://scraping-interview.onrender.com/placeholder_carrier/f02dkl4e/policies/1'
+    URI_TEMPLATE = 'https://scraping-interview.onrender.com/placeholder_carrier/{customer_id}/policies/1'
+
+    DEFAULT_CUSTOMER = 'f02dkl4e'
+
+    URI = URI_TEMPLATE.format(customer_id=DEFAULT_CUSTOMER)
 
     POLICIES = '//tr[contains(@class, "policy-info-row")]'
 
     policy_type = PlaceholderPolicy
 
+    # The row under a policy row, that holds its details.
+    DETAILS = compile_xpath('following-sibling::tr[1]', 'Placeholder.DETAILS')
+
+    # The link to the next page of policies.
+    NEXT_PAGE = compile_xpath('//tfoot//a[contains(., "Next")]/@href', 'Placeholder.NEXT_PAGE')
+
+    # How many downloaded pages may wait while the policies of another are being parsed. One more page may be
+    # downloading meanwhile, so the downloads run up to prefetch_pages + 1 pages ahead of the parsing.
+    prefetch_pages = 2
+
     agent_xpath: Mapping[Agent.Fields, IndexedXpath] = {
         Agent.Fields.Name:
             IndexedXpath('//label[@for="name"]/following-sibling::span/text()', 0),
@@ -122,52 +157,133 @@ class Placeholder(Carrier):
         :param node: The address of the XML on the current page.
         :return: A reference to the XML object on the current page.
         """
-        for policy in node.xpath(cls.POLICIES):
-            details = policy.xpath('following-sibling::tr')
+        for policy in cls.compiled_policies(node):
+            details = cls.DETAILS(policy)
             parent = lxml.html.HtmlElement('div')
             parent.insert(0, details[0])
             parent.insert(0, policy)
             yield parent
-        for page in cls.change_page(node):
-            yield page
 
     @classmethod
-    def change_page(cls, node: lxml.html.HtmlElement) -> Generator[lxml.html.HtmlElement, None, None]:
+    def policy_elements(cls, tree: lxml.html.HtmlElement) -> Iterable[lxml.html.HtmlElement]:
+        """
+        Each policy row comes with the row of its details. See fetch_on_this_page.
+        """
+        return cls.fetch_on_this_page(tree)
+
+    @classmethod
+    def stream_policy(cls, element: lxml.html.HtmlElement) -> Optional[lxml.html.HtmlElement]:
+        """
+        A policy is only complete once the row of its details has been read.
+        :param element: A row that has just been read.
+        :return: The policy row and its details, as fetch_on_this_page builds them, or None.
+        """
+        policy = element.getprevious()
+        if policy is None or not cls.compiled_stream(policy):
+            return None
+        parent = lxml.html.HtmlElement('div')
+        parent.insert(0, element)
+        parent.insert(0, policy)
+        return parent
+
+    @classmethod
+    def change_page(cls, node: lxml.html.HtmlElement, uri: Optional[str] = None) -> Optional[str]:
         """
         Find the address of the next page on the current page, if there is one.
+        The links are always from the root of the site, so the address of the current page is not needed.
         :param node: The XML object of the current page.
-        :return: The XML object of the next page.
+        :param uri: The address of the current page.
+        :return: The full link to the next page, or None on the last page.
         """
-        next_link = node.xpath('//tfoot//a[contains(., "Next")]/@href')
+        next_link = cls.NEXT_PAGE(node)
         if len(next_link) == 0:
-            return
-        next_link = cls.host() + next_link[0]
-        for page in cls.get_next_page(next_link):
-            yield page
+            return None
+        return cls.host() + next_link[0]
 
     @classmethod
-    def get_next_page(cls, link: str) -> Generator[lxml.html.HtmlElement, None, None]:
+    def get_next_page(cls, link: str) -> lxml.html.HtmlElement:
         """
         Download the next page and product its XML object from a given link.
         :param link: The link to the next page.
         :return: The XML object to the next page.
         """
         from fetchdata import FetchData
-        next_page = FetchData.uri_to_xpath(link)
-        cls.tree = next_page
-        for policy in cls.fetch_policies(next_page, None):
-            yield policy
+        return FetchData.uri_to_xpath(link, cls.parser, cls.cache_ttl)
+
+    @classmethod
+    def prefetch(cls, link: Optional[str], pages: queue.Queue, stop: threading.Event):
+        """
+        Download the pages one after the other, starting at the given link, and put them in the queue.
+        The link to the following page is read as soon as a page arrives, so the download of the next
+        page does not wait for the policies of the current one to be parsed.
+        The queue receives each page with its link, then None after the last page, or the exception that
+        stopped the downloads.
+        :param link: The link to the first page to download.
+        :param pages: Where the downloaded pages are put, in order. Its size bounds how far ahead this goes.
+        :param stop: Set by the reader when it no longer wants any page.
+        """
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            while link is not None:
+                page = cls.get_next_page(link)
+                next_link = cls.change_page(page, link)
+                if not put((link, page)):
+                    return
+                link = next_link
+        except Exception as error:
+            put(error)
+            return
+        put(None)
 
     @classmethod
-    def fetch_policies(cls, tree: lxml.html.HtmlElement, _=None) -> Generator[Policy, None, None]:
-        if tree is not None:
-            policies = cls.fetch_on_this_page(tree)
-            for policy in policies:
-                if isinstance(policy, PlaceholderPolicy):
-                    yield policy
-                else:
-                    yield cls.fetch_policy(policy)
+    def pages(cls, tree: lxml.html.HtmlElement, session=None) -> Generator[lxml.html.HtmlElement, None, None]:
+        """
+        Every page of policies, starting with the given one.
+        The following pages are downloaded in the background: up to "prefetch_pages" of them wait to be read,
+        and one more may be downloading, so the downloads run up to prefetch_pages + 1 pages ahead.
+        This is for the scrapes that read the policies from the tree. Those that go through the page memo or the
+        parsing processes download the next page ahead in FetchData.fetch_pages.
+        :param tree: The XML object of the first page.
+        :param session: The scrape these pages are for. Each page is recorded in it as it is read.
+        :return: The XML object of each page, in order.
+        """
+        yield tree
+        link = cls.change_page(tree, None if session is None else session.page_uri)
+        if link is None:
+            return
+        pages = queue.Queue(maxsize=max(1, cls.prefetch_pages))
+        stop = threading.Event()
+        threading.Thread(target=cls.prefetch, args=(link, pages, stop), daemon=True).start()
+        try:
+            while True:
+                item = pages.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                link, page = item
+                if session is not None:
+                    session.turn_page(page, link)
+                yield page
+        finally:
+            stop.set()
+
+    @classmethod
+    def fetch_policies(cls, tree: lxml.html.HtmlElement, _=None, session=None) -> Generator[Policy, None, None]:
+        if tree is None:
+            return
+        metrics = None if session is None else session.metrics
+        for page in cls.pages(tree, session):
+            yield from cls.fetch_page(page, metrics)
 
     @classmethod
     def fetch_policy(cls, tree: lxml.html.HtmlElement, _=None):
-        return Carrier.fetch_policy(tree, PlaceholderPolicy)
+        return super().fetch_policy(tree, PlaceholderPolicy)
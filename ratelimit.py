@@ -0,0 +1,251 @@
+"""
+Limits on how hard each carrier host is hit.
+Each host gets a token bucket, which bounds the rate at which requests start, and a limit on the requests in
+flight that adapts to how the host copes: it grows by a little after each request that goes well, and is cut
+by a fraction when the host throttles, fails, or slows down, like TCP's congestion window. So each host is
+scraped as fast as it tolerates, and backed off from as soon as it does not.
+"""
+
+import threading
+import time
+import urllib.error
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlsplit
+
+# How hard a host may be hit. Each carrier sets its own, as "host_limits".
+# "rate" is how many requests may start per second, on average, and "burst" how many may start at once after
+# a quiet time. A rate of None does not limit it. "min_interval" is the shortest time between two starts.
+# "concurrency" is how many requests may be in flight at first. It stays within "min_concurrency" and
+# "max_concurrency", grows by "increase" over each round of requests that go well, and is multiplied by
+# "decrease" when the host is overloaded. The host is taken as overloaded when it answers 429 or 503, fails to
+# answer, or when its latency grows past "latency_tolerance" times the lowest seen. None ignores the latency.
+HostLimits = namedtuple('HostLimits', ['rate', 'burst', 'min_interval', 'concurrency', 'min_concurrency',
+                                       'max_concurrency', 'increase', 'decrease', 'latency_tolerance'],
+                        defaults=[None, 5, 0.0, 4, 1, 16, 1.0, 0.5, 2.0])
+
+# The statuses that tell a host is overloaded.
+OVERLOAD_STATUSES = frozenset([429, 503])
+
+# How much each new latency counts in the smoothed latency, and how fast the lowest latency seen drifts up
+# towards the latest ones, so that a host that has become slower for good is not backed off from forever.
+SMOOTHING = 0.2
+BASELINE_DRIFT = 0.001
+
+# How much, in seconds, the latency must grow over the lowest seen before it counts as a sign of load.
+# Below that, it is only noise.
+LATENCY_SLACK = 0.05
+
+
+def strictest(first: HostLimits, second: HostLimits) -> HostLimits:
+    """
+    The limits that respect both of two sets of limits, for carriers that share a host.
+    """
+    def lowest(a, b):
+        return b if a is None else a if b is None else min(a, b)
+
+    return HostLimits(
+        rate=lowest(first.rate, second.rate),
+        burst=min(first.burst, second.burst),
+        min_interval=max(first.min_interval, second.min_interval),
+        concurrency=min(first.concurrency, second.concurrency),
+        min_concurrency=min(first.min_concurrency, second.min_concurrency),
+        max_concurrency=min(first.max_concurrency, second.max_concurrency),
+        increase=min(first.increase, second.increase),
+        decrease=min(first.decrease, second.decrease),
+        latency_tolerance=lowest(first.latency_tolerance, second.latency_tolerance),
+    )
+
+
+def is_overload(error: BaseException) -> bool:
+    """
+    Whether a failed request tells that its host is overloaded: it was throttled, or it could not answer.
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in OVERLOAD_STATUSES
+    return isinstance(error, OSError)
+
+
+class HostState:
+    """
+    The limits of one host, and how much of them is in use.
+    """
+
+    def __init__(self, limits: HostLimits):
+        self.limits = limits
+        self.condition = threading.Condition()
+        # How many requests may be in flight now, and how many are.
+        self.limit = float(limits.concurrency)
+        self.in_flight = 0
+        # The token bucket. The tokens can go below zero: each request takes one as it is let through, and
+        # waits until it would have been refilled.
+        self.tokens = float(limits.burst)
+        self.refilled = time.monotonic()
+        self.next_start = 0.0
+        # The smoothed latency, the lowest latency seen, and when the limit was last cut.
+        self.latency: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self.last_decrease = 0.0
+
+    def acquire(self) -> float:
+        """
+        Wait for a place among the requests in flight, and take a token.
+        :return: When the request may start, on the monotonic clock.
+        """
+        limits = self.limits
+        with self.condition:
+            while self.in_flight >= max(int(self.limit), limits.min_concurrency):
+                self.condition.wait()
+            self.in_flight += 1
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            if limits.rate is not None:
+                self.tokens = min(limits.burst, self.tokens + (now - self.refilled) * limits.rate)
+                self.refilled = now
+                self.tokens -= 1
+                if self.tokens < 0:
+                    start = max(start, now - self.tokens / limits.rate)
+            self.next_start = start + limits.min_interval
+            return start
+
+    def release(self, started: float, latency: float, overloaded: bool, succeeded: bool = True):
+        """
+        Give back the place of a finished request, and adapt the limit to how it went.
+        :param started: When the request started, on the monotonic clock.
+        :param latency: How long the request took, in seconds.
+        :param overloaded: Whether the host was overloaded.
+        :param succeeded: Whether the request was answered. One that failed for another reason than the host's
+                          load tells nothing about it, and leaves the limit as it is.
+        """
+        limits = self.limits
+        with self.condition:
+            self.in_flight -= 1
+            # The requests that started before the limit was last cut only tell what was already known.
+            if started >= self.last_decrease and (succeeded or overloaded):
+                if not overloaded:
+                    self.latency = latency if self.latency is None else \
+                        self.latency + (latency - self.latency) * SMOOTHING
+                    self.baseline = latency if self.baseline is None else \
+                        min(latency, self.baseline + (latency - self.baseline) * BASELINE_DRIFT)
+                    overloaded = limits.latency_tolerance is not None and self.latency > max(
+                        self.baseline * limits.latency_tolerance, self.baseline + LATENCY_SLACK)
+                if overloaded:
+                    self.limit = max(limits.min_concurrency, self.limit * limits.decrease)
+                    self.last_decrease = time.monotonic()
+                    self.latency = None
+                else:
+                    self.limit = min(limits.max_concurrency, self.limit + limits.increase / self.limit)
+            self.condition.notify_all()
+
+    def reconfigure(self, limits: HostLimits):
+        """
+        Apply new limits, keeping what was learnt of the host.
+        """
+        with self.condition:
+            self.limits = limits
+            self.limit = min(max(self.limit, limits.min_concurrency), limits.max_concurrency)
+            self.tokens = min(self.tokens, limits.burst)
+            self.condition.notify_all()
+
+
+class Slot:
+    """
+    The place of a request among those in flight to its host. See HostLimiter.slot.
+    """
+
+    __slots__ = ['overloaded']
+
+    def __init__(self):
+        self.overloaded = False
+
+    def overload(self):
+        """
+        Report that the host answered that it is overloaded, without raising.
+        """
+        self.overloaded = True
+
+
+class HostLimiter:
+    """
+    Bounds the requests to each host: how many are in flight, and how fast they start.
+    """
+
+    def __init__(self, max_concurrent: int = 4, min_interval: float = 0.0, limits: Optional[HostLimits] = None):
+        """
+        :param max_concurrent: How many requests may be in flight to a host at first, unless it is configured.
+        :param min_interval: The shortest time between the start of two requests to a host, in seconds, unless
+                             it is configured.
+        :param limits: All the limits of the hosts that are not configured. Wins over the other arguments.
+        """
+        self.limits = limits or HostLimits(concurrency=max_concurrent, min_interval=min_interval,
+                                           max_concurrency=max(max_concurrent, HostLimits().max_concurrency))
+        self.configured: Dict[str, HostLimits] = {}
+        self.hosts: Dict[str, HostState] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def host(uri: str) -> str:
+        """
+        The host part of a URI, which the limits apply to.
+        """
+        return urlsplit(uri).netloc
+
+    def configure(self, uri: str, limits: HostLimits):
+        """
+        Set the limits of the host of a URI. A host that is configured several times, by carriers that share it,
+        gets the strictest of its limits.
+        :param uri: Any URI of the host.
+        :param limits: The limits of the host.
+        """
+        host = self.host(uri)
+        with self.lock:
+            configured = self.configured.get(host)
+            if configured is not None:
+                limits = strictest(configured, limits)
+            if limits == configured:
+                return
+            self.configured[host] = limits
+            state = self.hosts.get(host)
+        if state is not None:
+            state.reconfigure(limits)
+
+    def state(self, host: str) -> HostState:
+        """
+        The limits of a host, created on first use.
+        """
+        with self.lock:
+            state = self.hosts.get(host)
+            if state is None:
+                state = self.hosts[host] = HostState(self.configured.get(host, self.limits))
+            return state
+
+    def concurrency(self, uri: str) -> float:
+        """
+        How many requests may be in flight to the host of a URI right now.
+        """
+        return self.state(self.host(uri)).limit
+
+    @contextmanager
+    def slot(self, uri: str) -> Iterator[Slot]:
+        """
+        Wait until a request to this URI is allowed, and hold its place while it runs.
+        How long it runs, and whether it fails, adapts the limit of the host. An answer that tells the host is
+        overloaded but does not raise is reported with the overload method of the slot. A request that raises
+        anything else than a sign of overload leaves the limit as it is.
+        :param uri: The URI about to be requested.
+        """
+        state = self.state(self.host(uri))
+        start = state.acquire()
+        slot = Slot()
+        started = start
+        try:
+            wait = start - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            started = time.monotonic()
+            yield slot
+        except BaseException as error:
+            state.release(started, time.monotonic() - started, is_overload(error), succeeded=False)
+            raise
+        state.release(started, time.monotonic() - started, slot.overloaded)
@@ -0,0 +1,192 @@
+"""
+Answers spliced together from customers encoded ahead of time.
+A stored customer only changes when a scrape of it completes, and each of these gives it a new version. The
+JSON of a customer is encoded once per version, and compressed once per version when it is asked for gzipped.
+An answer is then mostly cached bytes put end to end.
+"""
+
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
+
+from customtypes import Customer
+from serialize import Serializer
+
+# The start of a gzip stream: deflate, no name, no time, unknown system.
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+# The empty last block that ends a deflate stream.
+LAST_BLOCK = b'\x03\x00'
+
+# The most bytes a stored (uncompressed) deflate block holds.
+MAX_STORED = 0xffff
+
+
+def deflate(data: bytes, level: int) -> bytes:
+    """
+    Compress data into deflate blocks that end on a byte boundary, without a last block.
+    Blocks compressed this way can be put end to end, and followed by others, in a single deflate stream.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def stored(data: bytes) -> bytes:
+    """
+    Data as stored deflate blocks, for the short pieces between the fragments, which are not worth compressing.
+    """
+    blocks = []
+    for start in range(0, len(data), MAX_STORED):
+        chunk = data[start:start + MAX_STORED]
+        blocks.append(b'\x00' + struct.pack('<HH', len(chunk), len(chunk) ^ 0xffff) + chunk)
+    return b''.join(blocks)
+
+
+class Fragment:
+    """
+    The encoded JSON of one version of a customer, and its compressed copy once it has been asked for.
+    """
+
+    __slots__ = ['key', 'body', 'deflated']
+
+    def __init__(self, key: Tuple[int, int], body: bytes):
+        # The version of the customer, and the level it is nested at.
+        self.key = key
+        self.body = body
+        self.deflated: Optional[bytes] = None
+
+    def size(self) -> int:
+        """
+        How many bytes the fragment holds.
+        """
+        return len(self.body) + len(self.deflated or b'')
+
+
+class ResponseCache:
+    """
+    The encoded customers of one Serializer, by version and nesting level, least recently used first.
+    Versions that are replaced by a refresh are not looked up any more, and are evicted in time.
+    """
+
+    def __init__(self, serializer: Serializer, compress_level: int = 6, max_bytes: int = 64 * 1024 * 1024):
+        """
+        :param serializer: How the customers are written.
+        :param compress_level: The zlib compression level of the gzipped answers.
+        :param max_bytes: The most encoded and compressed bytes kept.
+        """
+        self.serializer = serializer
+        self.compress_level = compress_level
+        self.max_bytes = max_bytes
+        self.fragments: 'OrderedDict[Tuple[int, int], Fragment]' = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def fragment(self, value, level: int):
+        """
+        The encoded JSON of a value nested at a given level: a cached Fragment for a stored customer, and
+        plain bytes for anything else.
+        """
+        if not isinstance(value, Customer) or not value.version:
+            return self.serializer.encode_at(value, level).encode('utf-8')
+        key = (value.version, level)
+        with self.lock:
+            fragment = self.fragments.get(key)
+            if fragment is not None:
+                self.fragments.move_to_end(key)
+                return fragment
+        # Encoded outside the lock. Two threads may encode the same version; they get the same bytes.
+        fragment = Fragment(key, self.serializer.encode_at(value, level).encode('utf-8'))
+        with self.lock:
+            self.remember(fragment)
+        return fragment
+
+    def compress(self, fragment: Fragment) -> bytes:
+        """
+        The compressed copy of a fragment, made on first use.
+        """
+        deflated = fragment.deflated
+        if deflated is None:
+            deflated = deflate(fragment.body, self.compress_level)
+            with self.lock:
+                if fragment.deflated is None:
+                    fragment.deflated = deflated
+                    # Only counted while the fragment is cached; an evicted one is already accounted for.
+                    if self.fragments.get(fragment.key) is fragment:
+                        self.bytes += len(deflated)
+                        self.evict()
+        return deflated
+
+    def remember(self, fragment: Fragment):
+        """
+        Keep a fragment, and evict the least recently used ones beyond the size limit.
+        Must be called with the lock held.
+        """
+        previous = self.fragments.pop(fragment.key, None)
+        if previous is not None:
+            self.bytes -= previous.size()
+        if fragment.size() > self.max_bytes:
+            return
+        self.fragments[fragment.key] = fragment
+        self.bytes += fragment.size()
+        self.evict()
+
+    def evict(self):
+        """
+        Drop the least recently used fragments until the cache is within its size limit.
+        Must be called with the lock held.
+        """
+        while self.bytes > self.max_bytes and self.fragments:
+            _, evicted = self.fragments.popitem(last=False)
+            self.bytes -= evicted.size()
+
+    def pieces(self, data, depth: int = 2) -> Iterator:
+        """
+        The pieces of an answer: plain bytes, and the Fragments of the stored customers.
+        :param data: What to answer, usually {carrier: {customerId: customer}}.
+        :param depth: How deep the customers are nested in it.
+        """
+        for piece in self.serializer.iter_encode(data, depth=depth, leaf=self.fragment):
+            yield piece.encode('utf-8') if isinstance(piece, str) else piece
+
+    def encode(self, data, depth: int = 2) -> bytes:
+        """
+        The JSON of an answer, the same as the serializer would write it.
+        """
+        return b''.join(piece if isinstance(piece, bytes) else piece.body for piece in self.pieces(data, depth))
+
+    def encode_gzip(self, data, depth: int = 2) -> bytes:
+        """
+        The JSON of an answer, gzipped.
+        The fragments are compressed once each and put end to end; only the short pieces between them, and the
+        checksum, are worked out for each answer.
+        """
+        blocks: List[bytes] = [GZIP_HEADER]
+        between: List[bytes] = []
+        checksum = 0
+        size = 0
+        for piece in self.pieces(data, depth):
+            body = piece if isinstance(piece, bytes) else piece.body
+            checksum = zlib.crc32(body, checksum)
+            size += len(body)
+            if isinstance(piece, bytes):
+                between.append(piece)
+                continue
+            if between:
+                blocks.append(stored(b''.join(between)))
+                between.clear()
+            blocks.append(self.compress(piece))
+        if between:
+            blocks.append(stored(b''.join(between)))
+        blocks.append(LAST_BLOCK)
+        blocks.append(struct.pack('<II', checksum, size & 0xffffffff))
+        return b''.join(blocks)
+
+    def clear(self):
+        """
+        Forget every fragment.
+        """
+        with self.lock:
+            self.fragments.clear()
+            self.bytes = 0
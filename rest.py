@@ -1,10 +1,19 @@
 import json
-from mock import Mock
-from placeholder import Placeholder
-from fetchdata import FetchData
-from typing import List
-from json import JSONEncoder
-from typing import Mapping, List
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+import specs
+from carrier import Carrier
+from customtypes import Customer
+from fetchdata import FetchData, ScrapeResult
+from parsepool import ParsePool
+from responses import ResponseCache
+from serialize import COMPATIBLE, COMPACT
+from snapshot import SnapshotStore
+from typing import Mapping, List, Optional, Type, Iterable, Tuple, Generator, Iterator
+
+logger = logging.getLogger(__name__)
 
 INPUT: List[Mapping[str, str]] = json.loads("""
 [{
@@ -22,46 +31,317 @@ class MockRestService:
     A mock, very approximate REST service, that will take in the given input and use it to return
     the appropriate JSON after scraping a fresh copy of the data.
     """
-    Carriers = [Mock, Placeholder]
+    # Every carrier, loaded on first use. See specs.CarrierRegistry.
+    Carriers = specs.registry
     Data = {}
 
-    def __init__(self):
-        self.scrape()
+    # The carriers that could not be scraped, and why.
+    Failures = {}
+
+    # The stored customers already encoded, for the indented and the compact JSON.
+    Responses = {False: ResponseCache(COMPATIBLE), True: ResponseCache(COMPACT)}
+
+    # How many carriers may be scraped at the same time.
+    max_workers = 8
+
+    # Keeps the stored customers up to date in the background, if set. See start_refreshing.
+    scheduler = None
+
+    # The customers of the last snapshot that are not loaded yet, and when they were saved. See restore.
+    Unrestored = {}
+    restore_lock = threading.Lock()
+
+    def __init__(self, max_workers: Optional[int] = None, timeout: Optional[float] = None, eager: bool = True,
+                 snapshot: Optional[str] = None, processes: Optional[int] = None):
+        """
+        :param max_workers: How many carriers or customers may be scraped at the same time.
+        :param timeout: The maximum time, in seconds, to wait for the first scrape.
+        :param eager: Scrape every carrier's default customer right away. Otherwise, customers are only
+                      scraped when they are asked for.
+        :param snapshot: A file to save every scraped customer to. If it already has customers, they are
+                         served from it right away, and the first scrape is skipped.
+        :param processes: Parse the pages in this many other processes, so that scraping many customers at once
+                          uses more than one core. 0 uses one per core. By default, the pages are parsed in the
+                          threads that download them.
+        """
+        if max_workers is not None:
+            self.max_workers = max_workers
+        # The parsing processes and the snapshots this service opened, which it closes when it is closed.
+        self.parsers: Optional[ParsePool] = None
+        self.snapshots: Optional[SnapshotStore] = None
+        # The background restore of the last snapshot, and what tells it to stop. See restore.
+        self.restoring: Optional[threading.Thread] = None
+        self.closing = threading.Event()
+        if processes is not None and FetchData.parsers is None:
+            FetchData.parsers = self.parsers = ParsePool(max_workers=processes or None, registry=self.Carriers)
+        if snapshot is not None:
+            FetchData.snapshots = self.snapshots = SnapshotStore(snapshot)
+            if self.restore():
+                eager = False
+        if eager:
+            self.scrape(timeout)
 
-    def scrape(self):
+    def scrape(self, timeout: Optional[float] = None):
         """
         Prepare a mock-database by scraping the web pages.
+        All the carriers are scraped in parallel. A carrier that fails, or that is not done
+        before the timeout, is recorded in "Failures" and does not prevent the others from being stored.
+        :param timeout: The maximum time, in seconds, to wait for all the carriers. None waits forever.
+        """
+        logger.info('Scrape initiated.')
+        fetchers: List[FetchData] = []
+        for system_name in self.Carriers.names():
+            try:
+                fetchers.append(self.fetcher(self.Carriers.carrier(system_name)))
+            except ValueError as error:
+                # A broken spec only fails its own carrier.
+                self.Failures[system_name] = error
+                logger.warning('Loading %s failed: %s', system_name, error)
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(fetchers))))
+        futures = {executor.submit(fetcher.fetch_my_carrier): fetcher for fetcher in fetchers}
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                fetcher = futures[future]
+                try:
+                    future.result()
+                except Exception as error:
+                    self.Failures[fetcher.carrier.system_name] = error
+                    logger.warning('Scraping %s failed: %r', fetcher.carrier.name, error)
+                    continue
+                self.Data[fetcher.carrier.system_name] = fetcher
+                self.Failures.pop(fetcher.carrier.system_name, None)
+        except FuturesTimeout as error:
+            for future, fetcher in futures.items():
+                if not future.done():
+                    self.Failures[fetcher.carrier.system_name] = error
+                    logger.warning('Scraping %s timed out.', fetcher.carrier.name)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        logger.info('Scrape complete.')
+
+    @classmethod
+    def carrier(cls, system_name: str) -> Type[Carrier]:
+        """
+        Find a carrier by its system name.
+        :param system_name: The name used for the carrier in the requests, like "MOCK_INDEMNITY".
+        :return: The carrier class.
+        """
+        return cls.Carriers.carrier(system_name)
+
+    def fetcher(self, carrier: Type[Carrier]) -> FetchData:
+        """
+        The store of a carrier's data, created on first use.
+        """
+        fetcher = self.Data.get(carrier.system_name)
+        if fetcher is None:
+            fetcher = self.Data.setdefault(carrier.system_name, FetchData(carrier))
+        return fetcher
+
+    def lookup(self, system_name: str, customer_id: str) -> Optional[Customer]:
+        """
+        Find a customer that has already been scraped.
+        Only a customer of the last snapshot that is not loaded yet is read from the disk, and that may wait for
+        the background restore. The others are found in memory, without waiting on anything.
+        :return: The customer, or None if it has not been scraped.
+        """
+        # A restored customer is stored before it leaves Unrestored, so it is always found one way or the other.
+        if (system_name, customer_id) in self.Unrestored:
+            return self.restore_customer(system_name, customer_id)
+        fetcher = self.Data.get(system_name)
+        return None if fetcher is None else fetcher.customers.get(customer_id)
+
+    def restore(self) -> int:
+        """
+        Serve the customers of the last snapshot. Only the list of them is read now. Each one is loaded when it
+        is first looked up, and the others are loaded in a background thread.
+        :return: How many customers the snapshot has.
+        """
+        saved = FetchData.snapshots.keys()
+        known = set(self.Carriers.names())
+        with self.restore_lock:
+            self.Unrestored.update((key, stored) for key, stored in saved.items() if key[0] in known)
+        self.restoring = threading.Thread(target=self.restore_all, name='snapshot-restore', daemon=True)
+        self.restoring.start()
+        return len(saved)
+
+    def restore_customer(self, system_name: str, customer_id: str) -> Optional[Customer]:
+        """
+        Load a customer of the last snapshot, unless a scrape has stored it since.
+        :return: The stored customer, or None if it is not in the snapshot.
+        """
+        key = (system_name, customer_id)
+        with self.restore_lock:
+            fetcher = self.fetcher(self.carrier(system_name))
+            if key in self.Unrestored:
+                customer = FetchData.snapshots.load(system_name, customer_id)
+                if customer is not None:
+                    fetcher.keep(customer, save=False, replace=False)
+                del self.Unrestored[key]
+            return fetcher.customers.get(customer_id)
+
+    def restore_all(self):
+        """
+        Load every customer of the last snapshot that is not loaded yet.
+        """
+        for system_name, customer in FetchData.snapshots.load_all(self.Carriers.names()):
+            if self.closing.is_set():
+                return
+            key = (system_name, customer.id)
+            with self.restore_lock:
+                if key in self.Unrestored:
+                    self.fetcher(self.carrier(system_name)).keep(customer, save=False, replace=False)
+                    del self.Unrestored[key]
+
+    def scrape_customer(self, system_name: str, customer_id: str) -> Customer:
+        """
+        Scrape a single customer now, and store it with the rest of the data.
+        :param system_name: The system name of the customer's carrier.
+        :param customer_id: The customer to scrape.
+        :return: The scraped customer.
         """
-        print('Scrape initiated.')
-        fetchers: List[FetchData] = [FetchData(carrier) for carrier in self.Carriers]
-        for fetcher in fetchers:
-            fetcher.fetch_my_carrier()
-            self.Data[fetcher.carrier.system_name] = fetcher
-        print('Scrape complete.')
+        return self.fetcher(self.carrier(system_name)).fetch_my_carrier(customer_id).customer
 
-    def respond(self):
+    def start_refreshing(self, max_workers: int = 4, jitter: float = 0.1):
+        """
+        Refresh every stored customer in the background, each on its carrier's refresh_interval.
+        The customers served later by the ScrapeServer are refreshed too, and the most requested ones go first.
+        :param max_workers: The most refreshes running at once.
+        :param jitter: How much each interval varies at random, as a fraction of it.
+        """
+        from scheduler import RefreshScheduler
+        if self.scheduler is None:
+            self.scheduler = RefreshScheduler(self, max_workers, jitter)
+            self.scheduler.track_all()
+        self.scheduler.start()
+
+    def stop_refreshing(self):
+        """
+        Stop the background refreshes.
+        """
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+    def close(self):
+        """
+        Stop the background refreshes and restore, and the parsing processes and the snapshots this service
+        opened.
+        """
+        self.stop_refreshing()
+        self.closing.set()
+        if self.restoring is not None:
+            self.restoring.join()
+            self.restoring = None
+        if self.parsers is not None:
+            if FetchData.parsers is self.parsers:
+                FetchData.parsers = None
+            self.parsers.shutdown()
+            self.parsers = None
+        if self.snapshots is not None:
+            if FetchData.snapshots is self.snapshots:
+                FetchData.snapshots = None
+            self.snapshots.close()
+            self.snapshots = None
+
+    def __enter__(self) -> 'MockRestService':
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def scrape_customers(self, customers: Iterable[Tuple[str, str]],
+                         max_workers: Optional[int] = None) -> Generator[ScrapeResult, None, None]:
+        """
+        Scrape any number of customers, and store them with the rest of the data as each one is done.
+        :param customers: The carrier system name and the customer ID of each customer.
+        :param max_workers: The most customers scraped at once.
+        :return: The result of each customer, in the order they complete. The customers of an unknown carrier
+                 fail with a ValueError, and their "carrier" is the system name that was given.
+        """
+        fetchers = {fetcher.carrier: fetcher for fetcher in self.Data.values()}
+        unknown = deque()
+
+        def pairs() -> Generator[Tuple[Type[Carrier], str], None, None]:
+            for system_name, customer_id in customers:
+                try:
+                    carrier = self.carrier(system_name)
+                except ValueError as error:
+                    # Reported without stopping the others.
+                    unknown.append(ScrapeResult(system_name, customer_id, None, error))
+                    continue
+                yield carrier, customer_id
+
+        for result in FetchData.fetch_many(pairs(), fetchers, max_workers or self.max_workers):
+            while unknown:
+                yield unknown.popleft()
+            self.Data[result.carrier.system_name] = fetchers[result.carrier]
+            yield result
+        while unknown:
+            yield unknown.popleft()
+
+    def respond(self, requests: Iterable[Mapping[str, str]] = INPUT, compact: bool = False):
         """
         Get JSON from the given input.
         This is really a dummy function. It does not accept just any
         REST input, just the expected input, as the parameters of how
         real input would arrive are currently unknown.
+        :param requests: The carrier and customerId of each customer to return.
+        :param compact: Write the JSON without indentation or spaces.
         :return: JSON in string format.
         """
+        return self.Responses[compact].encode(self.customers(requests)).decode('utf-8')
+
+    def respond_bytes(self, requests: Iterable[Mapping[str, str]] = INPUT, compact: bool = True,
+                      gzip: bool = False) -> bytes:
+        """
+        The same JSON as respond, encoded, and gzipped if asked for.
+        Each customer is only encoded, or compressed, once per version.
+        """
+        return self.encode_json(self.customers(requests), compact, gzip)
+
+    def respond_stream(self, requests: Iterable[Mapping[str, str]] = INPUT, compact: bool = True) -> Iterator[str]:
+        """
+        The same JSON as respond, in pieces of one customer each, for large batches.
+        """
+        return (COMPACT if compact else COMPATIBLE).iter_encode(self.customers(requests))
+
+    def customers(self, requests: Iterable[Mapping[str, str]]) -> Mapping[str, Mapping[str, Customer]]:
+        """
+        Gather the requested customers that are in the store.
+        :param requests: The carrier and customerId of each customer.
+        :return: The customers, by carrier system name and customer ID.
+        """
         customer = {}
-        for request in INPUT:
+        for request in requests:
             # Let's assume we expect this format exactly.
-            customer[request['carrier']] = {}
-            customer_carrier = customer[request['carrier']]
-            customer_carrier[request['customerId']] =\
-                self.Data[request['carrier']].customers[request['customerId']].to_dict()
-        return self.make_json(customer)
+            found = self.lookup(request['carrier'], request['customerId'])
+            if found is None:
+                # This carrier or customer failed to scrape, or was never scraped.
+                continue
+            customer_carrier = customer.setdefault(request['carrier'], {})
+            customer_carrier[request['customerId']] = found
+        return customer
 
     @staticmethod
-    def make_json(data: dict):
+    def make_json(data: dict, compact: bool = False):
         """
         Converts a Python-serializable object into JSON text.
+        The customers, agents and policies in it are written directly, without going through to_dict.
         :param data: A Python-serializable object.
+        :param compact: Write the JSON without indentation or spaces.
         :return: A string that contains a JSON object.
         """
-        return JSONEncoder(indent=4).encode(data)
+        return (COMPACT if compact else COMPATIBLE).encode(data)
+
+    @classmethod
+    def encode_json(cls, data: dict, compact: bool = True, gzip: bool = False) -> bytes:
+        """
+        Like make_json, but as bytes, and with the stored customers at the second level of "data" taken from
+        the encoded ones.
+        :param data: A Python-serializable object, usually {carrier: {customerId: customer}}.
+        :param compact: Write the JSON without indentation or spaces.
+        :param gzip: Compress the JSON with gzip.
+        :return: The JSON, encoded.
+        """
+        responses = cls.Responses[compact]
+        return responses.encode_gzip(data) if gzip else responses.encode(data)
 
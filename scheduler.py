@@ -0,0 +1,211 @@
+"""
+Keeps the stored customers up to date in the background.
+"""
+
+import heapq
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple, Optional, List, Set
+
+logger = logging.getLogger(__name__)
+
+# A customer, as the system name of its carrier and its ID.
+Key = Tuple[str, str]
+
+
+class RefreshEntry:
+    """
+    When a customer was refreshed, when it is due again, and how much it is asked for.
+    """
+
+    __slots__ = ['key', 'interval', 'due', 'refreshed', 'hits']
+
+    def __init__(self, key: Key, interval: float, due: float):
+        self.key = key
+        self.interval = interval
+        self.due = due
+        self.refreshed: Optional[float] = None
+        self.hits = 0.0
+
+    def priority(self, now: float) -> float:
+        """
+        How urgent a refresh is: the longer overdue and the more asked for, the more urgent.
+        """
+        return (now - self.due + self.interval) * (1 + self.hits)
+
+
+class RefreshScheduler:
+    """
+    Refreshes each customer of a MockRestService on its own interval, in a background thread.
+    When more customers are due than there are workers, the most overdue and most requested go first.
+    Each due time is jittered so the refreshes do not come in waves, and a refreshed customer replaces the old
+    one in a single assignment, so readers never wait and never see a customer half built.
+    """
+
+    def __init__(self, service, max_workers: int = 4, jitter: float = 0.1, tick: float = 1.0):
+        """
+        :param service: The MockRestService whose customers are refreshed.
+        :param max_workers: The most refreshes running at once.
+        :param jitter: How much each interval varies at random, as a fraction of it.
+        :param tick: The longest time the scheduler sleeps between two checks, in seconds.
+        """
+        self.service = service
+        self.max_workers = max_workers
+        self.jitter = jitter
+        self.tick = tick
+        self.entries: Dict[Key, RefreshEntry] = {}
+        # Due times and keys. An entry may appear more than once; only its current due time counts.
+        self.queue: List[Tuple[float, Key]] = []
+        self.running: Set[Key] = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.wake = threading.Event()
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def next_due(self, interval: float, now: float) -> float:
+        """
+        When an entry refreshed now is due again, jittered.
+        """
+        return now + interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def track(self, system_name: str, customer_id: str, interval: Optional[float] = None,
+              refreshed: Optional[float] = None):
+        """
+        Start refreshing a customer.
+        :param system_name: The system name of the customer's carrier.
+        :param customer_id: The customer.
+        :param interval: How often to refresh it, in seconds. Defaults to the carrier's refresh_interval.
+        :param refreshed: When the customer was last scraped, as a Unix time, if it is known. It is then due
+                          one interval after that. Otherwise, its first refresh is spread at random over its
+                          interval.
+        """
+        key = (system_name, customer_id)
+        if interval is None:
+            interval = self.service.carrier(system_name).refresh_interval
+        due = time.time() + random.uniform(0, interval) if refreshed is None else self.next_due(interval, refreshed)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry.interval = interval
+                return
+            entry = self.entries[key] = RefreshEntry(key, interval, due)
+            entry.refreshed = refreshed
+            heapq.heappush(self.queue, (entry.due, key))
+        self.wake.set()
+
+    def track_all(self):
+        """
+        Start refreshing every customer already in the service's store, and those of its snapshot that are
+        not loaded yet.
+        """
+        # The snapshot first: a customer loaded meanwhile is then found in the store.
+        for (system_name, customer_id), stored in list(self.service.Unrestored.items()):
+            self.track(system_name, customer_id, refreshed=stored)
+        for system_name, fetcher in list(self.service.Data.items()):
+            for customer_id in list(fetcher.customers):
+                self.track(system_name, customer_id)
+
+    def hit(self, system_name: str, customer_id: str):
+        """
+        Record that a customer was asked for. Customers that are not tracked yet start being tracked.
+        """
+        with self.lock:
+            entry = self.entries.get((system_name, customer_id))
+            if entry is not None:
+                entry.hits += 1
+                return
+        self.track(system_name, customer_id)
+
+    def untrack(self, system_name: str, customer_id: str):
+        """
+        Stop refreshing a customer.
+        """
+        with self.lock:
+            self.entries.pop((system_name, customer_id), None)
+
+    def due(self, now: float) -> List[RefreshEntry]:
+        """
+        Take the customers that are due and not already refreshing, most urgent first, as many as there are
+        free workers. Must be called with the lock held.
+        """
+        candidates = []
+        while self.queue and self.queue[0][0] <= now:
+            due, key = heapq.heappop(self.queue)
+            entry = self.entries.get(key)
+            if entry is None or entry.due != due or key in self.running:
+                continue
+            candidates.append(entry)
+        candidates.sort(key=lambda candidate: candidate.priority(now), reverse=True)
+        free = self.max_workers - len(self.running)
+        chosen, postponed = candidates[:max(free, 0)], candidates[max(free, 0):]
+        for entry in postponed:
+            heapq.heappush(self.queue, (entry.due, entry.key))
+        for entry in chosen:
+            self.running.add(entry.key)
+        return chosen
+
+    def refresh(self, entry: RefreshEntry):
+        """
+        Scrape a customer again. The service stores the new customer once it is complete.
+        """
+        system_name, customer_id = entry.key
+        try:
+            self.service.scrape_customer(system_name, customer_id)
+        except Exception as error:
+            logger.warning('Refreshing %s of %s failed: %r', customer_id, system_name, error)
+        finally:
+            now = time.time()
+            with self.lock:
+                self.running.discard(entry.key)
+                if self.entries.get(entry.key) is entry:
+                    entry.refreshed = now
+                    # The demand counts less and less, so that it reflects recent requests.
+                    entry.hits /= 2
+                    entry.due = self.next_due(entry.interval, now)
+                    heapq.heappush(self.queue, (entry.due, entry.key))
+            self.wake.set()
+
+    def run(self):
+        """
+        The loop of the background thread.
+        """
+        while not self.stop_event.is_set():
+            self.wake.clear()
+            now = time.time()
+            with self.lock:
+                chosen = self.due(now)
+                sleep = self.tick
+                # With every worker busy, wait for one to finish rather than for the next due time.
+                if self.queue and len(self.running) < self.max_workers:
+                    sleep = min(sleep, max(self.queue[0][0] - now, 0))
+            for entry in chosen:
+                self.executor.submit(self.refresh, entry)
+            self.wake.wait(sleep)
+
+    def start(self):
+        """
+        Start refreshing in the background.
+        """
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.thread = threading.Thread(target=self.run, name='refresh-scheduler', daemon=True)
+        self.thread.start()
+
+    def stop(self, wait: bool = True):
+        """
+        Stop refreshing. The refreshes already running are let finish if "wait" is set.
+        """
+        self.stop_event.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,263 @@
+"""
+JSON serialization of the scraped data, written straight from the objects.
+The to_dict methods copy each object into a dictionary before the JSON encoder walks it again. Here, the fields
+to write and their encoded keys are worked out once per class, and each object is written field by field.
+In the indented mode, the output is the same, byte for byte, as JSONEncoder(indent=4) over the to_dict output.
+"""
+
+import dataclasses
+from datetime import date
+from decimal import Decimal
+from enum import Enum
+from json.encoder import encode_basestring_ascii
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# A function that appends a piece of JSON text to the output.
+Write = Callable[[str], None]
+
+
+def encode_float(value: float) -> str:
+    """
+    A float as the standard JSON encoder writes it.
+    """
+    if value != value:
+        return 'NaN'
+    if value == float('inf'):
+        return 'Infinity'
+    if value == float('-inf'):
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+class Serializer:
+    """
+    Writes dictionaries, lists and the scraped data classes as JSON.
+    A data class is written as the fields of its "_serialize" list, in field order, the way its to_dict method
+    would have them.
+    """
+
+    def __init__(self, indent: Optional[int] = None):
+        """
+        :param indent: The indentation of the indented mode, like the standard JSON encoder's.
+                       None writes the most compact JSON, with no spaces or newlines.
+        """
+        self.indent = indent
+        self.item_separator = ','
+        self.key_separator = ':' if indent is None else ': '
+        # The fields to write, with their encoded keys, by class.
+        self.schemas: Dict[type, List[Tuple[str, str]]] = {}
+        # How to write the values of each type met so far.
+        self.writers: Dict[type, Callable[[Any, Write, int], None]] = {}
+        # How to write a value of each simple type.
+        self.scalars: Dict[type, Callable[[Any], str]] = {
+            str: encode_basestring_ascii,
+            int: int.__repr__,
+            float: encode_float,
+            bool: lambda value: 'true' if value else 'false',
+            type(None): lambda value: 'null',
+            Decimal: lambda value: encode_float(float(value)),
+        }
+
+    def newline(self, level: int) -> str:
+        """
+        What goes before an item, or before the closing bracket, at a nesting level.
+        """
+        if self.indent is None:
+            return ''
+        return '\n' + ' ' * (self.indent * level)
+
+    def schema(self, cls: type) -> List[Tuple[str, str]]:
+        """
+        The fields of a data class to write, with their keys already encoded. Built once per class.
+        """
+        schema = self.schemas.get(cls)
+        if schema is None:
+            serialize = set(getattr(cls, '_serialize', ()))
+            schema = [(field.name, encode_basestring_ascii(field.name) + self.key_separator)
+                      for field in dataclasses.fields(cls) if field.name in serialize]
+            self.schemas[cls] = schema
+        return schema
+
+    def encode_key(self, key) -> str:
+        """
+        A dictionary key as a JSON string, converted the way the standard JSON encoder converts it.
+        """
+        if isinstance(key, str):
+            return encode_basestring_ascii(key)
+        if isinstance(key, bool):
+            return '"true"' if key else '"false"'
+        if key is None:
+            return '"null"'
+        if isinstance(key, float):
+            return '"' + encode_float(key) + '"'
+        return '"' + int.__repr__(key) + '"'
+
+    def write(self, value, write: Write, level: int = 0):
+        """
+        Write any supported value.
+        :param value: What to write.
+        :param write: Where to write it.
+        :param level: How deep the value is nested.
+        """
+        writer = self.writers.get(type(value))
+        if writer is None:
+            writer = self.writer(type(value))
+        writer(value, write, level)
+
+    def writer(self, cls: type) -> Callable[[Any, Write, int], None]:
+        """
+        Choose how to write the values of a type, once per type.
+        """
+        scalar = self.scalars.get(cls)
+        if scalar is not None:
+            writer = self.scalar_writer(scalar)
+        elif issubclass(cls, dict):
+            writer = self.write_dict
+        elif issubclass(cls, Enum):
+            writer = self.write_enum
+        elif issubclass(cls, date):
+            writer = self.write_date
+        elif issubclass(cls, (list, tuple)):
+            writer = self.write_list
+        elif dataclasses.is_dataclass(cls):
+            writer = self.write_object
+        elif issubclass(cls, str):
+            writer = self.scalar_writer(encode_basestring_ascii)
+        elif issubclass(cls, int):
+            writer = self.scalar_writer(int.__repr__)
+        elif issubclass(cls, float):
+            writer = self.scalar_writer(encode_float)
+        else:
+            raise TypeError(f'Object of type {cls.__name__} is not JSON serializable')
+        self.writers[cls] = writer
+        return writer
+
+    @staticmethod
+    def scalar_writer(scalar: Callable[[Any], str]) -> Callable[[Any, Write, int], None]:
+        """
+        A writer for values that are written in one piece.
+        """
+        def writer(value, write: Write, _):
+            write(scalar(value))
+        return writer
+
+    @staticmethod
+    def write_enum(value: Enum, write: Write, _):
+        """
+        Statuses are written by name.
+        """
+        write(encode_basestring_ascii(value.name))
+
+    def write_date(self, value: date, write: Write, level: int):
+        """
+        Dates are written as their ISO calendar: year, week, weekday.
+        """
+        year, week, weekday = value.isocalendar()
+        inner = self.newline(level + 1)
+        separator = self.item_separator + inner
+        write(f'[{inner}{year}{separator}{week}{separator}{weekday}{self.newline(level)}]')
+
+    def write_object(self, value, write: Write, level: int):
+        """
+        Write a data class as a JSON object of its serialized fields.
+        """
+        schema = self.schema(type(value))
+        if not schema:
+            write('{}')
+            return
+        inner = self.newline(level + 1)
+        separator = self.item_separator + inner
+        write('{' + inner)
+        first = True
+        for name, key in schema:
+            if not first:
+                write(separator)
+            first = False
+            write(key)
+            self.write(getattr(value, name), write, level + 1)
+        write(self.newline(level) + '}')
+
+    def write_dict(self, value: dict, write: Write, level: int):
+        """
+        Write a dictionary as a JSON object.
+        """
+        if not value:
+            write('{}')
+            return
+        inner = self.newline(level + 1)
+        separator = self.item_separator + inner
+        write('{' + inner)
+        first = True
+        for key, item in value.items():
+            if not first:
+                write(separator)
+            first = False
+            write(self.encode_key(key) + self.key_separator)
+            self.write(item, write, level + 1)
+        write(self.newline(level) + '}')
+
+    def write_list(self, value, write: Write, level: int):
+        """
+        Write a list or a tuple as a JSON array.
+        """
+        if not value:
+            write('[]')
+            return
+        inner = self.newline(level + 1)
+        separator = self.item_separator + inner
+        write('[' + inner)
+        first = True
+        for item in value:
+            if not first:
+                write(separator)
+            first = False
+            self.write(item, write, level + 1)
+        write(self.newline(level) + ']')
+
+    def encode(self, value) -> str:
+        """
+        The JSON text of a value.
+        """
+        parts: List[str] = []
+        self.write(value, parts.append)
+        return ''.join(parts)
+
+    def iter_encode(self, value, level: int = 0, depth: int = 2,
+                    leaf: Optional[Callable[[Any, int], Any]] = None) -> Iterator:
+        """
+        The JSON text of a value, in pieces, so a large batch can be sent while it is being written.
+        Dictionaries and lists are yielded item by item down to "depth" levels, and written whole below that.
+        With the default depth, a {carrier: {customerId: customer}} answer comes out one customer at a time.
+        :param leaf: What to yield for the values written whole, given the value and its level.
+                     By default, their JSON text.
+        """
+        if depth <= 0 or not isinstance(value, (dict, list)) or not value:
+            yield (leaf or self.encode_at)(value, level)
+            return
+        is_dict = isinstance(value, dict)
+        opening, closing = ('{', '}') if is_dict else ('[', ']')
+        items = value.items() if is_dict else ((None, item) for item in value)
+        inner = self.newline(level + 1)
+        prefix = opening + inner
+        for key, item in items:
+            if is_dict:
+                prefix += self.encode_key(key) + self.key_separator
+            yield prefix
+            yield from self.iter_encode(item, level + 1, depth - 1, leaf)
+            prefix = self.item_separator + inner
+        yield self.newline(level) + closing
+
+    def encode_at(self, value, level: int) -> str:
+        """
+        The JSON text of a value nested at a given level.
+        """
+        parts: List[str] = []
+        self.write(value, parts.append, level)
+        return ''.join(parts)
+
+
+# The same output as JSONEncoder(indent=4) over the to_dict methods.
+COMPATIBLE = Serializer(indent=4)
+
+# The smallest output, for production.
+COMPACT = Serializer()
@@ -0,0 +1,282 @@
+"""
+An HTTP front for MockRestService.
+It answers batches of customer requests in the same JSON format as MockRestService.respond. Customers already
+in the store are served from it. The others are scraped on demand, without blocking the other requests, and
+concurrent requests for the same customer share a single scrape.
+"""
+
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Dict, Tuple, Optional, List, Mapping
+
+from customtypes import Customer
+from fetchdata import FetchData
+from metrics import Metrics
+from rest import MockRestService
+
+logger = logging.getLogger(__name__)
+
+# The largest request body accepted, in bytes.
+MAX_BODY = 1024 * 1024
+
+# The content types of the answers.
+JSON_TYPE = 'application/json'
+METRICS_TYPE = 'text/plain; version=0.0.4'
+
+
+class HTTPError(Exception):
+    """
+    A request that cannot be answered, with the status to answer it with.
+    """
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ScrapeServer:
+    """
+    Serves the customers of a MockRestService over HTTP.
+
+    POST / with a JSON list of {"carrier": ..., "customerId": ...} objects, or a single such object, returns
+    {carrier: {customerId: customer}} for every customer that could be found. The customers that could not be
+    scraped are listed under "errors".
+    GET /customers/<carrier>/<customerId> does the same for a single customer.
+    GET /metrics returns the metrics of the scrapes in the Prometheus text format, if they are recorded.
+    """
+
+    def __init__(self, service: MockRestService, host: str = '127.0.0.1', port: int = 8080,
+                 max_workers: int = 32):
+        """
+        :param service: Where the customers are stored and scraped.
+        :param host: The interface to listen on.
+        :param port: The port to listen on.
+        :param max_workers: The most scrapes and encodings running at once.
+        """
+        self.service = service
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # The scrapes in flight, by carrier and customer, so that concurrent requests share them.
+        self.scrapes: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def customer(self, system_name: str, customer_id: str) -> Customer:
+        """
+        Get a customer from the store, or scrape it if it is not there yet.
+        Only the customers already in memory are looked up on the event loop. The others are loaded or scraped by
+        the executor, so that a slow one never holds up the other requests.
+        :param system_name: The system name of the customer's carrier.
+        :param customer_id: The customer.
+        :return: The customer.
+        """
+        key = (system_name, customer_id)
+        loop = asyncio.get_running_loop()
+        if key in self.service.Unrestored:
+            # Loading it from the snapshot reads the disk, and waits for the background restore to let go of it.
+            customer = await loop.run_in_executor(self.executor, self.service.lookup, system_name, customer_id)
+        else:
+            customer = self.service.lookup(system_name, customer_id)
+        if customer is not None:
+            return customer
+        scrape = self.scrapes.get(key)
+        if scrape is None:
+            scrape = loop.run_in_executor(self.executor, self.service.scrape_customer, system_name, customer_id)
+            self.scrapes[key] = scrape
+            scrape.add_done_callback(lambda _: self.scrapes.pop(key, None))
+        # Shielded, so a client that goes away does not cancel a scrape other clients are waiting for.
+        return await asyncio.shield(scrape)
+
+    async def answer(self, requests: List[Mapping[str, str]], gzip: bool = False) -> bytes:
+        """
+        Answer a batch of customer requests.
+        :param requests: The carrier and customerId of each customer.
+        :param gzip: Compress the answer with gzip.
+        :return: The encoded JSON of the answer.
+        """
+        results = await asyncio.gather(*(self.customer(request['carrier'], request['customerId'])
+                                         for request in requests), return_exceptions=True)
+        errors, found = [], []
+        for request, result in zip(requests, results):
+            if isinstance(result, BaseException):
+                error = str(result)
+            elif result.id != request['customerId']:
+                # The carrier answered with another customer's page.
+                error = f'The carrier returned customer "{result.id}" instead.'
+            else:
+                found.append(request)
+                if self.service.scheduler is not None:
+                    # Once per request, however the customer was found, so the most requested are refreshed first.
+                    self.service.scheduler.hit(request['carrier'], request['customerId'])
+                continue
+            errors.append({'carrier': request['carrier'], 'customerId': request['customerId'], 'error': error})
+
+        def encode() -> bytes:
+            answer = self.service.customers(found)
+            if errors:
+                answer['errors'] = errors
+            return self.service.encode_json(answer, gzip=gzip)
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, encode)
+
+    @staticmethod
+    def parse_requests(body: bytes) -> List[Mapping[str, str]]:
+        """
+        Read and check the customer requests of a POST body.
+        """
+        try:
+            requests = json.loads(body)
+        except ValueError as error:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f'The body is not valid JSON: {error}.')
+        if isinstance(requests, dict):
+            requests = [requests]
+        if not isinstance(requests, list) or not all(
+                isinstance(request, dict) and isinstance(request.get('carrier'), str)
+                and isinstance(request.get('customerId'), str) for request in requests):
+            raise HTTPError(HTTPStatus.BAD_REQUEST,
+                            'Expected a list of {"carrier": ..., "customerId": ...} objects.')
+        return requests
+
+    async def route(self, method: str, path: str, body: bytes, gzip: bool = False) -> Tuple[bytes, str]:
+        """
+        Answer one HTTP request.
+        :param gzip: Compress the answer with gzip. Only the JSON answers are.
+        :return: The encoded answer, and its content type.
+        """
+        parts = [part for part in path.split('?')[0].split('/') if part]
+        if parts == [] or parts == ['customers']:
+            if method != 'POST':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, 'Use POST.')
+            return await self.answer(self.parse_requests(body), gzip), JSON_TYPE
+        if len(parts) == 3 and parts[0] == 'customers':
+            if method != 'GET':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, 'Use GET.')
+            return await self.answer([{'carrier': parts[1], 'customerId': parts[2]}], gzip), JSON_TYPE
+        if parts == ['metrics'] and FetchData.metrics is not None:
+            if method != 'GET':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, 'Use GET.')
+            return FetchData.metrics.export().encode('utf-8'), METRICS_TYPE
+        raise HTTPError(HTTPStatus.NOT_FOUND, f'Nothing at "{path}".')
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serve the requests of one connection, one after the other, until the client closes it.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.send(writer, HTTPStatus.BAD_REQUEST, self.error('Bad request line.'), False)
+                    return
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.send(writer, HTTPStatus.BAD_REQUEST, self.error('Bad Content-Length.'), False)
+                    return
+                if length > MAX_BODY:
+                    await self.send(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                    self.error('The body is too large.'), False)
+                    return
+                body = await reader.readexactly(length) if length else b''
+
+                gzip = 'gzip' in headers.get('accept-encoding', '').lower()
+                try:
+                    status, (content, content_type) = HTTPStatus.OK, await self.route(method, path, body, gzip)
+                except HTTPError as error:
+                    status, content, content_type = error.status, self.error(str(error)), JSON_TYPE
+                except Exception:
+                    logger.exception('Could not answer %s %s.', method, path)
+                    status, content, content_type = (HTTPStatus.INTERNAL_SERVER_ERROR,
+                                                     self.error('Internal server error.'), JSON_TYPE)
+                gzip = gzip and content_type == JSON_TYPE
+                await self.send(writer, status, content, keep_alive, 'gzip' if gzip else None, content_type)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def error(message: str) -> bytes:
+        """
+        The encoded JSON of an error.
+        """
+        return json.dumps({'error': message}).encode('utf-8')
+
+    @staticmethod
+    async def send(writer: asyncio.StreamWriter, status: HTTPStatus, body: bytes, keep_alive: bool,
+                   content_encoding: Optional[str] = None, content_type: str = JSON_TYPE):
+        """
+        Write a response, JSON unless told otherwise.
+        :param content_encoding: How the body is compressed, if it is.
+        :param content_type: What the body is.
+        """
+        encoding = f'Content-Encoding: {content_encoding}\r\n' if content_encoding else ''
+        writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                     f'Content-Type: {content_type}\r\n'
+                     f'{encoding}'
+                     f'Content-Length: {len(body)}\r\n'
+                     f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode('latin-1') + body)
+        await writer.drain()
+
+    async def start(self) -> asyncio.AbstractServer:
+        """
+        Start listening.
+        :return: The listening server.
+        """
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        return self.server
+
+    async def serve_forever(self):
+        """
+        Listen and serve until cancelled.
+        """
+        server = await self.start()
+        async with server:
+            await server.serve_forever()
+
+
+def serve(host: str = '127.0.0.1', port: int = 8080, eager: bool = False, refresh: bool = True,
+          snapshot: Optional[str] = None, metrics: bool = False, processes: Optional[int] = None):
+    """
+    Run the HTTP service until interrupted.
+    :param host: The interface to listen on.
+    :param port: The port to listen on.
+    :param eager: Scrape every carrier's default customer before listening.
+    :param refresh: Keep the served customers up to date in the background.
+    :param snapshot: A file to save the customers to, and to serve them from right away on the next start.
+    :param metrics: Record the time spent on each stage of the scrapes, and serve it on GET /metrics.
+    :param processes: Parse the pages in this many other processes. 0 uses one per core. See MockRestService.
+    """
+    if metrics and FetchData.metrics is None:
+        FetchData.metrics = Metrics()
+    service = MockRestService(eager=eager, snapshot=snapshot, processes=processes)
+    if refresh:
+        service.start_refreshing()
+    server = ScrapeServer(service, host, port)
+    logger.info('Serving on http://%s:%s/', host, port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
@@ -0,0 +1,59 @@
+"""
+The state of a single scrape.
+"""
+
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Optional, List, Type, Dict
+
+import lxml.html
+
+from changes import Delta
+from customtypes import Customer, Agent
+from metrics import Metrics
+
+
+@dataclass
+class ScrapeSession:
+    """
+    Everything one scrape of one carrier page works on: the page being read, where it is in the pagination,
+    and what has been found so far.
+    Nothing of this is kept on the carrier classes, so any number of scrapes of the same carrier can run
+    at the same time, in threads or tasks.
+    """
+    carrier: Type
+    uri: str
+
+    # The root of the page being read.
+    tree: Optional[lxml.html.HtmlElement] = None
+
+    # How many pages have been read, and the address of the last one.
+    page: int = 0
+    page_uri: Optional[str] = None
+
+    # What has been scraped.
+    customer: Optional[Customer] = None
+    agent: Optional[Agent] = None
+    policies: List = field(default_factory=list)
+
+    # Where to record the time spent on each stage of this scrape, if anywhere.
+    metrics: Optional[Metrics] = None
+
+    # How the customer changed since it was last stored, once it is.
+    delta: Optional[Delta] = None
+
+    # The pages downloading ahead of the one being read, by URI. A page that was reached has None instead.
+    # It is set to None itself when the scrape is over, so that nothing more is downloaded for it.
+    ahead: Optional[Dict[str, Optional[Future]]] = field(default_factory=dict, repr=False)
+    ahead_lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def turn_page(self, tree: lxml.html.HtmlElement, uri: Optional[str]):
+        """
+        Move on to the next page.
+        :param tree: The root of the new page.
+        :param uri: The address of the new page.
+        """
+        self.tree = tree
+        self.page += 1
+        self.page_uri = uri
@@ -0,0 +1,144 @@
+"""
+The scraped customers, saved on disk, so that a restarted service can answer at once.
+Each customer is saved with its agent and policies in a row of an SQLite database, every time a scrape of it
+lands. On startup, only the list of saved customers is read. Each customer is loaded when it is first asked
+for, which is one indexed row, and the others are loaded in the background while they are refreshed.
+"""
+
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, Optional, Tuple, Iterable
+
+from customtypes import Customer
+
+logger = logging.getLogger(__name__)
+
+# A customer, as the system name of its carrier and its ID.
+Key = Tuple[str, str]
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS customers (
+    carrier TEXT NOT NULL,
+    customer_id TEXT NOT NULL,
+    stored REAL NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (carrier, customer_id)
+) WITHOUT ROWID
+'''
+
+
+class SnapshotStore:
+    """
+    The last scrape of every customer, in an SQLite database.
+    The customers are pickled, so the database must only ever be written by this service.
+    """
+
+    def __init__(self, path: str, compress_level: int = 1):
+        """
+        :param path: The database file. It is created if it does not exist.
+        :param compress_level: The zlib compression level of the saved customers.
+        """
+        self.path = path
+        self.compress_level = compress_level
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # Writes are appended to a log, so they do not block the reads, and the file is not synced at each one.
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(SCHEMA)
+
+    def save(self, system_name: str, customer: Customer):
+        """
+        Save a customer, with its agent and policies, in place of its last snapshot.
+        :param system_name: The system name of the customer's carrier.
+        :param customer: The customer, linked to its agent and policies.
+        """
+        data = zlib.compress(pickle.dumps(customer, pickle.HIGHEST_PROTOCOL), self.compress_level)
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO customers VALUES (?, ?, ?, ?)',
+                                    (system_name, customer.id, time.time(), data))
+
+    def remove(self, system_name: str, customer_id: str):
+        """
+        Forget the snapshot of a customer.
+        """
+        with self.lock:
+            self.connection.execute('DELETE FROM customers WHERE carrier = ? AND customer_id = ?',
+                                    (system_name, customer_id))
+
+    def keys(self) -> Dict[Key, float]:
+        """
+        Every saved customer, without loading it.
+        :return: When each customer was saved, as a Unix time, by carrier system name and customer ID.
+        """
+        with self.lock:
+            rows = self.connection.execute('SELECT carrier, customer_id, stored FROM customers').fetchall()
+        return {(system_name, customer_id): stored for system_name, customer_id, stored in rows}
+
+    @staticmethod
+    def decode(data: bytes) -> Customer:
+        """
+        A saved customer, with its agent and policies.
+        Its version is left to the caller: versions are only unique within a process.
+        """
+        return pickle.loads(zlib.decompress(data))
+
+    def decode_row(self, system_name: str, customer_id: str, data: bytes) -> Optional[Customer]:
+        """
+        Decode a saved customer, or log why it cannot be, as when its carrier no longer loads.
+        :return: The customer, or None if it cannot be decoded.
+        """
+        try:
+            return self.decode(data)
+        except Exception:
+            logger.exception('The snapshot of the customer %s of %s cannot be loaded.', customer_id, system_name)
+            return None
+
+    def load(self, system_name: str, customer_id: str) -> Optional[Customer]:
+        """
+        Load a saved customer.
+        :return: The customer, with its agent and policies, or None if it is not saved, or cannot be loaded.
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT data FROM customers WHERE carrier = ? AND customer_id = ?',
+                                          (system_name, customer_id)).fetchone()
+        return None if row is None else self.decode_row(system_name, customer_id, row[0])
+
+    def load_all(self, carriers: Optional[Iterable[str]] = None,
+                 batch: int = 256) -> Iterator[Tuple[str, Customer]]:
+        """
+        Load every saved customer, a batch at a time, so that other calls are not held up meanwhile.
+        The customers that cannot be loaded are logged and skipped.
+        :param carriers: The system names of the carriers to load the customers of. None loads them all.
+        :return: The system name of each customer's carrier, and the customer.
+        """
+        where = ''
+        carriers = None if carriers is None else sorted(carriers)
+        if carriers is not None:
+            if not carriers:
+                return
+            where = f'AND carrier IN ({", ".join("?" * len(carriers))}) '
+        last: Key = ('', '')
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    f'SELECT carrier, customer_id, data FROM customers WHERE (carrier, customer_id) > (?, ?) '
+                    f'{where}ORDER BY carrier, customer_id LIMIT ?', (*last, *(carriers or ()), batch)).fetchall()
+            if not rows:
+                return
+            for system_name, customer_id, data in rows:
+                customer = self.decode_row(system_name, customer_id, data)
+                if customer is not None:
+                    yield system_name, customer
+            last = rows[-1][:2]
+
+    def close(self):
+        """
+        Close the database.
+        """
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,515 @@
+"""
+Carriers described by specs instead of Python code, and the registry that loads every carrier on first use.
+
+A spec is a JSON file, named after the system name of its carrier, like "EXAMPLE_MUTUAL.json":
+
+    {
+        "name": "Example Mutual",
+        "system_name": "EXAMPLE_MUTUAL",
+        "uri_template": "https://example.com/customers/{customer_id}/policies/1",
+        "default_customer": "c0001",
+        "policies": "//tr[contains(@class, \"policy-info-row\")]",
+        "details": "following-sibling::tr[1]",
+        "next_page": "//tfoot//a[contains(., \"Next\")]/@href",
+        "agent": {"Name": "//dd[@data-value-for=\"name\"]/text()", ...},
+        "customer": {"Name": {"xpath": "//dd[@data-value-for=\"name\"]/text()", "place": 1}, ...},
+        "policy": {
+            "Id": {"xpath": ".//td/text()", "place": 0, "type": "text"},
+            "Premium": {"xpath": ".//td/text()", "place": 1, "type": "decimal"},
+            ...
+        }
+    }
+
+The agent, customer and policy fields are named as in Agent.Fields, Customer.Fields and PolicyFields. A field is
+an XPath, and the place of the result to keep, which is 0 unless given. Each policy field also has the type it is
+converted with: one of CONVERTERS. The policy fields are read in the order they are given.
+"details" is the node of a policy's details, from the policy's node, when they are apart. "next_page" is the link
+to the next page of policies, when they span several pages. It may be relative to the page it is on.
+The optional "parser", "cache_ttl", "refresh_interval", "date_separators", "host_limits" and "row_layout" are
+the same as the attributes of Carrier and Policy. See ROW_LAYOUT_KEYS for the keys of "row_layout".
+
+No spec is loaded unless its directory is given, to the registry or with main.py's --specs option, which can be
+repeated. tests/specs has examples.
+
+A spec is checked, then compiled into a Carrier class and a Policy type, only once: their XPaths are compiled and
+their converters worked out just like those of the carriers written in Python.
+"""
+
+import dataclasses
+import importlib
+import json
+import os
+import re
+import threading
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal
+from typing import Mapping, Dict, List, Iterable, Iterator, Optional, Type, ClassVar, Generator
+from urllib.parse import urljoin
+
+import lxml.etree
+import lxml.html
+
+from carrier import Carrier, Policy
+from customtypes import Agent, Customer, IndexedXpath, PolicyFields, RowLayout, Status
+from parsers import PARSERS
+from ratelimit import HostLimits
+from xpaths import compile_xpath
+
+# How a type of policy field is converted from its text, and the type of its values.
+Converter = namedtuple('Converter', ['convert', 'type'])
+
+# The types of policy fields a spec can use.
+# "number" is a number as the pages show it, possibly after a label and with a percent sign.
+CONVERTERS: Mapping[str, Converter] = {
+    'text': Converter(str, str),
+    'int': Converter(int, int),
+    'decimal': Converter(Decimal, Decimal),
+    'number': Converter(Carrier.to_decimal, Decimal),
+    'us_date': Converter(Carrier.us_date, date),
+    'status': Converter(Status.__getitem__, Status),
+}
+
+# The keys a spec must have, the keys it may have, and those of its "row_layout".
+REQUIRED_KEYS = frozenset(['name', 'system_name', 'uri_template', 'default_customer', 'policies', 'agent',
+                           'customer', 'policy'])
+OPTIONAL_KEYS = frozenset(['details', 'next_page', 'parser', 'cache_ttl', 'refresh_interval', 'date_separators',
+                           'host_limits', 'row_layout'])
+ROW_LAYOUT_KEYS = frozenset(['cell_tag', 'columns', 'line_tag', 'line_prefixes'])
+
+# The carriers written in Python, by system name, and the module of each.
+MODULES: Mapping[str, str] = {
+    'MOCK_INDEMNITY': 'mock',
+    'PLACEHOLDER_CARRIER': 'placeholder',
+}
+
+class SpecPolicy(Policy):
+    """
+    The base of the policy types compiled from specs.
+    They cannot be imported by name, so they are pickled as the system name of their carrier and their values,
+    and rebuilt by loading the carrier.
+    """
+
+    __slots__ = ()
+
+    # The system name of the carrier whose spec defines this type.
+    carrier_name: ClassVar[str] = ''
+
+    def __reduce__(self):
+        return make_policy, (self.carrier_name, tuple(getattr(self, field.name) for field in dataclasses.fields(self)))
+
+
+def make_policy(system_name: str, values: tuple) -> Policy:
+    """
+    Rebuild a pickled policy of a carrier compiled from a spec.
+    """
+    return named(system_name).policy_type(*values)
+
+
+class SpecCarrier(Carrier):
+    """
+    The base of the carriers compiled from specs. See compile_spec.
+    """
+
+    # The file the spec was read from.
+    spec_path: ClassVar[Optional[str]] = None
+
+    # The XPath of the details of a policy, from the policy's node, and of the link to the next page, compiled.
+    # None when the spec does not have them.
+    compiled_details: ClassVar[Optional[lxml.etree.XPath]] = None
+    compiled_next_page: ClassVar[Optional[lxml.etree.XPath]] = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # A policy with details is only complete once they are read, which the streaming parser cannot tell.
+        if cls.compiled_details is not None:
+            cls.stream_tag = cls.compiled_stream = None
+
+    @classmethod
+    def policy_elements(cls, tree: lxml.html.HtmlElement) -> Iterable[lxml.html.HtmlElement]:
+        """
+        The node of each policy on a page. A policy with details comes with them, under a new node.
+        """
+        if cls.compiled_details is None:
+            return cls.compiled_policies(tree)
+        return cls.with_details(tree)
+
+    @classmethod
+    def with_details(cls, tree: lxml.html.HtmlElement) -> Generator[lxml.html.HtmlElement, None, None]:
+        """
+        Each policy of a page and its details, under a new node.
+        """
+        for policy in cls.compiled_policies(tree):
+            parent = lxml.html.HtmlElement('div')
+            details = cls.compiled_details(policy)
+            if details:
+                parent.insert(0, details[0])
+            parent.insert(0, policy)
+            yield parent
+
+    @classmethod
+    def change_page(cls, node: lxml.html.HtmlElement, uri: Optional[str] = None) -> Optional[str]:
+        """
+        Find the address of the next page, with the "next_page" of the spec, if it has one.
+        A relative link is resolved against the address of the current page.
+        """
+        if cls.compiled_next_page is None:
+            return None
+        links = cls.compiled_next_page(node)
+        if len(links) == 0:
+            return None
+        return urljoin(uri or cls.URI, links[0])
+
+    @classmethod
+    def fetch_policies(cls, tree: lxml.html.HtmlElement, _=None, session=None) -> Generator[Policy, None, None]:
+        from fetchdata import FetchData
+        metrics = None if session is None else session.metrics
+        uri = None if session is None else session.page_uri
+        while tree is not None:
+            link = cls.change_page(tree, uri)
+            yield from cls.fetch_page(tree, metrics)
+            if link is None:
+                return
+            tree = FetchData.uri_to_xpath(link, cls.parser, cls.cache_ttl)
+            uri = link
+            if session is not None:
+                session.turn_page(tree, link)
+
+    @classmethod
+    def fetch_policy(cls, tree: lxml.html.HtmlElement, _=None):
+        return super().fetch_policy(tree, cls.policy_type)
+
+
+def attribute(field: PolicyFields) -> str:
+    """
+    The name of the attribute that holds a policy field, like "last_payment_date" for LastPaymentDate.
+    """
+    return re.sub(r'(?<!^)([A-Z])', r'_\1', field.name).lower()
+
+
+def class_name(system_name: str) -> str:
+    """
+    The name of the class of a carrier, like "ExampleMutual" for "EXAMPLE_MUTUAL".
+    """
+    return ''.join(part.capitalize() for part in system_name.split('_'))
+
+
+def indexed_xpath(value) -> IndexedXpath:
+    """
+    The XPath and place of a field of a checked spec.
+    """
+    if isinstance(value, str):
+        return IndexedXpath(value, 0)
+    return IndexedXpath(value['xpath'], value.get('place', 0))
+
+
+def check_xpath(expression, where: str, problems: List[str]):
+    """
+    Add a problem if an expression is not a valid XPath.
+    """
+    if not isinstance(expression, str):
+        problems.append(f'{where} is not an XPath')
+        return
+    try:
+        compile_xpath(expression, where)
+    except ValueError as error:
+        problems.append(str(error).rstrip('.'))
+
+
+def check_field(value, where: str, problems: List[str], typed: bool = False):
+    """
+    Add the problems of a field of a spec: an XPath, or an object with its XPath, place and, if it is typed, type.
+    """
+    if isinstance(value, str) and not typed:
+        check_xpath(value, where, problems)
+        return
+    if not isinstance(value, dict):
+        problems.append(f'{where} is not an object')
+        return
+    unknown = set(value) - {'xpath', 'place', 'type'}
+    if unknown:
+        problems.append(f'{where} has unknown keys: {", ".join(sorted(unknown))}')
+    check_xpath(value.get('xpath'), f'{where}.xpath', problems)
+    place = value.get('place', 0)
+    if not isinstance(place, int) or isinstance(place, bool) or place < 0:
+        problems.append(f'{where}.place is not a whole number')
+    if typed and value.get('type') not in CONVERTERS:
+        problems.append(f'{where}.type is not one of {", ".join(CONVERTERS)}')
+
+
+def check_fields(fields, names: Iterable[str], required: Iterable[str], where: str, problems: List[str],
+                 typed: bool = False):
+    """
+    Add the problems of the fields of an agent, customer or policy of a spec.
+    """
+    if not isinstance(fields, dict):
+        problems.append(f'{where} is not an object')
+        return
+    unknown = set(fields) - set(names)
+    if unknown:
+        problems.append(f'{where} has unknown fields: {", ".join(sorted(unknown))}')
+    missing = [name for name in required if name not in fields]
+    if missing:
+        problems.append(f'{where} is missing {", ".join(missing)}')
+    for name, value in fields.items():
+        check_field(value, f'{where}.{name}', problems, typed)
+
+
+def validate(spec) -> List[str]:
+    """
+    Check a spec.
+    :param spec: The spec, as read from its JSON.
+    :return: Everything wrong with it. It is valid if there is nothing.
+    """
+    if not isinstance(spec, dict):
+        return ['it is not an object']
+    problems = []
+    missing = REQUIRED_KEYS - set(spec)
+    if missing:
+        problems.append(f'it is missing {", ".join(sorted(missing))}')
+    unknown = set(spec) - REQUIRED_KEYS - OPTIONAL_KEYS
+    if unknown:
+        problems.append(f'it has unknown keys: {", ".join(sorted(unknown))}')
+    for key in ['name', 'system_name', 'uri_template', 'default_customer']:
+        if key in spec and not isinstance(spec[key], str):
+            problems.append(f'{key} is not a string')
+    if isinstance(spec.get('system_name'), str) and not re.fullmatch(r'[A-Z][A-Z0-9_]*', spec['system_name']):
+        problems.append('system_name is not in upper case, like "EXAMPLE_MUTUAL"')
+    if isinstance(spec.get('uri_template'), str) and '{customer_id}' not in spec['uri_template']:
+        problems.append('uri_template has no "{customer_id}"')
+    for key in ['policies', 'details', 'next_page']:
+        if key in spec:
+            check_xpath(spec[key], key, problems)
+
+    if 'agent' in spec:
+        check_fields(spec['agent'], [field.name for field in Agent.Fields],
+                     [field.name for field in Agent.Fields], 'agent', problems)
+    if 'customer' in spec:
+        # The values of a customer are given in order, so only the last ones can be left out.
+        check_fields(spec['customer'], [field.name for field in Customer.Fields],
+                     ['Name', 'Id', 'Email', 'Address'], 'customer', problems)
+    if 'policy' in spec:
+        check_fields(spec['policy'], [field.name for field in PolicyFields], ['Id'], 'policy', problems, True)
+
+    if 'parser' in spec and spec['parser'] not in PARSERS:
+        problems.append(f'parser is not one of {", ".join(PARSERS)}')
+    for key in ['cache_ttl', 'refresh_interval']:
+        if key in spec and (not isinstance(spec[key], (int, float)) or isinstance(spec[key], bool) or spec[key] < 0):
+            problems.append(f'{key} is not a number of seconds')
+    separators = spec.get('date_separators', [])
+    if not isinstance(separators, list) or not all(isinstance(item, str) and len(item) == 1 for item in separators):
+        problems.append('date_separators is not a list of single characters')
+    limits = spec.get('host_limits', {})
+    if not isinstance(limits, dict):
+        problems.append('host_limits is not an object')
+    else:
+        unknown = set(limits) - set(HostLimits._fields)
+        if unknown:
+            problems.append(f'host_limits has unknown keys: {", ".join(sorted(unknown))}')
+        for key, value in limits.items():
+            if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0):
+                problems.append(f'host_limits.{key} is not a positive number')
+    if 'row_layout' in spec:
+        check_row_layout(spec['row_layout'], spec.get('policy', {}), problems)
+    return problems
+
+
+def check_row_layout(layout, fields, problems: List[str]):
+    """
+    Add the problems of the "row_layout" of a spec. It can only cover the fields of its policy.
+    """
+    if not isinstance(layout, dict) or set(layout) != ROW_LAYOUT_KEYS:
+        problems.append(f'row_layout is not an object with {", ".join(sorted(ROW_LAYOUT_KEYS))}')
+        return
+    for key in ['cell_tag', 'line_tag']:
+        if not isinstance(layout[key], str):
+            problems.append(f'row_layout.{key} is not a string')
+    for key, kind in [('columns', int), ('line_prefixes', str)]:
+        if not isinstance(layout[key], dict):
+            problems.append(f'row_layout.{key} is not an object')
+            continue
+        for name, value in layout[key].items():
+            if name not in fields:
+                problems.append(f'row_layout.{key}.{name} is not a field of policy')
+            if not isinstance(value, kind) or isinstance(value, bool):
+                problems.append(f'row_layout.{key}.{name} is not a {kind.__name__}')
+
+
+def compile_spec(spec, source: str = '', expected: Optional[str] = None) -> Type[SpecCarrier]:
+    """
+    Check a spec and build its carrier.
+    :param spec: The spec, as read from its JSON.
+    :param source: Where the spec comes from, for the error message.
+    :param expected: The system name the spec must have, if it is known. It is checked before the carrier is
+                     built, so that a spec for another carrier registers nothing.
+    :return: The carrier class, registered like those written in Python.
+    """
+    problems = validate(spec)
+    if problems:
+        name = source or (spec.get('system_name') if isinstance(spec, dict) else None)
+        raise ValueError(f'Invalid carrier spec{f" {name}" if name else ""}: {"; ".join(problems)}.')
+    system_name = spec['system_name']
+    if expected is not None and system_name != expected:
+        raise ValueError(f'The carrier spec {source or system_name} is for "{system_name}", not "{expected}".')
+    name = class_name(system_name)
+
+    used_fields = [PolicyFields[field] for field in spec['policy']]
+    types = {field: CONVERTERS[spec['policy'][field.name]['type']] for field in used_fields}
+    layout = spec.get('row_layout')
+    policy_type = dataclasses.make_dataclass(
+        f'{name}Policy', [(attribute(field), types[field].type) for field in used_fields], bases=(SpecPolicy,),
+        frozen=True, slots=True, namespace={
+            '__module__': __name__,
+            '__doc__': f'Information and details about a single policy of {spec["name"]}.',
+            'carrier_name': system_name,
+            'used_fields': used_fields,
+            'data_types': {field: converter.convert for field, converter in types.items()},
+            'policy_xpath': {field: indexed_xpath(spec['policy'][field.name]) for field in used_fields},
+            'row_layout': None if layout is None else RowLayout(
+                cell_tag=layout['cell_tag'],
+                columns={PolicyFields[field]: column for field, column in layout['columns'].items()},
+                line_tag=layout['line_tag'],
+                line_prefixes={PolicyFields[field]: prefix for field, prefix in layout['line_prefixes'].items()}),
+        })
+
+    namespace = {
+        '__module__': __name__,
+        '__doc__': f'The {spec["name"]} carrier, compiled from its spec.',
+        'name': spec['name'],
+        'system_name': system_name,
+        'URI_TEMPLATE': spec['uri_template'],
+        'DEFAULT_CUSTOMER': spec['default_customer'],
+        'URI': spec['uri_template'].format(customer_id=spec['default_customer']),
+        'POLICIES': spec['policies'],
+        'policy_type': policy_type,
+        'agent_xpath': {Agent.Fields[field]: indexed_xpath(value) for field, value in spec['agent'].items()},
+        'customer_xpath': {Customer.Fields[field]: indexed_xpath(value) for field, value in spec['customer'].items()},
+        'spec_path': source or None,
+    }
+    if 'details' in spec:
+        namespace['compiled_details'] = compile_xpath(spec['details'], f'{name}.details')
+    if 'next_page' in spec:
+        namespace['compiled_next_page'] = compile_xpath(spec['next_page'], f'{name}.next_page')
+    for key in ['parser', 'cache_ttl', 'refresh_interval']:
+        if key in spec:
+            namespace[key] = spec[key]
+    if 'date_separators' in spec:
+        namespace['DateSeparators'] = frozenset(spec['date_separators'])
+    if 'host_limits' in spec:
+        namespace['host_limits'] = HostLimits(**spec['host_limits'])
+    return type(name, (SpecCarrier,), namespace)
+
+
+def load(path: str, system_name: Optional[str] = None) -> Type[SpecCarrier]:
+    """
+    Read a spec from a JSON file and build its carrier.
+    :param path: The file.
+    :param system_name: The system name the spec must have, if it is known. See compile_spec.
+    :return: The carrier class.
+    """
+    try:
+        with open(path, encoding='utf-8') as file:
+            spec = json.load(file)
+    except ValueError as error:
+        raise ValueError(f'Invalid carrier spec {path}: it is not valid JSON ({error}).') from error
+    return compile_spec(spec, path, system_name)
+
+
+class CarrierRegistry:
+    """
+    Every carrier that can be scraped, by system name, loaded on first use.
+    Only the names of the spec files are listed up front. A carrier's module is imported, or its spec read and
+    compiled, when it is first asked for, so the startup time does not grow with the number of carriers.
+    Iterating over the registry loads every carrier.
+    Every method is thread-safe.
+    """
+
+    def __init__(self, directories: Iterable[str] = (), modules: Mapping[str, str] = MODULES):
+        """
+        :param directories: Where the specs are, as "<SYSTEM_NAME>.json" files. The first wins. By default, there
+                            are none: only the carriers written in Python are known. See add_directory.
+        :param modules: The module of each carrier written in Python, by system name. They win over the specs.
+        """
+        self.directories = list(directories)
+        self.modules = dict(modules)
+        self.loaded: Dict[str, Type[Carrier]] = {}
+        # The spec files by system name, once listed.
+        self.paths: Optional[Dict[str, str]] = None
+        self.lock = threading.Lock()
+
+    def add_directory(self, directory: str):
+        """
+        Look for specs in one more directory, before the others.
+        """
+        with self.lock:
+            self.directories.insert(0, directory)
+            self.paths = None
+
+    def spec_paths(self) -> Mapping[str, str]:
+        """
+        The spec file of each carrier, by system name.
+        """
+        with self.lock:
+            if self.paths is None:
+                self.paths = {}
+                for directory in reversed(self.directories):
+                    if not os.path.isdir(directory):
+                        continue
+                    for file_name in os.listdir(directory):
+                        system_name, extension = os.path.splitext(file_name)
+                        if extension == '.json':
+                            self.paths[system_name] = os.path.join(directory, file_name)
+            return self.paths
+
+    def names(self) -> List[str]:
+        """
+        The system name of every carrier, without loading any.
+        """
+        return sorted(set(self.modules) | set(self.spec_paths()))
+
+    def __contains__(self, system_name: str) -> bool:
+        return system_name in self.modules or system_name in self.spec_paths()
+
+    def __len__(self) -> int:
+        return len(self.names())
+
+    def __iter__(self) -> Iterator[Type[Carrier]]:
+        return (self.carrier(system_name) for system_name in self.names())
+
+    def carrier(self, system_name: str) -> Type[Carrier]:
+        """
+        Find a carrier by its system name, and load it if it is not loaded yet.
+        :param system_name: The name used for the carrier in the requests, like "MOCK_INDEMNITY".
+        :return: The carrier class.
+        """
+        carrier = self.loaded.get(system_name)
+        if carrier is not None:
+            return carrier
+        module = self.modules.get(system_name)
+        path = None if module is not None else self.spec_paths().get(system_name)
+        if module is None and path is None:
+            raise ValueError(f'Unknown carrier: "{system_name}".')
+        with self.lock:
+            carrier = self.loaded.get(system_name)
+            if carrier is None:
+                if module is not None:
+                    importlib.import_module(module)
+                    carrier = Carrier.named(system_name)
+                else:
+                    carrier = load(path, system_name)
+                self.loaded[system_name] = carrier
+        return carrier
+
+
+# The carriers the service scrapes.
+registry = CarrierRegistry()
+
+
+def named(system_name: str) -> Type[Carrier]:
+    """
+    Find a carrier by its system name, among those already loaded, or else in the registry.
+    """
+    carrier = Carrier.registry.get(system_name)
+    if carrier is not None:
+        return carrier
+    return registry.carrier(system_name)
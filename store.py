@@ -0,0 +1,361 @@
+"""
+A columnar store of every scraped policy, for questions about the whole portfolio.
+Each field is kept in its own array: premiums and rates as integers scaled to their smallest unit, dates as
+ordinals and statuses as their enum values. A question such as the total premium by status, or the policies
+terminating in the next 30 days, is then a few array operations instead of a loop over policy objects.
+"""
+
+import threading
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy
+
+from carrier import Policy
+from customtypes import PolicyFields, Status
+
+# How a policy field is kept in a column.
+# "encode" turns a field value into what the column holds, and "decode" turns it back.
+# "missing" is what the column holds for the policies that do not have the field.
+Column = namedtuple('Column', ['attribute', 'dtype', 'encode', 'decode', 'missing'])
+
+# The money amounts and rates are kept in hundredths: cents, or hundredths of a percent.
+SCALE = 100
+
+MISSING_INT = numpy.iinfo(numpy.int64).min
+
+
+def scale(value: Decimal) -> int:
+    """
+    A decimal as a whole number of hundredths, rounded to the nearest.
+    """
+    return int((value * SCALE).to_integral_value())
+
+
+def unscale(value: int) -> Decimal:
+    """
+    A whole number of hundredths as a decimal.
+    """
+    return Decimal(int(value)).scaleb(-2)
+
+
+def decode_status(code: int) -> Optional[Status]:
+    """
+    A status from its column, or None for the policies that do not have one.
+    """
+    return Status(code) if code else None
+
+
+# The columns of the store, by the policy field they hold.
+COLUMNS: Mapping[PolicyFields, Column] = {
+    PolicyFields.Premium: Column('premium', numpy.int64, scale, unscale, MISSING_INT),
+    PolicyFields.Status: Column('status', numpy.int8, lambda status: status.value, Status, 0),
+    PolicyFields.EffectiveDate: Column('effective_date', numpy.int32, date.toordinal, date.fromordinal, 0),
+    PolicyFields.TerminationDate: Column('termination_date', numpy.int32, date.toordinal, date.fromordinal, 0),
+    PolicyFields.LastPaymentDate: Column('last_payment_date', numpy.int32, date.toordinal, date.fromordinal, 0),
+    PolicyFields.CommissionRate: Column('commission_rate', numpy.int64, scale, unscale, MISSING_INT),
+    PolicyFields.NumberOfInsured: Column('number_of_insured', numpy.int32, int, int, -1),
+}
+
+# The columns by the name of the policy attribute they hold.
+ATTRIBUTES: Mapping[str, PolicyFields] = {column.attribute: field for field, column in COLUMNS.items()}
+
+# A customer, as the system name of its carrier and its ID.
+Key = Tuple[str, str]
+
+
+class PolicyStore:
+    """
+    Every policy of every stored customer, one row each, in growable arrays.
+    Scraping a customer again replaces all its rows. The rows it had are only marked as removed, and the
+    arrays are compacted once the removed rows outnumber the others.
+    Every method is thread-safe. A query holds the lock while it runs, which takes milliseconds, so it never
+    sees a customer half replaced.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        """
+        :param capacity: How many rows to make room for at first. The arrays double in size as needed.
+        """
+        self.lock = threading.Lock()
+        self.size = 0
+        self.removed = 0
+        self.columns: Dict[PolicyFields, numpy.ndarray] = {
+            field: numpy.full(capacity, column.missing, dtype=column.dtype) for field, column in COLUMNS.items()}
+        # Which customer and carrier each row belongs to, as their numbers below, and whether it is still current.
+        self.owners = numpy.zeros(capacity, dtype=numpy.int32)
+        self.carriers = numpy.zeros(capacity, dtype=numpy.int16)
+        self.live = numpy.zeros(capacity, dtype=bool)
+        self.ids: List[str] = []
+        # The numbers given to carriers and customers, and back.
+        self.carrier_codes: Dict[str, int] = {}
+        self.carrier_names: List[str] = []
+        self.customer_codes: Dict[Key, int] = {}
+        self.customer_keys: List[Key] = []
+        # The rows of each customer, by its number.
+        self.rows: Dict[int, numpy.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.size - self.removed
+
+    def code(self, codes: Dict, names: List, name) -> int:
+        """
+        The number of a carrier or a customer, given on first use. Must be called with the lock held.
+        """
+        number = codes.get(name)
+        if number is None:
+            number = codes[name] = len(names)
+            names.append(name)
+        return number
+
+    def reserve(self, count: int):
+        """
+        Make room for more rows. Must be called with the lock held.
+        """
+        needed = self.size + count
+        capacity = len(self.live)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for field, values in self.columns.items():
+            grown = numpy.full(capacity, COLUMNS[field].missing, dtype=values.dtype)
+            grown[:self.size] = values[:self.size]
+            self.columns[field] = grown
+        self.owners = numpy.resize(self.owners, capacity)
+        self.carriers = numpy.resize(self.carriers, capacity)
+        live = numpy.zeros(capacity, dtype=bool)
+        live[:self.size] = self.live[:self.size]
+        self.live = live
+
+    def replace(self, system_name: str, customer_id: str, policies: Iterable[Policy]):
+        """
+        Store the policies of a customer, in place of those it had.
+        :param system_name: The system name of the customer's carrier.
+        :param customer_id: The customer.
+        :param policies: All its policies, as scraped.
+        """
+        policies = list(policies)
+        # Encoded before taking the lock, so the queries do not wait for it.
+        encoded = self.encode(policies)
+        with self.lock:
+            carrier = self.code(self.carrier_codes, self.carrier_names, system_name)
+            owner = self.code(self.customer_codes, self.customer_keys, (system_name, customer_id))
+            self.forget(owner)
+            self.rows[owner] = self.append(carrier, owner, policies, encoded)
+            if self.removed > len(self):
+                self.compact()
+
+    def update(self, system_name: str, customer_id: str, policies: Iterable[Policy], removed: Iterable[str] = ()):
+        """
+        Store some policies of a customer, in place of those it had with the same IDs, and remove others.
+        The rest of its policies are left as they are, so this costs time in proportion to what changed.
+        :param system_name: The system name of the customer's carrier.
+        :param customer_id: The customer.
+        :param policies: The policies that were added or changed.
+        :param removed: The IDs of the policies that the customer no longer has.
+        """
+        policies = list(policies)
+        encoded = self.encode(policies)
+        gone = set(removed)
+        gone.update(policy.id for policy in policies)
+        with self.lock:
+            carrier = self.code(self.carrier_codes, self.carrier_names, system_name)
+            owner = self.code(self.customer_codes, self.customer_keys, (system_name, customer_id))
+            rows = self.rows.get(owner, numpy.arange(0))
+            dropped = numpy.fromiter((self.ids[row] in gone for row in rows), dtype=bool, count=len(rows))
+            self.live[rows[dropped]] = False
+            self.removed += int(numpy.count_nonzero(dropped))
+            self.rows[owner] = numpy.concatenate([rows[~dropped], self.append(carrier, owner, policies, encoded)])
+            if self.removed > len(self):
+                self.compact()
+
+    @staticmethod
+    def encode(policies: List[Policy]) -> Dict[PolicyFields, numpy.ndarray]:
+        """
+        The values of each column for some policies.
+        """
+        encoded = {}
+        for field, column in COLUMNS.items():
+            encoded[field] = numpy.fromiter(
+                (column.missing if value is None else column.encode(value)
+                 for value in (getattr(policy, column.attribute, None) for policy in policies)),
+                dtype=column.dtype, count=len(policies))
+        return encoded
+
+    def append(self, carrier: int, owner: int, policies: List[Policy],
+               encoded: Mapping[PolicyFields, numpy.ndarray]) -> numpy.ndarray:
+        """
+        Add rows for some policies of a customer. Must be called with the lock held.
+        :return: The new rows.
+        """
+        self.reserve(len(policies))
+        start, end = self.size, self.size + len(policies)
+        for field, values in encoded.items():
+            self.columns[field][start:end] = values
+        self.owners[start:end] = owner
+        self.carriers[start:end] = carrier
+        self.live[start:end] = True
+        self.ids.extend(policy.id for policy in policies)
+        self.size = end
+        return numpy.arange(start, end)
+
+    def remove(self, system_name: str, customer_id: str):
+        """
+        Remove every policy of a customer.
+        """
+        with self.lock:
+            owner = self.customer_codes.get((system_name, customer_id))
+            if owner is not None:
+                self.forget(owner)
+
+    def forget(self, owner: int):
+        """
+        Mark the rows of a customer as removed. Must be called with the lock held.
+        """
+        rows = self.rows.pop(owner, None)
+        if rows is not None:
+            self.live[rows] = False
+            self.removed += len(rows)
+
+    def compact(self):
+        """
+        Drop the removed rows. Must be called with the lock held.
+        """
+        kept = numpy.flatnonzero(self.live[:self.size])
+        for field, values in self.columns.items():
+            values[:len(kept)] = values[kept]
+            values[len(kept):self.size] = COLUMNS[field].missing
+        self.owners[:len(kept)] = self.owners[kept]
+        self.carriers[:len(kept)] = self.carriers[kept]
+        self.live[:len(kept)] = True
+        self.live[len(kept):self.size] = False
+        self.ids = [self.ids[row] for row in kept]
+        self.size = len(kept)
+        self.removed = 0
+        self.rows = {}
+        owners = self.owners[:self.size]
+        if self.size:
+            order = numpy.argsort(owners, kind='stable')
+            starts = numpy.flatnonzero(numpy.diff(owners[order], prepend=-1))
+            for rows in numpy.split(order, starts[1:]):
+                self.rows[int(owners[rows[0]])] = rows
+
+    def where(self, carrier: Optional[str] = None, status: Optional[Status] = None,
+              **ranges: Tuple) -> numpy.ndarray:
+        """
+        The mask of the current rows that meet the conditions of a query. Must be called with the lock held.
+        :param carrier: Only the policies of this carrier, by system name.
+        :param status: Only the policies in this status.
+        :param ranges: Only the policies whose attribute is within bounds, like
+                       termination_date=(date(2023, 1, 1), date(2023, 1, 31)). Both bounds are included, and
+                       either can be None. The policies without the attribute are left out.
+        """
+        mask = self.live[:self.size].copy()
+        if carrier is not None:
+            code = self.carrier_codes.get(carrier)
+            if code is None:
+                return numpy.zeros(self.size, dtype=bool)
+            mask &= self.carriers[:self.size] == code
+        if status is not None:
+            mask &= self.columns[PolicyFields.Status][:self.size] == status.value
+        for attribute, (low, high) in ranges.items():
+            field = self.field(attribute)
+            column, values = COLUMNS[field], self.columns[field][:self.size]
+            mask &= values != column.missing
+            if low is not None:
+                mask &= values >= column.encode(low)
+            if high is not None:
+                mask &= values <= column.encode(high)
+        return mask
+
+    @staticmethod
+    def field(attribute: str) -> PolicyFields:
+        """
+        The field of a column, by the name of the policy attribute it holds.
+        """
+        try:
+            return ATTRIBUTES[attribute]
+        except KeyError:
+            raise ValueError(f'No column for "{attribute}".')
+
+    def count(self, **conditions) -> int:
+        """
+        How many policies meet the conditions. See "where" for the conditions.
+        """
+        with self.lock:
+            return int(numpy.count_nonzero(self.where(**conditions)))
+
+    def total(self, attribute: str = 'premium', **conditions):
+        """
+        The sum of an attribute over the policies that meet the conditions and have it.
+        See "where" for the conditions.
+        """
+        field = self.field(attribute)
+        column = COLUMNS[field]
+        with self.lock:
+            values = self.columns[field][:self.size][self.where(**conditions)]
+            return column.decode(int(values[values != column.missing].sum()))
+
+    def group_by(self, key: str = 'status', attribute: str = 'premium', **conditions) -> Mapping:
+        """
+        The number of policies that meet the conditions, and the sum of an attribute over those that have it,
+        by group. See "where" for the conditions.
+        :param key: What to group by: "status", "carrier" or "customer".
+        :param attribute: The attribute to sum.
+        :return: (count, total) by Status, or None, by carrier system name, or by (carrier, customerId).
+        """
+        field = self.field(attribute)
+        column = COLUMNS[field]
+        with self.lock:
+            if key == 'status':
+                codes, decode = self.columns[PolicyFields.Status][:self.size], decode_status
+            elif key == 'carrier':
+                codes, decode = self.carriers[:self.size], self.carrier_names.__getitem__
+            elif key == 'customer':
+                codes, decode = self.owners[:self.size], self.customer_keys.__getitem__
+            else:
+                raise ValueError(f'Cannot group by "{key}".')
+            mask = self.where(**conditions)
+            codes, values = codes[mask], self.columns[field][:self.size][mask]
+            values = numpy.where(values != column.missing, values, 0)
+            counts = numpy.bincount(codes)
+            groups = numpy.flatnonzero(counts)
+            totals = self.sums(codes, values, len(counts))
+            return {decode(int(code)): (int(counts[code]), column.decode(int(totals[code]))) for code in groups}
+
+    @staticmethod
+    def sums(codes: numpy.ndarray, values: numpy.ndarray, groups: int) -> numpy.ndarray:
+        """
+        The sum of the values of each code, exact.
+        """
+        # Floats add whole numbers exactly up to 2 ** 53, which is the usual case, and the fastest.
+        if int(numpy.abs(values).sum()) < 2 ** 53:
+            return numpy.rint(numpy.bincount(codes, weights=values, minlength=groups)).astype(numpy.int64)
+        order = numpy.argsort(codes, kind='stable')
+        codes = codes[order]
+        starts = numpy.flatnonzero(numpy.diff(codes, prepend=-1))
+        totals = numpy.zeros(groups, dtype=numpy.int64)
+        if len(starts):
+            totals[codes[starts]] = numpy.add.reduceat(values[order], starts)
+        return totals
+
+    def select(self, **conditions) -> List[Tuple[str, str]]:
+        """
+        The carrier system name and the ID of each policy that meets the conditions.
+        See "where" for the conditions.
+        """
+        with self.lock:
+            rows = numpy.flatnonzero(self.where(**conditions))
+            return [(self.carrier_names[self.carriers[row]], self.ids[row]) for row in rows]
+
+
+def next_days(days: int, today: Optional[date] = None) -> Tuple[date, date]:
+    """
+    The dates from today to a number of days from now, as bounds for a query, like
+    store.count(termination_date=next_days(30)).
+    """
+    today = today or date.today()
+    return today, today + timedelta(days=days)
@@ -0,0 +1,41 @@
+"""
+Shared fixtures. Most of the state of the scrapes is kept on classes, so each test gets its own, offline.
+"""
+
+import pytest
+
+import fixtures
+from changes import PageMemo
+from fetchdata import FetchData
+from indexes import Indexes
+from ratelimit import HostLimiter
+from responses import ResponseCache
+from rest import MockRestService
+from serialize import COMPACT, COMPATIBLE
+from store import PolicyStore
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    """
+    Scrape the synthetic pages of the fixtures module into fresh stores: 5 policies on each page, and 2 pages for
+    each Placeholder Insurance customer. Nothing is cached, saved or measured.
+    :return: The transport, whose pages can be overridden.
+    """
+    transport = fixtures.transport(policies=5, pages=2)
+    monkeypatch.setattr(FetchData, 'transport', transport)
+    monkeypatch.setattr(FetchData, 'limiter', HostLimiter())
+    monkeypatch.setattr(FetchData, 'cache', None)
+    monkeypatch.setattr(FetchData, 'store', PolicyStore())
+    monkeypatch.setattr(FetchData, 'indexes', Indexes())
+    monkeypatch.setattr(FetchData, 'snapshots', None)
+    monkeypatch.setattr(FetchData, 'parsers', None)
+    monkeypatch.setattr(FetchData, 'metrics', None)
+    monkeypatch.setattr(FetchData, 'pages', PageMemo())
+    monkeypatch.setattr(FetchData, 'subscribers', [])
+    monkeypatch.setattr(MockRestService, 'Data', {})
+    monkeypatch.setattr(MockRestService, 'Failures', {})
+    monkeypatch.setattr(MockRestService, 'Unrestored', {})
+    monkeypatch.setattr(MockRestService, 'Responses',
+                        {False: ResponseCache(COMPATIBLE), True: ResponseCache(COMPACT)})
+    return transport
@@ -0,0 +1,74 @@
+import dataclasses
+from datetime import date
+from decimal import Decimal
+
+from changes import PageMemo, PageRead, diff
+from customtypes import Agent, Customer, Status
+from mock import MockPolicy
+
+AGENT = Agent('Agent', 'PC-1', 'Agency', 'AG-1')
+
+
+def policy(policy_id: str, premium: str = '10.00', status: Status = Status.active) -> MockPolicy:
+    return MockPolicy(policy_id, Decimal(premium), status, date(2021, 1, 4), date(2024, 1, 4), date(2023, 1, 4))
+
+
+def customer(*policies: MockPolicy, email: str = 'c1@example.com') -> Customer:
+    return Customer('Customer', 'c1', email, '1 Main St', None, AGENT, {item.id: item for item in policies})
+
+
+def test_new_customer_adds_every_policy():
+    new = customer(policy('a'), policy('b'))
+    delta = diff('MOCK_INDEMNITY', None, new)
+    assert delta and delta.customer_changed and delta.previous is None
+    assert delta.added == new.policies and not delta.removed and not delta.modified
+
+
+def test_diff_swaps_unchanged_policies_for_the_stored_ones():
+    previous = customer(policy('a'), policy('b'), policy('c'))
+    # Scraped again: the same values, but new objects.
+    new = customer(policy('a'), policy('b', '20.00'), policy('d'))
+    delta = diff('MOCK_INDEMNITY', previous, new)
+    assert delta and not delta.customer_changed
+    assert new.policies['a'] is previous.policies['a']
+    assert delta.added == {'d': new.policies['d']}
+    assert delta.removed == {'c': previous.policies['c']}
+    assert delta.modified == {'b': (previous.policies['b'], new.policies['b'])}
+    assert delta.customer_id == 'c1'
+
+
+def test_unchanged_customer_is_an_empty_delta():
+    previous = customer(policy('a'), policy('b'))
+    new = customer(policy('a'), policy('b'))
+    delta = diff('MOCK_INDEMNITY', previous, new)
+    assert not delta
+    assert all(new.policies[key] is previous.policies[key] for key in previous.policies)
+    # The customer's own fields count too, but not its version.
+    new.version = previous.version + 1
+    assert not diff('MOCK_INDEMNITY', previous, new)
+    moved = dataclasses.replace(new, email='other@example.com')
+    assert diff('MOCK_INDEMNITY', previous, moved).customer_changed
+
+
+def test_memo_forgets_what_changed_and_what_is_least_used():
+    memo = PageMemo(max_pages=2, max_customers=1)
+    reads = {uri: PageRead(uri.encode(), None, None, [], None, None) for uri in ('p1', 'p2', 'p3')}
+    memo.put(('MOCK_INDEMNITY', 'p1'), reads['p1'])
+    memo.put(('MOCK_INDEMNITY', 'p2'), reads['p2'])
+    assert memo.get(('MOCK_INDEMNITY', 'p1'), b'p1') is reads['p1']
+    # A page whose content changed is read again.
+    assert memo.get(('MOCK_INDEMNITY', 'p1'), b'changed') is None
+    # Another carrier's page at the same address is not the same page.
+    assert memo.get(('PLACEHOLDER_CARRIER', 'p1'), b'p1') is None
+    # p1 was used last, so p2 goes first.
+    memo.put(('MOCK_INDEMNITY', 'p3'), reads['p3'])
+    assert memo.get(('MOCK_INDEMNITY', 'p2'), b'p2') is None
+    assert memo.get(('MOCK_INDEMNITY', 'p1'), b'p1') is reads['p1']
+    assert memo.get(('MOCK_INDEMNITY', 'p3'), b'p3') is reads['p3']
+
+    memo.remember_rows(('MOCK_INDEMNITY', 'c1'), {b'a': 'a'})
+    memo.remember_rows(('MOCK_INDEMNITY', 'c2'), {b'b': 'b'})
+    assert memo.known_rows(('MOCK_INDEMNITY', 'c1')) == {}
+    assert memo.known_rows(('MOCK_INDEMNITY', 'c2')) == {b'b': 'b'}
+    memo.clear()
+    assert memo.get(('MOCK_INDEMNITY', 'p3'), b'p3') is None and memo.known_rows(('MOCK_INDEMNITY', 'c2')) == {}
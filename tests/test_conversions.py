@@ -0,0 +1,85 @@
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+import pytest
+
+from conversions import convert_column, convert_rows, date_parser, memoized, parse_decimal, to_decimal
+
+SEPARATORS = frozenset(['-', '/'])
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1/31/2022', date(2022, 1, 31)),
+    ('12-05-2021', date(2021, 12, 5)),
+    (':3/4/2020', date(2020, 3, 4)),
+    (': 3 / 4 / 2020 ', date(2020, 3, 4)),
+])
+def test_dates_are_read_month_first(text, expected):
+    assert date_parser(SEPARATORS)(text) == expected
+
+
+@pytest.mark.parametrize('text', ['1/31-2022', '1-31/2022', '1.31.2022', '2022', '1/31/', 'a/b/c', '2/30/2022'])
+def test_dates_that_cannot_be_read_raise(text):
+    with pytest.raises(ValueError):
+        date_parser(SEPARATORS)(text)
+
+
+def test_dates_only_take_their_carriers_separators():
+    assert date_parser(frozenset('.'))('1.31.2022') == date(2022, 1, 31)
+    with pytest.raises(ValueError):
+        date_parser(frozenset('.'))('1/31/2022')
+
+
+def test_date_parsers_and_their_dates_are_memoized():
+    parse = date_parser(SEPARATORS)
+    assert date_parser(frozenset(['/', '-'])) is parse
+    first = parse('6/7/2023')
+    hits = parse.cache_info().hits
+    assert parse('6/7/2023') is first
+    assert parse.cache_info().hits == hits + 1
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('101.01', Decimal('101.01')),
+    ('Premium: 101.01', Decimal('101.01')),
+    ('$ 101.01', Decimal('101.01')),
+    ('USD 101.01', Decimal('101.01')),
+    ('12.5%', Decimal('12.5')),
+    ('Commission rate: 12.5%', Decimal('12.5')),
+])
+def test_decimals_are_read_after_their_label_or_currency(text, expected):
+    assert parse_decimal(text) == expected
+    assert to_decimal(text) == expected
+
+
+def test_decimals_without_a_space_after_their_currency_raise():
+    with pytest.raises(InvalidOperation):
+        parse_decimal('$101.01')
+
+
+def test_decimals_are_memoized():
+    first = to_decimal('Premium: 555.55')
+    hits = to_decimal.cache_info().hits
+    assert to_decimal('Premium: 555.55') is first
+    assert to_decimal.cache_info().hits == hits + 1
+
+
+def test_memo_is_bounded():
+    converter = memoized(str.upper, size=2)
+    for text in ('a', 'b', 'c', 'a'):
+        converter(text)
+    info = converter.cache_info()
+    assert info.currsize == 2 and info.hits == 0
+
+
+def test_columns_convert_each_distinct_text_once():
+    calls = []
+
+    def convert(text: str) -> int:
+        calls.append(text)
+        return int(text)
+
+    assert convert_column(convert, ['1', '2', '1', '1']) == [1, 2, 1, 1]
+    assert calls == ['1', '2']
+    assert convert_rows([int, str.upper], [('1', 'a'), ('2', 'b')]) == [[1, 'A'], [2, 'B']]
+    assert convert_rows([int], []) == []
@@ -0,0 +1,32 @@
+import dataclasses
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from customtypes import Agent, Customer, Status
+from mock import MockPolicy
+from placeholder import PlaceholderPolicy
+
+POLICIES = [
+    MockPolicy('M-1', Decimal('10.00'), Status.active, date(2021, 1, 4), date(2024, 1, 4), date(2023, 1, 4)),
+    PlaceholderPolicy('P-1', Decimal('10.00'), Status.active, date(2021, 1, 4), date(2024, 1, 4), date(2023, 1, 4),
+                      Decimal('5'), 2),
+]
+
+
+@pytest.mark.parametrize('value', POLICIES + [Agent('Agent', 'PC-1', 'Agency', 'AG-1')])
+def test_policies_and_agents_are_slotted_and_frozen(value):
+    assert not hasattr(value, '__dict__')
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        setattr(value, dataclasses.fields(value)[0].name, 'changed')
+    # Frozen values can be shared and looked up by value.
+    assert hash(value) == hash(dataclasses.replace(value))
+
+
+def test_customer_is_slotted_but_can_be_linked_after_it_is_built():
+    customer = Customer('Customer', 'c1', 'c1@example.com', '1 Main St')
+    assert not hasattr(customer, '__dict__')
+    customer.policies = {policy.id: policy for policy in POLICIES}
+    customer.version = 3
+    assert customer.policies['P-1'] is POLICIES[1]
@@ -0,0 +1,133 @@
+import threading
+from decimal import Decimal
+
+import fixtures
+from cache import PageCache
+from fetchdata import FetchData
+from mock import Mock
+from placeholder import Placeholder
+from ratelimit import HostLimiter, HostLimits
+from session import ScrapeSession
+from transport import LocalTransport, Response
+
+
+def test_304_without_a_cached_page_is_requested_again(offline, monkeypatch):
+    sent = []
+
+    def page(uri, headers):
+        sent.append(dict(headers))
+        # Answers as if the page were cached, whatever the request says.
+        return Response(304, {}, b'') if len(sent) == 1 else Response(200, {'etag': '"v1"'}, b'fresh')
+
+    monkeypatch.setattr(FetchData, 'transport', LocalTransport({'http://carrier/page': page}))
+    monkeypatch.setattr(FetchData, 'cache', PageCache())
+    assert FetchData.download('http://carrier/page') == b'fresh'
+    assert sent == [{}, {}]
+    assert FetchData.cache.get('http://carrier/page').body == b'fresh'
+
+
+def test_304_revalidates_the_cached_page(offline, monkeypatch):
+    sent = []
+
+    def page(uri, headers):
+        sent.append(dict(headers))
+        return Response(304, {}, b'') if headers else Response(200, {'etag': '"v1"'}, b'first')
+
+    monkeypatch.setattr(FetchData, 'transport', LocalTransport({'http://carrier/page': page}))
+    monkeypatch.setattr(FetchData, 'cache', PageCache())
+    assert FetchData.download('http://carrier/page') == b'first'
+    assert FetchData.download('http://carrier/page') == b'first'
+    assert sent == [{}, {'If-None-Match': '"v1"'}]
+
+
+def scrape_mock(monkeypatch, fetcher: FetchData, page: str):
+    """
+    Scrape customer c1 of Mock Indemnity, as it is on a page, into a fetcher.
+    :return: The scrape's session.
+    """
+    uri = Mock.URI_TEMPLATE.format(customer_id='c1')
+    monkeypatch.setattr(FetchData, 'transport', LocalTransport({uri: page}))
+    return fetcher.fetch_my_carrier('c1')
+
+
+def test_rescrape_without_changes_keeps_the_stored_version(offline, monkeypatch):
+    deltas = []
+    monkeypatch.setattr(FetchData, 'subscribers', [deltas.append])
+    fetcher = FetchData(Mock)
+    first = scrape_mock(monkeypatch, fetcher, fixtures.mock_page('c1', 5)).customer
+    again = scrape_mock(monkeypatch, fetcher, fixtures.mock_page('c1', 5))
+    assert not again.delta
+    assert again.customer is first and again.customer.version == first.version
+    # Read again in full, without the memo.
+    FetchData.pages.clear()
+    assert scrape_mock(monkeypatch, fetcher, fixtures.mock_page('c1', 5)).customer is first
+    assert len(deltas) == 1
+
+
+def test_rescrape_adds_removes_and_modifies_policies(offline, monkeypatch):
+    deltas = []
+    monkeypatch.setattr(FetchData, 'subscribers', [deltas.append])
+    fetcher = FetchData(Mock)
+    first = scrape_mock(monkeypatch, fetcher, fixtures.mock_page('c1', 5)).customer
+    # Policy 4 is gone, policy 5 is new, and the premium of policy 1 changed.
+    page = (fixtures.mock_page('c1', 6).replace(fixtures.mock_policy('c1', 4), '')
+            .replace('<span>101.01</span>', '<span>999.99</span>'))
+    session = scrape_mock(monkeypatch, fetcher, page)
+    delta, second = session.delta, session.customer
+    assert set(delta.added) == {'c1-M000005'}
+    assert set(delta.removed) == {'c1-M000004'}
+    assert set(delta.modified) == {'c1-M000001'}
+    assert delta.modified['c1-M000001'][1].premium == Decimal('999.99')
+    assert second.version > first.version and deltas == [deltas[0], delta]
+    for policy_id in ('c1-M000000', 'c1-M000002', 'c1-M000003'):
+        assert second.policies[policy_id] is first.policies[policy_id]
+    assert FetchData.store.count(carrier='MOCK_INDEMNITY') == 5
+    assert FetchData.store.total(carrier='MOCK_INDEMNITY') == sum(policy.premium
+                                                                  for policy in second.policies.values())
+    assert {policy.id for policy in FetchData.indexes.policies.values()} == set(second.policies)
+    assert fetcher.policies == second.policies
+
+
+def test_next_page_downloads_while_a_page_is_read(offline, monkeypatch):
+    requested = threading.Event()
+    pages = fixtures.transport(policies=5, pages=2).handler
+
+    def handler(uri, headers):
+        if uri.endswith('/2'):
+            requested.set()
+        return pages(uri, headers)
+
+    read = Placeholder.fetch_changed_page.__func__
+    seen = []
+
+    def fetch_changed_page(cls, tree, known, metrics=None):
+        if not seen:
+            # The first page is read only once the second has been asked for.
+            seen.append(requested.wait(5))
+        return read(cls, tree, known, metrics)
+
+    monkeypatch.setattr(FetchData, 'transport', LocalTransport(handler=handler))
+    monkeypatch.setattr(Placeholder, 'fetch_changed_page', classmethod(fetch_changed_page))
+    session = FetchData(Placeholder).fetch_my_carrier('p1')
+    assert seen == [True]
+    assert session.page == 2 and len(session.policies) == 10
+
+
+def test_throttled_request_backs_off_the_host_even_when_its_retry_succeeds(offline, monkeypatch):
+    answers = [Response(429, {'retry-after': '0'}, b''), Response(200, {}, b'page')]
+    transport = LocalTransport({'http://carrier/page': lambda uri, headers: answers.pop(0)})
+    monkeypatch.setattr(FetchData, 'transport', transport)
+    monkeypatch.setattr(FetchData, 'limiter', HostLimiter(limits=HostLimits(concurrency=8, latency_tolerance=None)))
+    assert FetchData.download('http://carrier/page') == b'page'
+    assert transport.requests == ['http://carrier/page'] * 2
+    # Halved by the 429, then grown back by a little by the retry.
+    assert FetchData.limiter.concurrency('http://carrier/page') < 8
+    assert FetchData.limiter.state('carrier').in_flight == 0
+
+
+def test_streamed_policies_are_read_outside_the_slot_of_their_page(offline):
+    fetcher = FetchData(Mock, stream=True)
+    session = ScrapeSession(Mock, Mock.uri('c1'))
+    host = FetchData.limiter.state(FetchData.limiter.host(Mock.uri('c1')))
+    in_flight = [host.in_flight for _ in fetcher.stream_policies(session)]
+    assert len(in_flight) == 5 and set(in_flight) == {0}
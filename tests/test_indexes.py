@@ -0,0 +1,64 @@
+import dataclasses
+from datetime import date
+from decimal import Decimal
+
+from changes import diff
+from customtypes import Agent, Customer, Status
+from indexes import Indexes
+from mock import MockPolicy
+
+AGENT = Agent('Agent', 'PC-1', 'Agency', 'AG-1')
+
+
+def policy(policy_id: str, status: Status = Status.active, termination: date = date(2024, 1, 4)) -> MockPolicy:
+    return MockPolicy(policy_id, Decimal('10.00'), status, date(2021, 1, 4), termination, date(2023, 1, 4))
+
+
+def customer(*policies: MockPolicy, email: str = 'C1@example.com ', agent: Agent = AGENT) -> Customer:
+    return Customer('Customer', 'c1', email, '1 Main St', None, agent, {item.id: item for item in policies})
+
+
+def ids(policies) -> set:
+    return {item.id for item in policies}
+
+
+def test_apply_indexes_only_what_changed():
+    indexes = Indexes()
+    first = customer(policy('a'), policy('b'), policy('c', termination=date(2024, 6, 1)))
+    indexes.replace('MOCK_INDEMNITY', first)
+    assert indexes.customers_by_email('c1@example.com') == [first]
+    assert ids(indexes.policies_by_status(Status.active)) == {'a', 'b', 'c'}
+
+    moved_agent = dataclasses.replace(AGENT, producer_code='PC-2')
+    second = customer(policy('a'), policy('b', Status.claim_pending), policy('d'), email='new@example.com',
+                      agent=moved_agent)
+    delta = diff('MOCK_INDEMNITY', first, second)
+    indexes.apply(delta)
+    assert indexes.customers_by_email('c1@example.com') == []
+    assert indexes.customers_by_email('NEW@example.com') == [second]
+    assert indexes.customers_by_producer('PC-1') == [] and indexes.customers_by_producer('PC-2') == [second]
+    assert ids(indexes.policies_by_status(Status.active)) == {'a', 'd'}
+    assert ids(indexes.policies_by_status(Status.claim_pending)) == {'b'}
+    assert ids(indexes.policies_between('termination_date', date(2024, 5, 1))) == set()
+    assert ids(indexes.policies_between('termination_date', end=date(2024, 1, 4))) == {'a', 'b', 'd'}
+    # The unchanged policy is still the object that was first indexed.
+    assert indexes.policies[('MOCK_INDEMNITY', 'a')] is first.policies['a']
+
+
+def test_remove_unindexes_everything():
+    indexes = Indexes()
+    indexes.replace('MOCK_INDEMNITY', customer(policy('a'), policy('b', Status.claim_rejected)))
+    indexes.remove('MOCK_INDEMNITY', 'c1')
+    assert indexes.customers == {} and indexes.policies == {}
+    assert not indexes.by_producer and not indexes.by_agency and not indexes.by_email and not indexes.by_status
+    assert indexes.policies_between('effective_date') == []
+
+
+def test_policy_taken_over_by_another_customer_stays_indexed():
+    indexes = Indexes()
+    indexes.replace('MOCK_INDEMNITY', customer(policy('a')))
+    other = dataclasses.replace(customer(policy('a', Status.claim_pending)), id='c2')
+    indexes.replace('MOCK_INDEMNITY', other)
+    indexes.remove('MOCK_INDEMNITY', 'c1')
+    assert indexes.policies_by_status(Status.claim_pending) == [other.policies['a']]
+    assert indexes.policies_by_status(Status.active) == []
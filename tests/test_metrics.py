@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from fetchdata import FetchData
+from metrics import Metrics
+from rest import MockRestService
+from server import ScrapeServer
+
+
+def test_export_writes_the_prometheus_text_format():
+    metrics = Metrics()
+    metrics.count('downloaded_bytes_total', 100, host='a.example')
+    metrics.count('downloaded_bytes_total', 50, host='a.example')
+    metrics.count('policy_changes_total', 2, carrier='C', kind='added')
+    metrics.observe('parse_seconds', 0.25, parser='lxml "fast"\\\n')
+    metrics.observe('parse_seconds', 0.5, parser='lxml "fast"\\\n')
+    metrics.observe('custom_seconds', 1)
+    assert metrics.export() == (
+        '# TYPE adapt_custom_seconds summary\n'
+        'adapt_custom_seconds_count 1\n'
+        'adapt_custom_seconds_sum 1\n'
+        '# HELP adapt_downloaded_bytes_total Bytes of pages downloaded, by host.\n'
+        '# TYPE adapt_downloaded_bytes_total counter\n'
+        'adapt_downloaded_bytes_total{host="a.example"} 150\n'
+        '# HELP adapt_parse_seconds Time spent parsing pages into trees, by parser.\n'
+        '# TYPE adapt_parse_seconds summary\n'
+        'adapt_parse_seconds_count{parser="lxml \\"fast\\"\\\\\\n"} 2\n'
+        'adapt_parse_seconds_sum{parser="lxml \\"fast\\"\\\\\\n"} 0.75\n'
+        '# HELP adapt_policy_changes_total Policies added, removed or modified by scraping customers again, '
+        'by carrier and kind.\n'
+        '# TYPE adapt_policy_changes_total counter\n'
+        'adapt_policy_changes_total{carrier="C",kind="added"} 2\n'
+    )
+
+
+def test_merge_adds_the_samples_of_workers():
+    metrics, worker = Metrics(), Metrics()
+    metrics.count('policies_total', 3, carrier='C')
+    metrics.observe('xpath_seconds', 1.0, carrier='C', field='id')
+    worker.count('policies_total', 2, carrier='C')
+    worker.count('policies_total', 7, carrier='D')
+    worker.observe('xpath_seconds', 0.5, carrier='C', field='id')
+    worker.observe('xpath_seconds', 0.5, carrier='C', field='id')
+    metrics.merge(worker.samples())
+    counters, summaries = metrics.samples()
+    assert counters == {('policies_total', (('carrier', 'C'),)): 5, ('policies_total', (('carrier', 'D'),)): 7}
+    assert summaries == {('xpath_seconds', (('carrier', 'C'), ('field', 'id'))): [3, 2.0]}
+    # The worker's own samples are left as they were.
+    assert worker.samples()[0][('policies_total', (('carrier', 'C'),))] == 2
+    metrics.reset()
+    assert metrics.samples() == ({}, {})
+
+
+def test_timer_records_even_when_the_block_raises():
+    metrics = Metrics()
+    with metrics.timer('scrape_seconds', carrier='C'):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.timer('scrape_seconds', carrier='C'):
+            raise RuntimeError('boom')
+    (count, total), = metrics.samples()[1].values()
+    assert count == 2 and total >= 0
+
+
+def get(server: ScrapeServer, path: str) -> tuple:
+    """
+    Send one GET to a started server, and read its status, headers and body.
+    """
+    async def send():
+        listening = await server.start()
+        port = listening.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET {path} HTTP/1.1\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        answer = await reader.read()
+        writer.close()
+        listening.close()
+        head, _, body = answer.partition(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        headers = dict(line.lower().split(': ', 1) for line in lines[1:])
+        return int(lines[0].split()[1]), headers, body
+
+    return asyncio.run(send())
+
+
+def test_metrics_are_served_once_they_are_recorded(offline, monkeypatch):
+    server = ScrapeServer(MockRestService(eager=False), port=0)
+    assert get(server, '/metrics')[0] == 404
+    monkeypatch.setattr(FetchData, 'metrics', Metrics())
+    FetchData(MockRestService.carrier('MOCK_INDEMNITY')).fetch_my_carrier('c1')
+    status, headers, body = get(server, '/metrics')
+    assert status == 200
+    assert headers['content-type'] == 'text/plain; version=0.0.4'
+    assert body.decode('utf-8') == FetchData.metrics.export()
+    assert 'adapt_scrape_seconds_count{carrier="MOCK_INDEMNITY"} 1\n' in body.decode('utf-8')
@@ -0,0 +1,52 @@
+import threading
+
+import fixtures
+from fetchdata import FetchData
+from parsepool import ParsePool
+from placeholder import Placeholder
+from rest import MockRestService
+from transport import LocalTransport
+
+
+def test_link_is_sent_before_the_page_is_read():
+    links = []
+    sent = threading.Event()
+
+    def on_link(link):
+        links.append(link)
+        sent.set()
+
+    with ParsePool([Placeholder], max_workers=1) as pool:
+        page = pool.submit(Placeholder, fixtures.placeholder_page('p1', 1, 2, 5).encode(), first=True,
+                           on_link=on_link).result()
+        assert sent.wait(10)
+        assert page.next_page == links[0] == Placeholder.uri('p1').rsplit('/', 1)[0] + '/2'
+        assert len(page.policies) == 5 and page.customer is not None
+        assert pool.waiting == {}
+    assert not pool.listener.is_alive()
+
+
+def test_next_page_downloads_while_the_pool_reads(offline, monkeypatch):
+    pages = fixtures.transport(policies=200, pages=3).handler
+    threads = {}
+
+    def handler(uri, headers):
+        threads[uri.rsplit('/', 1)[1]] = threading.current_thread().name
+        return pages(uri, headers)
+
+    monkeypatch.setattr(FetchData, 'transport', LocalTransport(handler=handler))
+    with ParsePool([Placeholder], max_workers=1) as pool:
+        monkeypatch.setattr(FetchData, 'parsers', pool)
+        session = FetchData(Placeholder).fetch_my_carrier('p1')
+    assert len(session.policies) == 600
+    assert not threads['1'].startswith('prefetch')
+    assert threads['2'].startswith('prefetch') and threads['3'].startswith('prefetch')
+
+
+def test_service_stops_the_pool_it_started(offline):
+    with MockRestService(eager=False, processes=1) as service:
+        pool = service.parsers
+        assert FetchData.parsers is pool
+        assert service.scrape_customer('PLACEHOLDER_CARRIER', 'p1').id == 'p1'
+    assert FetchData.parsers is None and service.parsers is None
+    assert not pool.listener.is_alive()
@@ -0,0 +1,76 @@
+import time
+import urllib.error
+from typing import Optional
+
+import pytest
+
+from ratelimit import HostLimiter, HostLimits
+
+URI = 'http://carrier.example/page'
+
+
+def limiter(**limits) -> HostLimiter:
+    # The latency is left out, so that only the answers move the limit.
+    return HostLimiter(limits=HostLimits(**dict(dict(concurrency=8, latency_tolerance=None), **limits)))
+
+
+def request(hosts: HostLimiter, error: Optional[BaseException] = None, overload: bool = False):
+    """
+    Make a request through the limiter that succeeds, is answered as overloaded, or raises an error.
+    """
+    try:
+        with hosts.slot(URI) as slot:
+            if overload:
+                slot.overload()
+            if error is not None:
+                raise error
+    except BaseException as raised:
+        if raised is not error:
+            raise
+
+
+def test_limit_grows_on_success():
+    hosts = limiter()
+    for _ in range(8):
+        request(hosts)
+    # By about one for each round of as many requests as the limit.
+    assert 8.9 < hosts.concurrency(URI) < 9
+    for _ in range(200):
+        request(hosts)
+    assert hosts.concurrency(URI) == HostLimits().max_concurrency
+
+
+@pytest.mark.parametrize('failure', [
+    dict(error=ConnectionResetError()),
+    dict(error=urllib.error.HTTPError(URI, 429, 'Too Many Requests', {}, None)),
+    dict(error=urllib.error.HTTPError(URI, 503, 'Service Unavailable', {}, None)),
+    dict(overload=True),
+])
+def test_limit_shrinks_on_overload(failure):
+    hosts = limiter()
+    request(hosts, **failure)
+    assert hosts.concurrency(URI) == 4
+    request(hosts, **failure)
+    assert hosts.concurrency(URI) == 2
+    for _ in range(5):
+        request(hosts, **failure)
+    assert hosts.concurrency(URI) == HostLimits().min_concurrency
+
+
+@pytest.mark.parametrize('error', [ValueError('bad page'), urllib.error.HTTPError(URI, 404, 'Not Found', {}, None),
+                                   GeneratorExit()])
+def test_other_failures_leave_the_limit(error):
+    hosts = limiter()
+    request(hosts, error)
+    assert hosts.concurrency(URI) == 8
+    assert hosts.state(hosts.host(URI)).in_flight == 0
+
+
+def test_token_bucket_spaces_out_starts():
+    hosts = limiter(rate=50, burst=1)
+    starts = []
+    for _ in range(5):
+        with hosts.slot(URI):
+            starts.append(time.monotonic())
+    # One start every 1 / rate seconds on average. A start that was late lets the next one catch up.
+    assert starts[-1] - starts[0] >= 0.075
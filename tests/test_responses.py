@@ -0,0 +1,41 @@
+import gzip
+import json
+
+import fixtures
+from fetchdata import FetchData
+from mock import Mock
+from rest import MockRestService
+
+REQUESTS = [{'carrier': 'MOCK_INDEMNITY', 'customerId': 'c1'}, {'carrier': 'PLACEHOLDER_CARRIER', 'customerId': 'p1'}]
+
+
+def test_gzipped_answer_decompresses_to_the_plain_one(offline):
+    service = MockRestService(eager=False)
+    for request in REQUESTS:
+        service.scrape_customer(request['carrier'], request['customerId'])
+    for compact in (True, False):
+        plain = service.respond_bytes(REQUESTS, compact, gzip=False)
+        assert gzip.decompress(service.respond_bytes(REQUESTS, compact, gzip=True)) == plain
+        # Served from the cached fragments the second time.
+        assert gzip.decompress(service.respond_bytes(REQUESTS, compact, gzip=True)) == plain
+    assert json.loads(plain)['PLACEHOLDER_CARRIER']['p1']['id'] == 'p1'
+
+
+def served_policies(service: MockRestService, compressed: bool) -> int:
+    """
+    How many policies the answer for customer c1 of Mock Indemnity has.
+    """
+    answer = service.respond_bytes(REQUESTS[:1], gzip=compressed)
+    return len(json.loads(gzip.decompress(answer) if compressed else answer)['MOCK_INDEMNITY']['c1']['policies'])
+
+
+def test_rescraped_customer_is_served_with_its_new_content(offline, monkeypatch):
+    service = MockRestService(eager=False)
+    service.scrape_customer('MOCK_INDEMNITY', 'c1')
+    assert served_policies(service, False) == served_policies(service, True) == 5
+
+    uri = Mock.URI_TEMPLATE.format(customer_id='c1')
+    monkeypatch.setattr(FetchData, 'transport',
+                        fixtures.transport(policies=5, overrides={uri: fixtures.mock_page('c1', 7)}))
+    service.scrape_customer('MOCK_INDEMNITY', 'c1')
+    assert served_policies(service, False) == served_policies(service, True) == 7
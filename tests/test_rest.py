@@ -0,0 +1,74 @@
+import threading
+import time
+from typing import List, Type
+
+import fixtures
+from carrier import Carrier
+from mock import Mock
+from rest import MockRestService
+
+
+def test_unknown_carrier_does_not_stop_bulk_scrape(offline):
+    service = MockRestService(eager=False)
+    results = list(service.scrape_customers([('NOPE', 'x'), ('MOCK_INDEMNITY', 'c1'), ('NOPE', 'y'),
+                                             ('PLACEHOLDER_CARRIER', 'p1')], max_workers=1))
+    failed = {(result.carrier, result.customer_id) for result in results if result.error is not None}
+    scraped = {(result.carrier.system_name, result.customer.id) for result in results if result.error is None}
+    assert failed == {('NOPE', 'x'), ('NOPE', 'y')}
+    assert all(isinstance(result.error, ValueError) for result in results if result.error is not None)
+    assert scraped == {('MOCK_INDEMNITY', 'c1'), ('PLACEHOLDER_CARRIER', 'p1')}
+
+
+class Carriers:
+    """
+    Stands in for the registry, with a few carriers only.
+    """
+
+    def __init__(self, *carriers: Type[Carrier]):
+        self.carriers = {carrier.system_name: carrier for carrier in carriers}
+
+    def names(self) -> List[str]:
+        return sorted(self.carriers)
+
+    def carrier(self, system_name: str) -> Type[Carrier]:
+        return self.carriers[system_name]
+
+
+def test_failing_and_slow_carriers_do_not_stop_the_others(offline, monkeypatch):
+    monkeypatch.setattr(Carrier, 'registry', dict(Carrier.registry))
+
+    class Broken(Mock):
+        name = 'Broken'
+        system_name = 'BROKEN'
+        URI = 'http://broken.example/customer'
+
+    class Slow(Mock):
+        name = 'Slow'
+        system_name = 'SLOW'
+        URI = 'http://slow.example/customer'
+
+    released = threading.Event()
+
+    def broken(uri, headers):
+        raise RuntimeError('The carrier is down.')
+
+    def slow(uri, headers):
+        released.wait(5)
+        return fixtures.mock_page('s1', 5)
+
+    offline.pages.update({Broken.URI: broken, Slow.URI: slow,
+                          Mock.URI: fixtures.mock_page(Mock.DEFAULT_CUSTOMER, 5)})
+    monkeypatch.setattr(MockRestService, 'Carriers', Carriers(Mock, Broken, Slow))
+    try:
+        MockRestService(timeout=0.5)
+        scraped = {system_name: set(fetcher.customers) for system_name, fetcher in MockRestService.Data.items()}
+    finally:
+        released.set()
+    # The slow scrape still stores its customer, before the stores it writes to are put back.
+    deadline = time.monotonic() + 5
+    while not MockRestService.Data['SLOW'].customers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert scraped == {'MOCK_INDEMNITY': {Mock.DEFAULT_CUSTOMER}, 'BROKEN': set(), 'SLOW': set()}
+    assert set(MockRestService.Failures) == {'BROKEN', 'SLOW'}
+    assert str(MockRestService.Failures['BROKEN']) == 'The carrier is down.'
+    assert isinstance(MockRestService.Failures['SLOW'], TimeoutError)
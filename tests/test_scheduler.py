@@ -0,0 +1,93 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import scheduler
+from scheduler import RefreshScheduler
+
+INTERVAL = 100.0
+
+
+class Service:
+    """
+    Stands in for a MockRestService: every carrier refreshes on the same interval, and each refresh is recorded.
+    """
+
+    def __init__(self, scrape=None):
+        self.Unrestored = {}
+        self.Data = {}
+        self.scraped = []
+        self.scrape = scrape
+
+    @staticmethod
+    def carrier(system_name: str):
+        return SimpleNamespace(refresh_interval=INTERVAL)
+
+    def scrape_customer(self, system_name: str, customer_id: str):
+        if self.scrape is not None:
+            self.scrape()
+        self.scraped.append((system_name, customer_id))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    A clock that only moves when told to.
+    """
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(scheduler, 'time', SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def test_most_requested_customers_are_refreshed_first(clock):
+    refreshes = RefreshScheduler(Service(), max_workers=1, jitter=0)
+    for customer_id in ('a', 'b', 'c'):
+        refreshes.track('CARRIER', customer_id, refreshed=clock.value - INTERVAL)
+    for _ in range(3):
+        refreshes.hit('CARRIER', 'b')
+    refreshes.hit('CARRIER', 'c')
+    order = []
+    for _ in range(3):
+        chosen = refreshes.due(clock.value)
+        assert len(chosen) == 1
+        order.append(chosen[0].key[1])
+        refreshes.refresh(chosen[0])
+    assert order == ['b', 'c', 'a']
+    assert refreshes.service.scraped == [('CARRIER', 'b'), ('CARRIER', 'c'), ('CARRIER', 'a')]
+    # Each is due again one interval later, and its demand halved.
+    assert {entry.due for entry in refreshes.entries.values()} == {clock.value + INTERVAL}
+    assert refreshes.entries[('CARRIER', 'b')].hits == 1.5
+
+
+def test_nothing_is_refreshed_before_it_is_due(clock):
+    refreshes = RefreshScheduler(Service(), jitter=0)
+    refreshes.track('CARRIER', 'a', refreshed=clock.value)
+    assert refreshes.due(clock.value + INTERVAL - 1) == []
+    assert [entry.key for entry in refreshes.due(clock.value + INTERVAL)] == [('CARRIER', 'a')]
+
+
+def test_jitter_stays_within_its_fraction_of_the_interval(clock):
+    refreshes = RefreshScheduler(Service(), jitter=0.1)
+    dues = [refreshes.next_due(INTERVAL, clock.value) for _ in range(1000)]
+    assert all(clock.value + 0.9 * INTERVAL <= due <= clock.value + 1.1 * INTERVAL for due in dues)
+    assert len(set(dues)) > 1
+    # A customer with no known scrape time is first due anywhere within its interval.
+    for customer_id in range(100):
+        refreshes.track('CARRIER', str(customer_id))
+    assert all(clock.value <= entry.due <= clock.value + INTERVAL for entry in refreshes.entries.values())
+
+
+def test_stop_waits_for_the_refreshes_running():
+    started = threading.Event()
+    service = Service(scrape=lambda: (started.set(), time.sleep(0.2)))
+    refreshes = RefreshScheduler(service, max_workers=2, jitter=0, tick=0.01)
+    refreshes.track('CARRIER', 'a', refreshed=time.time() - INTERVAL)
+    refreshes.start()
+    thread = refreshes.thread
+    assert started.wait(5)
+    refreshes.stop()
+    assert service.scraped == [('CARRIER', 'a')]
+    assert not thread.is_alive()
+    assert refreshes.thread is None and refreshes.executor is None and not refreshes.running
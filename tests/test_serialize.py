@@ -0,0 +1,41 @@
+from datetime import date
+from decimal import Decimal
+from json import JSONEncoder
+
+from customtypes import Agent, Customer, Status
+from mock import MockPolicy
+from placeholder import PlaceholderPolicy
+from serialize import COMPACT, COMPATIBLE
+
+
+def customers() -> dict:
+    """
+    A batch answer with both policy types, Decimals, dates, statuses, a missing SSN and non-ASCII text.
+    """
+    mock_policy = MockPolicy('M-1', Decimal('1234.50'), Status.active, date(2021, 1, 4), date(2024, 12, 31),
+                             date(2023, 2, 28))
+    placeholder_policy = PlaceholderPolicy('P-1', Decimal('0.1'), Status.claim_pending, date(2020, 12, 31),
+                                           date(2021, 1, 1), date(2019, 6, 15), Decimal('12.5'), 3)
+    agent = Agent('Zoë Ångström', 'PC-1', 'Agence Générale', 'AG-★')
+    mock = Customer('Renée Müller', 'm1', 'renee@example.com', '1 Rue de l’Église', None, agent,
+                    {'M-1': mock_policy})
+    placeholder = Customer('日本 太郎', 'p1', 'taro@example.com', '"Quoted" \\ street\n', 123456789, agent,
+                           {'P-1': placeholder_policy})
+    return {'MOCK_INDEMNITY': {'m1': mock}, 'PLACEHOLDER_CARRIER': {'p1': placeholder}, 'empty': {}}
+
+
+def to_dicts(data: dict) -> dict:
+    return {carrier: {customer_id: customer.to_dict() for customer_id, customer in batch.items()}
+            for carrier, batch in data.items()}
+
+
+def test_compatible_matches_json_encoder():
+    data = customers()
+    expected = JSONEncoder(indent=4).encode(to_dicts(data))
+    assert COMPATIBLE.encode(data) == expected
+    assert ''.join(COMPATIBLE.iter_encode(data)) == expected
+
+
+def test_compact_matches_compact_json_encoder():
+    data = customers()
+    assert COMPACT.encode(data) == JSONEncoder(separators=(',', ':')).encode(to_dicts(data))
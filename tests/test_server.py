@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import fixtures
+from fetchdata import FetchData
+from mock import Mock
+from rest import MockRestService
+from scheduler import RefreshScheduler
+from server import ScrapeServer
+from snapshot import SnapshotStore
+
+
+def post(server: ScrapeServer, body: bytes) -> tuple:
+    """
+    Send one POST to a started server, and read its status and JSON answer.
+    """
+    async def send():
+        listening = await server.start()
+        port = listening.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'POST / HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode()
+                     + body)
+        await writer.drain()
+        answer = await reader.read()
+        writer.close()
+        listening.close()
+        head, _, content = answer.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(content)
+
+    return asyncio.run(send())
+
+
+def test_mismatched_customer_is_an_error(offline, monkeypatch):
+    uri = Mock.URI_TEMPLATE.format(customer_id='c1')
+    transport = fixtures.transport(policies=5, overrides={uri: fixtures.mock_page('c2', 5)})
+    monkeypatch.setattr(FetchData, 'transport', transport)
+    status, answer = post(ScrapeServer(MockRestService(eager=False), port=0),
+                          b'[{"carrier": "MOCK_INDEMNITY", "customerId": "c1"}]')
+    assert status == 200
+    assert 'MOCK_INDEMNITY' not in answer
+    assert answer['errors'] == [{'carrier': 'MOCK_INDEMNITY', 'customerId': 'c1',
+                                 'error': 'The carrier returned customer "c2" instead.'}]
+
+
+def test_unexpected_failure_is_a_500(offline, monkeypatch):
+    service = MockRestService(eager=False)
+
+    def broken(requests):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(service, 'customers', broken)
+    status, answer = post(ScrapeServer(service, port=0), b'[{"carrier": "MOCK_INDEMNITY", "customerId": "c1"}]')
+    assert status == 500
+    assert answer == {'error': 'Internal server error.'}
+
+
+def test_stored_customers_are_served_while_the_snapshot_is_restoring(offline, monkeypatch, tmp_path):
+    monkeypatch.setattr(FetchData, 'snapshots', SnapshotStore(str(tmp_path / 'snapshot.db')))
+    service = MockRestService(eager=False)
+    service.scrape_customer('MOCK_INDEMNITY', 'c1')
+    # Still waiting to be loaded, behind the background restore.
+    monkeypatch.setitem(MockRestService.Unrestored, ('MOCK_INDEMNITY', 'c2'), 0.0)
+    server = ScrapeServer(service, port=0)
+
+    async def get(port: int, customer_id: str) -> dict:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET /customers/MOCK_INDEMNITY/{customer_id} HTTP/1.1\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        answer = await reader.read()
+        writer.close()
+        return json.loads(answer.partition(b'\r\n\r\n')[2])
+
+    async def send():
+        listening = await server.start()
+        port = listening.sockets[0].getsockname()[1]
+        with MockRestService.restore_lock:
+            waiting = asyncio.ensure_future(get(port, 'c2'))
+            stored = await asyncio.wait_for(get(port, 'c1'), 5)
+            assert not waiting.done()
+        restored = await asyncio.wait_for(waiting, 5)
+        listening.close()
+        return stored, restored
+
+    stored, restored = asyncio.run(send())
+    assert stored['MOCK_INDEMNITY']['c1']['id'] == 'c1'
+    # Not in the snapshot after all, so it was scraped.
+    assert restored['MOCK_INDEMNITY']['c2']['id'] == 'c2'
+
+
+def test_each_served_request_is_one_hit(offline):
+    service = MockRestService(eager=False)
+    service.scheduler = RefreshScheduler(service)
+    server = ScrapeServer(service, port=0)
+    # Scraped for the first request, which starts tracking it, then found in the store for the second.
+    for _ in range(2):
+        assert post(server, b'[{"carrier": "MOCK_INDEMNITY", "customerId": "c1"}]')[0] == 200
+    assert service.scheduler.entries[('MOCK_INDEMNITY', 'c1')].hits == 1
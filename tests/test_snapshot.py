@@ -0,0 +1,100 @@
+import threading
+
+from fetchdata import FetchData
+from rest import MockRestService
+from snapshot import SnapshotStore
+
+CUSTOMERS = ('c1', 'c2', 'c3')
+
+
+def save(path: str) -> dict:
+    """
+    Scrape a few Mock Indemnity customers into a service that saves them to a snapshot, then close it.
+    :return: The customers scraped, by ID.
+    """
+    with MockRestService(eager=False, snapshot=path) as service:
+        customers = {customer_id: service.scrape_customer('MOCK_INDEMNITY', customer_id)
+                     for customer_id in CUSTOMERS}
+    assert FetchData.snapshots is None
+    return customers
+
+
+def restart(monkeypatch):
+    """
+    Forget every customer in memory, as a restarted service would.
+    """
+    monkeypatch.setattr(MockRestService, 'Data', {})
+    monkeypatch.setattr(MockRestService, 'Unrestored', {})
+
+
+def test_saved_customers_survive_a_reopened_store(offline, tmp_path):
+    path = str(tmp_path / 'snapshot.db')
+    writer = SnapshotStore(path)
+    customer = FetchData(MockRestService.carrier('MOCK_INDEMNITY')).fetch_my_carrier('c1').customer
+    writer.save('MOCK_INDEMNITY', customer)
+    # Another connection reads what is still in the write-ahead log.
+    reader = SnapshotStore(path)
+    assert reader.connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert set(reader.keys()) == {('MOCK_INDEMNITY', 'c1')}
+    assert reader.load('MOCK_INDEMNITY', 'c1') == customer
+    reader.close()
+    writer.close()
+    reopened = SnapshotStore(path)
+    loaded = reopened.load('MOCK_INDEMNITY', 'c1')
+    assert loaded == customer and loaded.policies == customer.policies
+    assert loaded.agent == customer.agent
+    assert reopened.load('MOCK_INDEMNITY', 'c9') is None
+    reopened.close()
+
+
+def test_lookup_restores_a_customer_before_the_others(offline, monkeypatch, tmp_path):
+    path = str(tmp_path / 'snapshot.db')
+    customers = save(path)
+    restart(monkeypatch)
+    go = threading.Event()
+    restore_all = MockRestService.restore_all
+
+    def held_back(service):
+        go.wait(5)
+        restore_all(service)
+
+    monkeypatch.setattr(MockRestService, 'restore_all', held_back)
+    downloaded = len(FetchData.transport.requests)
+    with MockRestService(snapshot=path) as service:
+        # Nothing was scraped: the snapshot is served instead.
+        assert len(FetchData.transport.requests) == downloaded
+        assert set(MockRestService.Unrestored) == {('MOCK_INDEMNITY', customer_id) for customer_id in CUSTOMERS}
+        assert service.lookup('MOCK_INDEMNITY', 'c2') == customers['c2']
+        assert set(MockRestService.Unrestored) == {('MOCK_INDEMNITY', 'c1'), ('MOCK_INDEMNITY', 'c3')}
+        go.set()
+        service.restoring.join(5)
+        assert MockRestService.Unrestored == {}
+        fetcher = MockRestService.Data['MOCK_INDEMNITY']
+        assert fetcher.customers == customers
+        # The restored customers are indexed and stored like the scraped ones.
+        assert FetchData.store.count(carrier='MOCK_INDEMNITY') == sum(len(customer.policies)
+                                                                      for customer in customers.values())
+        assert len({customer.version for customer in fetcher.customers.values()}) == len(CUSTOMERS)
+
+
+def test_rows_that_cannot_be_loaded_are_skipped(offline, monkeypatch, tmp_path):
+    path = str(tmp_path / 'snapshot.db')
+    customers = save(path)
+    store = SnapshotStore(path)
+    # A carrier that is gone, and a row that no longer decodes.
+    store.connection.execute("INSERT INTO customers VALUES ('GONE', 'x', 0, x'00')")
+    store.connection.execute("UPDATE customers SET data = x'00' WHERE customer_id = 'c3'")
+    assert len(list(store.load_all())) == len(CUSTOMERS) - 1
+    assert [customer.id for _, customer in store.load_all(['MOCK_INDEMNITY'])] == ['c1', 'c2']
+    assert list(store.load_all([])) == []
+    store.close()
+    restart(monkeypatch)
+    with MockRestService(snapshot=path) as service:
+        service.restoring.join(5)
+        assert not service.restoring.is_alive()
+        assert MockRestService.Data['MOCK_INDEMNITY'].customers == {customer_id: customers[customer_id]
+                                                                    for customer_id in ('c1', 'c2')}
+        # Left for its first lookup, which finds nothing to load, so it is scraped instead.
+        assert service.lookup('MOCK_INDEMNITY', 'c3') is None
+        assert MockRestService.Unrestored == {}
+        assert service.scrape_customer('MOCK_INDEMNITY', 'c3') == customers['c3']
@@ -0,0 +1,141 @@
+import json
+import os
+import pickle
+
+import lxml.html
+import pytest
+
+import fixtures
+import specs
+from carrier import Carrier
+from fetchdata import FetchData
+from mock import Mock
+from parsepool import ParsePool
+from placeholder import Placeholder
+from transport import LocalTransport
+
+# The specs of carriers that read the same pages as Mock Indemnity and Placeholder Insurance, and a broken one.
+SPECS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'specs')
+
+
+@pytest.fixture
+def registry(monkeypatch) -> specs.CarrierRegistry:
+    """
+    A registry of the fixture specs, along with the carriers written in Python.
+    """
+    registry = specs.CarrierRegistry([SPECS])
+    monkeypatch.setattr(specs, 'registry', registry)
+    return registry
+
+
+def read(system_name: str) -> dict:
+    with open(os.path.join(SPECS, f'{system_name}.json'), encoding='utf-8') as file:
+        return json.load(file)
+
+
+@pytest.mark.parametrize('system_name', ['MOCK_SPEC', 'PLACEHOLDER_SPEC'])
+def test_fixture_specs_are_valid(system_name):
+    assert specs.validate(read(system_name)) == []
+
+
+def test_validate_lists_every_problem():
+    problems = specs.validate(read('BAD'))
+    assert 'it is missing customer, default_customer, policies' in problems
+    assert 'it has unknown keys: extra' in problems
+    assert 'name is not a string' in problems
+    assert 'system_name is not in upper case, like "EXAMPLE_MUTUAL"' in problems
+    assert 'uri_template has no "{customer_id}"' in problems
+    assert any(problem.startswith('policy has unknown fields: Foo') for problem in problems)
+    assert any(problem.startswith('agent is missing Name') for problem in problems)
+    assert specs.validate([]) == ['it is not an object']
+
+
+@pytest.mark.parametrize('spec, message', [
+    ([], 'Invalid carrier spec: it is not an object.'),
+    ('EXAMPLE', 'Invalid carrier spec: it is not an object.'),
+    ({'system_name': 'EXAMPLE'}, 'Invalid carrier spec EXAMPLE: it is missing'),
+])
+def test_compile_spec_reports_invalid_specs(spec, message):
+    with pytest.raises(ValueError) as error:
+        specs.compile_spec(spec)
+    assert str(error.value).startswith(message)
+
+
+def test_compile_spec_builds_a_carrier():
+    carrier = specs.compile_spec(read('PLACEHOLDER_SPEC'), os.path.join(SPECS, 'PLACEHOLDER_SPEC.json'))
+    assert issubclass(carrier, specs.SpecCarrier) and Carrier.named('PLACEHOLDER_SPEC') is carrier
+    assert carrier.uri('p1') == Placeholder.uri('p1')
+    assert carrier.host_limits.rate == 1000 and carrier.policy_type.row_layout is not None
+    assert not hasattr(carrier.policy_type('P-1', *[None] * 7), '__dict__')
+
+
+def test_registry_loads_carriers_on_first_use(registry):
+    assert registry.names() == ['BAD', 'MOCK_INDEMNITY', 'MOCK_SPEC', 'PLACEHOLDER_CARRIER', 'PLACEHOLDER_SPEC']
+    assert 'MOCK_SPEC' in registry and 'NOPE' not in registry
+    assert registry.loaded == {}
+    carrier = registry.carrier('MOCK_SPEC')
+    assert list(registry.loaded) == ['MOCK_SPEC'] and registry.carrier('MOCK_SPEC') is carrier
+    assert carrier.spec_path == os.path.join(SPECS, 'MOCK_SPEC.json')
+    with pytest.raises(ValueError, match='Invalid carrier spec'):
+        registry.carrier('BAD')
+    with pytest.raises(ValueError, match='Unknown carrier: "NOPE"'):
+        registry.carrier('NOPE')
+
+
+@pytest.mark.parametrize('python, spec', [(Mock, 'MOCK_SPEC'), (Placeholder, 'PLACEHOLDER_SPEC')])
+@pytest.mark.parametrize('memo', [True, False])
+def test_spec_carriers_read_what_the_python_ones_do(offline, registry, monkeypatch, python, spec, memo):
+    if not memo:
+        monkeypatch.setattr(FetchData, 'pages', None)
+    expected = FetchData(python).fetch_my_carrier('c1').customer
+    scraped = FetchData(registry.carrier(spec)).fetch_my_carrier('c1').customer
+    assert scraped.to_dict() == expected.to_dict()
+    policy = next(iter(scraped.policies.values()))
+    # Spec policy types cannot be imported by name; they are rebuilt from their carrier.
+    assert pickle.loads(pickle.dumps(policy)) == policy
+    assert pickle.loads(pickle.dumps(scraped)).to_dict() == scraped.to_dict()
+
+
+def test_relative_next_page_is_resolved_against_the_current_page(registry):
+    carrier = registry.carrier('PLACEHOLDER_SPEC')
+    tree = lxml.html.fromstring('<table><tfoot><tr><td><a href="3">Next</a></td></tr></tfoot></table>')
+    assert carrier.change_page(tree, 'https://carrier.example/p1/policies/2') == 'https://carrier.example/p1/policies/3'
+    # Without the current page, the link is taken as relative to the default customer.
+    assert carrier.change_page(tree) == carrier.URI.rsplit('/', 1)[0] + '/3'
+
+
+@pytest.mark.parametrize('mode', ['memo', 'tree', 'pool'])
+def test_relative_links_stay_with_the_customer(offline, registry, monkeypatch, mode):
+    carrier = registry.carrier('PLACEHOLDER_SPEC')
+    if mode == 'tree':
+        monkeypatch.setattr(FetchData, 'pages', None)
+    pages = fixtures.transport(policies=5, pages=3).handler
+
+    def handler(uri, headers):
+        page = pages(uri, headers)
+        # The links to the next pages are relative to the current one.
+        return None if page is None else page.replace('href="/placeholder_carrier/p1/policies/', 'href="')
+
+    monkeypatch.setattr(FetchData, 'transport', LocalTransport(handler=handler))
+    if mode == 'pool':
+        with ParsePool([carrier], max_workers=1) as pool:
+            monkeypatch.setattr(FetchData, 'parsers', pool)
+            session = FetchData(carrier).fetch_my_carrier('p1')
+    else:
+        session = FetchData(carrier).fetch_my_carrier('p1')
+    assert session.page == 3 and len(session.policies) == 15
+    assert session.page_uri == Placeholder.uri('p1').rsplit('/', 1)[0] + '/3'
+    assert all(policy_id.startswith('p1-') for policy_id in session.customer.policies)
+
+
+def test_only_the_python_carriers_are_known_by_default():
+    assert specs.CarrierRegistry().names() == ['MOCK_INDEMNITY', 'PLACEHOLDER_CARRIER']
+
+
+def test_spec_for_another_carrier_registers_nothing(tmp_path):
+    spec = dict(read('MOCK_SPEC'), system_name='ELSEWHERE_SPEC')
+    (tmp_path / 'OTHER_SPEC.json').write_text(json.dumps(spec), encoding='utf-8')
+    registry = specs.CarrierRegistry([str(tmp_path)])
+    with pytest.raises(ValueError, match='is for "ELSEWHERE_SPEC", not "OTHER_SPEC"'):
+        registry.carrier('OTHER_SPEC')
+    assert 'ELSEWHERE_SPEC' not in Carrier.registry and registry.loaded == {}
@@ -0,0 +1,51 @@
+from datetime import date
+from decimal import Decimal
+
+from customtypes import Status
+from mock import MockPolicy
+from store import PolicyStore
+
+
+def policy(policy_id: str, premium: str = '10.00', status=Status.active) -> MockPolicy:
+    return MockPolicy(policy_id, Decimal(premium), status, date(2021, 1, 4), date(2024, 1, 4), date(2023, 1, 4))
+
+
+def test_group_by_status_puts_missing_statuses_under_none():
+    store = PolicyStore()
+    store.replace('MOCK_INDEMNITY', 'c1', [policy('a', '1.50'), policy('b', '2.25', None),
+                                           policy('c', '3.00', Status.claim_pending), policy('d', '4.00', None)])
+    assert store.group_by('status') == {
+        None: (2, Decimal('6.25')),
+        Status.active: (1, Decimal('1.50')),
+        Status.claim_pending: (1, Decimal('3.00')),
+    }
+
+
+def test_update_replaces_only_what_changed_then_compacts():
+    store = PolicyStore(capacity=2)
+    store.replace('MOCK_INDEMNITY', 'c1', [policy('a', '1.00'), policy('b', '2.00'), policy('c', '3.00')])
+    store.replace('MOCK_INDEMNITY', 'c2', [policy('x', '100.00')])
+    store.update('MOCK_INDEMNITY', 'c1', [policy('b', '20.00', Status.claim_pending), policy('d', '4.00')],
+                 removed=['c'])
+    assert len(store) == 4 and store.removed == 2
+    assert sorted(store.select(carrier='MOCK_INDEMNITY')) == [('MOCK_INDEMNITY', policy_id)
+                                                             for policy_id in ('a', 'b', 'd', 'x')]
+    assert store.total() == Decimal('125.00')
+    assert store.group_by('customer') == {('MOCK_INDEMNITY', 'c1'): (3, Decimal('25.00')),
+                                          ('MOCK_INDEMNITY', 'c2'): (1, Decimal('100.00'))}
+    assert store.count(status=Status.claim_pending) == 1
+
+    store.update('MOCK_INDEMNITY', 'c2', [], removed=['x'])
+    assert store.removed == 3 and len(store) == 3
+    # The removed rows now outnumber the others, so they are dropped.
+    store.update('MOCK_INDEMNITY', 'c1', [policy('a', '5.00')])
+    assert store.removed == 0 and store.size == len(store) == 3
+    assert sorted(store.select()) == [('MOCK_INDEMNITY', policy_id) for policy_id in ('a', 'b', 'd')]
+    assert store.group_by('customer') == {('MOCK_INDEMNITY', 'c1'): (3, Decimal('29.00'))}
+
+    # The rows of each customer are found again after the compaction.
+    store.update('MOCK_INDEMNITY', 'c1', [policy('d', '6.00')], removed=['b'])
+    assert sorted(store.select()) == [('MOCK_INDEMNITY', 'a'), ('MOCK_INDEMNITY', 'd')]
+    assert store.total() == Decimal('11.00')
+    store.remove('MOCK_INDEMNITY', 'c1')
+    assert len(store) == 0 and store.total() == Decimal('0.00')
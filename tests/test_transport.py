@@ -0,0 +1,93 @@
+import gzip
+import http.server
+import threading
+import urllib.error
+import zlib
+
+import pytest
+
+from transport import Decompressor, PooledTransport
+
+PAGE = b'<html><body>' + b'<p>policy</p>' * 5000 + b'</body></html>'
+
+
+class RedirectingHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers /a with a redirect to /b, /relative with a relative redirect to b, and /loop with a redirect to itself.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/b':
+            self.answer(200, b'target')
+        elif self.path == '/a':
+            self.answer(302, b'moved', {'Location': '/b'})
+        elif self.path == '/relative':
+            self.answer(301, b'moved', {'Location': 'b'})
+        elif self.path == '/gzip':
+            self.answer(200, gzip.compress(PAGE), {'Content-Encoding': 'gzip'})
+        elif self.path == '/loop':
+            self.answer(307, b'moved', {'Location': '/loop'})
+        else:
+            self.answer(404, b'missing')
+
+    def answer(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RedirectingHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize('path', ['/a', '/relative'])
+def test_request_follows_redirects(server, path):
+    transport = PooledTransport(retries=0)
+    response = transport.request(server + path)
+    assert (response.status, response.body) == (200, b'target')
+    assert b''.join(transport.stream(server + path)) == b'target'
+    transport.close()
+
+
+def test_redirect_loop_raises(server):
+    transport = PooledTransport(retries=0)
+    with pytest.raises(urllib.error.HTTPError) as error:
+        transport.request(server + '/loop')
+    assert error.value.code == 307
+    transport.close()
+
+
+def raw_deflate(body):
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+@pytest.mark.parametrize('encoding, body', [
+    ('gzip', gzip.compress(PAGE)),
+    ('deflate', zlib.compress(PAGE)),
+    ('deflate', raw_deflate(PAGE)),
+    (None, PAGE),
+])
+def test_decompressor_in_pieces(encoding, body):
+    decompressor = Decompressor(encoding)
+    pieces = [decompressor.decompress(body[start:start + 7]) for start in range(0, len(body), 7)]
+    assert b''.join(pieces) + decompressor.flush() == PAGE
+
+
+def test_stream_decodes_the_whole_page(server):
+    transport = PooledTransport(retries=0)
+    assert b''.join(transport.stream(server + '/gzip', chunk_size=100)) == PAGE
+    transport.close()
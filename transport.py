@@ -0,0 +1,387 @@
+"""
+The transports used to download the carrier pages.
+A transport only knows about URIs and bytes. What the pages mean is left to the carriers.
+"""
+
+import gzip
+import http.client
+import ssl
+import threading
+import time
+import urllib.error
+import zlib
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from email.message import Message
+from typing import Mapping, Optional, Callable, Union, Dict, List, Tuple, Iterator, Iterable
+from urllib.parse import urlsplit, urljoin
+
+# What came back for one request. The headers are a plain mapping with lowercase names,
+# and the body is already decoded from gzip or deflate.
+Response = namedtuple('Response', ['status', 'headers', 'body'])
+
+
+def decode_body(body: bytes, content_encoding: Optional[str]) -> bytes:
+    """
+    Undo the content encoding of a response body.
+    :param body: The raw body as it was received.
+    :param content_encoding: The value of the Content-Encoding header, if any.
+    :return: The decoded body.
+    """
+    if not content_encoding:
+        return body
+    for encoding in reversed([part.strip().lower() for part in content_encoding.split(',')]):
+        if encoding in ('gzip', 'x-gzip'):
+            body = gzip.decompress(body)
+        elif encoding == 'deflate':
+            # Some servers send a zlib stream, others a raw deflate stream.
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                body = zlib.decompress(body, -zlib.MAX_WBITS)
+        elif encoding != 'identity':
+            raise ValueError(f'Content encoding cannot be handled: "{encoding}".')
+    return body
+
+
+class Decompressor:
+    """
+    An incremental version of decode_body, for a body that arrives in pieces.
+    Each piece goes through decompress, then flush gives what is left once the last one has.
+    """
+
+    def __init__(self, content_encoding: Optional[str]):
+        """
+        :param content_encoding: The value of the Content-Encoding header, if any.
+        """
+        self.encoding = (content_encoding or 'identity').strip().lower()
+        self.inflater = None
+        if self.encoding in ('gzip', 'x-gzip'):
+            self.inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding not in ('identity', 'deflate'):
+            raise ValueError(f'Content encoding cannot be handled: "{self.encoding}".')
+
+    def decompress(self, chunk: bytes) -> bytes:
+        """
+        Take the next piece of the raw body.
+        :return: What can be decoded so far.
+        """
+        if self.encoding == 'identity':
+            return chunk
+        if self.inflater is None:
+            # Some servers send a zlib stream, others a raw deflate stream. The first piece tells.
+            self.inflater = zlib.decompressobj()
+            try:
+                return self.inflater.decompress(chunk)
+            except zlib.error:
+                self.inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self.inflater.decompress(chunk)
+
+    def flush(self) -> bytes:
+        """
+        What is left to decode once the whole body has been taken.
+        """
+        return b'' if self.inflater is None else self.inflater.flush()
+
+
+def http_error(uri: str, status: int, headers: Mapping[str, str]) -> urllib.error.HTTPError:
+    """
+    The same error urllib raises for an error status.
+    """
+    message = Message()
+    for name, value in headers.items():
+        message[name] = value
+    return urllib.error.HTTPError(uri, status, http.client.responses.get(status, ''), message, None)
+
+
+def retry_delay(attempt: int, headers: Optional[Mapping[str, str]], backoff: float, max_backoff: float) -> float:
+    """
+    How long to wait before the next try of a request.
+    A numeric Retry-After header from the server wins over the backoff.
+    :param attempt: How many times the request was tried again so far.
+    :param headers: The headers of the last response, with lowercase names, if there was one.
+    :param backoff: The wait before the first retry, in seconds. It doubles after each retry.
+    :param max_backoff: The longest wait, in seconds.
+    """
+    if headers is not None:
+        retry_after = headers.get('retry-after', '')
+        if retry_after.isdigit():
+            return min(float(retry_after), max_backoff)
+    return min(backoff * 2 ** attempt, max_backoff)
+
+
+class Transport(ABC):
+    """
+    Something that can download a page given its URI.
+    """
+
+    @abstractmethod
+    def request(self, uri: str, headers: Optional[Mapping[str, str]] = None) -> Response:
+        """
+        Make a GET request.
+        Error statuses are returned, not raised.
+        :param uri: The URI to get.
+        :param headers: Extra request headers.
+        :return: The response to the request.
+        """
+
+    def fetch(self, uri: str) -> bytes:
+        """
+        Download a page.
+        :param uri: The URI to get.
+        :return: The decoded body of the page.
+        """
+        response = self.request(uri)
+        if response.status >= 400:
+            raise http_error(uri, response.status, response.headers)
+        return response.body
+
+    def stream(self, uri: str, chunk_size: int = 65536) -> Iterator[bytes]:
+        """
+        Download a page piece by piece, as it arrives.
+        This default downloads the whole page first. Transports that can do better override it.
+        :param uri: The URI to get.
+        :param chunk_size: The most bytes in each piece.
+        :return: The decoded body of the page, in pieces.
+        """
+        body = self.fetch(uri)
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    def close(self):
+        """
+        Release whatever this transport is holding on to.
+        """
+
+
+class PooledTransport(Transport):
+    """
+    An HTTP transport that keeps its connections alive and reuses them for the following requests
+    to the same host, so each page does not pay for a new TCP and TLS handshake.
+    Transient failures are retried with an exponential backoff.
+    """
+
+    # Statuses that are worth trying again.
+    retry_statuses = frozenset([429, 500, 502, 503, 504])
+
+    # Failures that are worth trying again.
+    retry_errors = (OSError, http.client.HTTPException)
+
+    # Statuses that send the request to another URI, and how many of them are followed in a row, as urllib does.
+    redirect_statuses = frozenset([301, 302, 303, 307, 308])
+    max_redirects = 10
+
+    def __init__(self, timeout: float = 30.0, retries: int = 3, backoff: float = 0.5,
+                 max_backoff: float = 30.0, max_idle_per_host: int = 8,
+                 ssl_context: Optional[ssl.SSLContext] = None, retry_statuses: Optional[Iterable[int]] = None):
+        """
+        :param timeout: The socket timeout for each request, in seconds.
+        :param retries: How many times a request is tried again after a transient failure. Set it to 0 when
+                        something else retries the requests, such as a rate limiter that must see every try.
+        :param backoff: The wait before the first retry, in seconds. It doubles after each retry.
+        :param max_backoff: The longest wait between two tries, in seconds.
+        :param max_idle_per_host: How many idle connections are kept for each host.
+        :param ssl_context: The TLS settings for HTTPS hosts.
+        :param retry_statuses: The statuses that are tried again, if not those of the class.
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_idle_per_host = max_idle_per_host
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        if retry_statuses is not None:
+            self.retry_statuses = frozenset(retry_statuses)
+        self.pools: Dict[Tuple[str, str, Optional[int]], List[http.client.HTTPConnection]] = {}
+        self.lock = threading.Lock()
+
+    def connect(self, key: Tuple[str, str, Optional[int]],
+                fresh: bool = False) -> Tuple[http.client.HTTPConnection, bool]:
+        """
+        Take an idle connection to a host, or open a new one.
+        :param key: The scheme, host and port.
+        :param fresh: Always open a new connection.
+        :return: The connection, and whether it was reused.
+        """
+        if not fresh:
+            with self.lock:
+                pool = self.pools.get(key)
+                if pool:
+                    return pool.pop(), True
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.ssl_context), False
+        return http.client.HTTPConnection(host, port, timeout=self.timeout), False
+
+    def release(self, key: Tuple[str, str, Optional[int]], connection: http.client.HTTPConnection):
+        """
+        Give a connection back to its pool, or close it if the pool is full.
+        """
+        with self.lock:
+            pool = self.pools.setdefault(key, [])
+            if len(pool) < self.max_idle_per_host:
+                pool.append(connection)
+                return
+        connection.close()
+
+    def open(self, key: Tuple[str, str, Optional[int]], path: str, headers: Mapping[str, str],
+             fresh: bool = False) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """
+        Send a single request, on a pooled connection if there is one, and wait for the response headers.
+        A pooled connection that the server has closed in the meantime is replaced once, at no retry cost.
+        :return: The connection and its response, whose body has not been read yet.
+        """
+        connection, reused = self.connect(key, fresh)
+        try:
+            connection.request('GET', path, headers=headers)
+            return connection, connection.getresponse()
+        except self.retry_errors:
+            connection.close()
+            if not reused:
+                raise
+            return self.open(key, path, headers, fresh=True)
+
+    def finish(self, key: Tuple[str, str, Optional[int]], connection: http.client.HTTPConnection,
+               response: http.client.HTTPResponse) -> bytes:
+        """
+        Read the rest of a response, and give its connection back to the pool if it can be kept alive.
+        :return: The body of the response, still encoded.
+        """
+        try:
+            body = response.read()
+        except BaseException:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self.release(key, connection)
+        return body
+
+    def start(self, uri: str, headers: Optional[Mapping[str, str]]) \
+            -> Tuple[Tuple[str, str, Optional[int]], http.client.HTTPConnection, http.client.HTTPResponse]:
+        """
+        Send a request, following its redirects, until the response headers of the page arrive.
+        :return: The pool key, the connection and its response, whose body has not been read yet.
+        """
+        for _ in range(self.max_redirects + 1):
+            key, connection, response = self.send(uri, headers)
+            location = response.getheader('location')
+            if response.status not in self.redirect_statuses or not location:
+                return key, connection, response
+            self.finish(key, connection, response)
+            uri = urljoin(uri, location)
+        raise http_error(uri, response.status, {name.lower(): value for name, value in response.getheaders()})
+
+    def send(self, uri: str, headers: Optional[Mapping[str, str]]) \
+            -> Tuple[Tuple[str, str, Optional[int]], http.client.HTTPConnection, http.client.HTTPResponse]:
+        """
+        Send a request, and try again after a transient failure, until the response headers arrive.
+        :return: The pool key, the connection and its response, whose body has not been read yet.
+        """
+        parts = urlsplit(uri)
+        key = (parts.scheme or 'http', parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        request_headers = {'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'}
+        request_headers.update(headers or {})
+
+        attempt = 0
+        while True:
+            response_headers = None
+            try:
+                connection, response = self.open(key, path, request_headers)
+                if response.status not in self.retry_statuses or attempt >= self.retries:
+                    return key, connection, response
+                response_headers = {name.lower(): value for name, value in response.getheaders()}
+                self.finish(key, connection, response)
+            except self.retry_errors:
+                if attempt >= self.retries:
+                    raise
+            time.sleep(self.wait(attempt, response_headers))
+            attempt += 1
+
+    def request(self, uri: str, headers: Optional[Mapping[str, str]] = None) -> Response:
+        key, connection, response = self.start(uri, headers)
+        body = self.finish(key, connection, response)
+        response_headers = {name.lower(): value for name, value in response.getheaders()}
+        return Response(response.status, response_headers,
+                        decode_body(body, response_headers.get('content-encoding')))
+
+    def stream(self, uri: str, chunk_size: int = 65536) -> Iterator[bytes]:
+        key, connection, response = self.start(uri, None)
+        response_headers = {name.lower(): value for name, value in response.getheaders()}
+        if response.status >= 400:
+            self.finish(key, connection, response)
+            raise http_error(uri, response.status, response_headers)
+        decompressor = Decompressor(response_headers.get('content-encoding'))
+        complete = False
+        try:
+            while True:
+                chunk = response.read1(chunk_size)
+                if not chunk:
+                    break
+                yield decompressor.decompress(chunk)
+            yield decompressor.flush()
+            # Marks the response as done, so the connection can send the next request.
+            response.read()
+            complete = True
+        finally:
+            if complete and not response.will_close:
+                self.release(key, connection)
+            else:
+                connection.close()
+
+    def wait(self, attempt: int, headers: Optional[Mapping[str, str]]) -> float:
+        """
+        How long to wait before the next try. See retry_delay.
+        """
+        return retry_delay(attempt, headers, self.backoff, self.max_backoff)
+
+    def close(self):
+        with self.lock:
+            pools, self.pools = self.pools, {}
+        for pool in pools.values():
+            for connection in pool:
+                connection.close()
+
+
+# What a local transport can serve for a URI: a fixed body, or a function that builds the response.
+LocalPage = Union[bytes, str, Response, Callable[[str, Mapping[str, str]], Response]]
+
+
+class LocalTransport(Transport):
+    """
+    An in-process stand-in for the network, to scrape without a connection.
+    Pages are looked up by their exact URI first, then by the handler if one is given.
+    Anything else is a 404.
+    """
+
+    def __init__(self, pages: Optional[Mapping[str, LocalPage]] = None,
+                 handler: Optional[Callable[[str, Mapping[str, str]], Optional[LocalPage]]] = None):
+        """
+        :param pages: The pages to serve, by URI.
+        :param handler: Called for the URIs that are not in "pages". Returns what to serve, or None for a 404.
+        """
+        self.pages: Dict[str, LocalPage] = dict(pages or {})
+        self.handler = handler
+        self.requests: List[str] = []
+        self.lock = threading.Lock()
+
+    def request(self, uri: str, headers: Optional[Mapping[str, str]] = None) -> Response:
+        headers = headers or {}
+        with self.lock:
+            self.requests.append(uri)
+        page = self.pages.get(uri)
+        if page is None and self.handler is not None:
+            page = self.handler(uri, headers)
+        if page is None:
+            return Response(404, {}, b'')
+        if callable(page):
+            page = page(uri, headers)
+        if isinstance(page, str):
+            page = page.encode('utf-8')
+        if isinstance(page, bytes):
+            return Response(200, {'content-type': 'text/html; charset=utf-8'}, page)
+        return page
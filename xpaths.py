@@ -0,0 +1,49 @@
+"""
+The registry of compiled XPath expressions.
+The carriers and policies declare their XPaths as text. They are compiled here once, when each class
+is defined, so scraping only evaluates prebuilt expressions, and a broken XPath fails the import
+instead of the middle of a scrape.
+"""
+
+import threading
+from typing import Dict, Mapping, TypeVar
+
+import lxml.etree
+
+from customtypes import IndexedXpath
+
+Key = TypeVar('Key')
+
+# Every expression compiled so far, by its text. The same expression is only compiled once.
+registry: Dict[str, lxml.etree.XPath] = {}
+
+_lock = threading.Lock()
+
+
+def compile_xpath(expression: str, owner: str = '') -> lxml.etree.XPath:
+    """
+    Compile an XPath expression, or get it from the registry.
+    :param expression: The XPath as text.
+    :param owner: Where the expression comes from, for the error message.
+    :return: The compiled XPath, which is called with the node to search from.
+    """
+    with _lock:
+        compiled = registry.get(expression)
+        if compiled is None:
+            try:
+                compiled = lxml.etree.XPath(expression)
+            except lxml.etree.XPathSyntaxError as error:
+                raise ValueError(f'Invalid XPath in {owner or "unknown"}: "{expression}" ({error}).') from error
+            registry[expression] = compiled
+        return compiled
+
+
+def compile_map(xpaths: Mapping[Key, IndexedXpath], owner: str = '') -> Dict[Key, IndexedXpath]:
+    """
+    Compile every XPath of a field map.
+    :param xpaths: The text XPaths and their index, by field.
+    :param owner: Where the map comes from, for the error message.
+    :return: The same map, with compiled XPaths in place of the text ones.
+    """
+    return {field: IndexedXpath(compile_xpath(xpath.xpath, f'{owner}[{getattr(field, "name", field)}]'), xpath.place)
+            for field, xpath in xpaths.items()}